@@ -1,4 +1,5 @@
 """Главный файл FastAPI приложения"""
+import asyncio
 import uvicorn
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
@@ -9,6 +10,13 @@ from pathlib import Path
 
 from database import init_db
 from shared.config import settings
+from services.maintenance import maintenance_loop
+from services.order_board import backfill_phone_digits
+from services.outbox import outbox_loop
+from services.popularity import ensure_popularity, popularity_loop
+from services.recommendations import recommendations_loop
+from services.scheduled_changes import scheduled_changes_loop
+from services.stats import ensure_daily_stats
 from api.routes import (
     products_router,
     cart_router,
@@ -26,7 +34,24 @@ async def lifespan(app: FastAPI):
     """Инициализация при запуске"""
     # Инициализация базы данных
     await init_db()
+    await ensure_daily_stats()
+    await backfill_phone_digits()
+    await ensure_popularity()
+    
+    # Фоновые задачи
+    maintenance_task = asyncio.create_task(maintenance_loop())
+    outbox_task = asyncio.create_task(outbox_loop())
+    recommendations_task = asyncio.create_task(recommendations_loop())
+    popularity_task = asyncio.create_task(popularity_loop())
+    scheduled_changes_task = asyncio.create_task(scheduled_changes_loop())
+    
     yield
+    
+    maintenance_task.cancel()
+    outbox_task.cancel()
+    recommendations_task.cancel()
+    popularity_task.cancel()
+    scheduled_changes_task.cancel()
 
 
 # Создание приложения
@@ -1,17 +1,34 @@
 """API роуты для админ-панели"""
-from typing import List, Optional
-from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta, date as date_type
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete, update, func, and_
+from sqlalchemy import select, delete, update, func, and_, or_
 from sqlalchemy.orm import selectinload
 from pydantic import BaseModel
 
+from api.routes.orders import OrderSchema
 from database import get_session
 from database.models import (
-    Product, Category, ProductImage, User, Order, OrderStatus,
-    PromoCode, DeliveryInterval, Settings as DBSettings, FAQ, Message
+    Product, Category, ProductImage, User, Order, ArchivedOrder, OrderStatus, UnitType, BadgeType,
+    PromoCode, DeliveryInterval, Settings as DBSettings, FAQ, Message, CustomerStats, ScheduledProductChange
 )
+from services.analytics import get_snapshot
+from services.catalog_bulk import product_filter, build_changes, apply_bulk_changes
+from services.catalog_io import read_csv_rows, read_jsonl_rows, import_products, export_products
+from services.maintenance import run_maintenance
+from services.order_board import order_search, board_page
+from services.order_export import orders_csv, orders_xlsx
+from services.order_events import order_event_stream, publish_order_status, publish_catalog_changed
+from services.outbox import OutboxEventType, enqueue_event, wake_outbox
+from services.picklist import picklist_query, group_by_category, picklist_csv
+from services.pricing import invalidate_pricing_cache, invalidate_promo_cache
+from services.scheduled_changes import (
+    parse_value, schedule_changes, preview_changes, wake_scheduled_changes
+)
+from services.stats import record_status_change, rebuild_daily_stats, rebuild_customer_stats, sales_totals
+from services.stock import get_stock, set_stock, release_stock, reserve_stock, order_stock_lines
 from shared.config import settings
 from shared.utils import save_upload_file
 
@@ -62,6 +79,47 @@ class ProductAdminSchema(BaseModel):
     sort_order: int = 0
 
 
+class ProductFilterSchema(BaseModel):
+    product_ids: Optional[List[int]] = None
+    category_id: Optional[int] = None
+    is_active: Optional[bool] = None
+
+
+class BulkProductChangeSchema(BaseModel):
+    filter: ProductFilterSchema
+    price_percent: Optional[float] = None  # 7 - наценка 7%, -10 - снижение на 10%
+    price_delta: Optional[float] = None  # Прибавка к цене в рублях (может быть отрицательной)
+    price_units: Optional[List[str]] = None  # kg, piece, package, box, multi; по умолчанию все
+    discount_percent: Optional[float] = None
+    discount_fixed: Optional[float] = None
+    badge: Optional[str] = None
+    category_id: Optional[int] = None  # Перенести в категорию
+    sort_order: Optional[int] = None
+    reorder: bool = False  # sort_order по порядку filter.product_ids
+    dry_run: bool = False
+
+
+class ScheduledChangeCreateSchema(BaseModel):
+    product_ids: Optional[List[int]] = None
+    category_id: Optional[int] = None  # Все товары категории на момент применения
+    changes: Dict[str, Any]  # {"discount_percent": 20, "badge": "sale"}
+    effective_at: datetime  # Без часового пояса - UTC
+
+
+class ScheduledChangeSchema(BaseModel):
+    id: int
+    product_id: Optional[int] = None
+    category_id: Optional[int] = None
+    field: str
+    value: Any = None
+    effective_at: datetime
+    applied_at: Optional[datetime] = None
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+
 class PromoCodeCreateSchema(BaseModel):
     code: str
     description: Optional[str] = None
@@ -97,6 +155,21 @@ class SettingsUpdateSchema(BaseModel):
     description: Optional[str] = None
 
 
+class AdminUserSchema(BaseModel):
+    id: int
+    telegram_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    last_name: Optional[str]
+    phone: Optional[str]
+    is_blocked: bool
+    created_at: datetime
+    orders_count: int = 0
+    total_spent: float = 0
+    first_order_at: Optional[datetime] = None
+    last_order_at: Optional[datetime] = None
+
+
 # ==================== КАТЕГОРИИ ====================
 
 @router.post("/categories")
@@ -280,6 +353,279 @@ async def bulk_update_products(
     return {"message": f"Обновлено товаров: {len(product_ids)}"}
 
 
+@router.post("/products/bulk")
+async def bulk_change_products(
+    telegram_id: int,
+    operation: BulkProductChangeSchema,
+    session: AsyncSession = Depends(get_session)
+):
+    """Массово изменить цены, скидки, бейдж, категорию или порядок товаров
+    
+    Товары выбираются filter (список id, категория, активность), изменение
+    применяется одним UPDATE. dry_run=true - показать, что изменится, без записи.
+    """
+    await verify_admin(telegram_id, session)
+    
+    changes = operation.dict(exclude_unset=True)
+    product_ids = operation.filter.product_ids
+    
+    if not operation.filter.dict(exclude_none=True):
+        raise HTTPException(status_code=400, detail="Не задан фильтр товаров")
+    if operation.price_percent is not None and operation.price_delta is not None:
+        raise HTTPException(status_code=400, detail="Укажите либо price_percent, либо price_delta")
+    if operation.price_percent is not None and operation.price_percent <= -100:
+        raise HTTPException(status_code=400, detail="Снижение цены должно быть меньше 100%")
+    
+    if operation.price_units is not None:
+        units = {unit.value for unit in UnitType} | {"multi"}
+        unknown = set(operation.price_units) - units
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Неизвестные единицы: {', '.join(sorted(unknown))}")
+        changes["price_units"] = [f"price_{unit}" for unit in operation.price_units]
+    
+    if "badge" in changes and changes["badge"] is not None:
+        if changes["badge"] not in {badge.value for badge in BadgeType}:
+            raise HTTPException(status_code=400, detail="Неизвестный бейдж")
+    
+    if "category_id" in changes:
+        result = await session.execute(
+            select(Category.id).where(Category.id == changes["category_id"])
+        )
+        if result.scalar_one_or_none() is None:
+            raise HTTPException(status_code=404, detail="Категория не найдена")
+    
+    if "sort_order" in changes and changes["sort_order"] is None:
+        raise HTTPException(status_code=400, detail="sort_order не может быть пустым")
+    
+    if operation.reorder and not product_ids:
+        raise HTTPException(status_code=400, detail="Для сортировки нужен список filter.product_ids")
+    
+    values = build_changes(changes, product_ids)
+    if not values:
+        raise HTTPException(status_code=400, detail="Не задано ни одного изменения")
+    
+    result = await apply_bulk_changes(
+        session,
+        product_filter(**operation.filter.dict()),
+        values,
+        dry_run=operation.dry_run
+    )
+    
+    if operation.dry_run:
+        return result.as_dict()
+    
+    if result.non_positive_prices:
+        raise HTTPException(
+            status_code=409,
+            detail=f"У товаров ({result.non_positive_prices}) цена станет нулевой или отрицательной"
+        )
+    
+    await session.commit()
+    
+    if result.updated:
+        publish_catalog_changed({"fields": sorted(values), "products_count": result.updated})
+    
+    return result.as_dict()
+
+
+@router.post("/products/import")
+async def import_products_file(
+    telegram_id: int,
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, pattern="^(csv|jsonl)$"),
+    session: AsyncSession = Depends(get_session)
+):
+    """Загрузить товары из CSV или JSON Lines: строка с id обновляет товар, без id - создает
+    
+    Формат берется из параметра format или из расширения файла (.jsonl/.ndjson),
+    по умолчанию CSV. В ответе - отчет с ошибками по номерам строк; пачки пишутся
+    по мере чтения, и если загрузка оборвалась (complete = false), изменения
+    до строки committed_through_row уже сохранены.
+    """
+    await verify_admin(telegram_id, session)
+    
+    if format is None:
+        filename = (file.filename or "").lower()
+        format = "jsonl" if filename.endswith((".jsonl", ".ndjson")) else "csv"
+    
+    if format == "jsonl":
+        rows = read_jsonl_rows(file.file)
+    else:
+        rows = read_csv_rows(file.file, ProductAdminSchema)
+    
+    report = await import_products(session, rows, ProductAdminSchema)
+    
+    return report.as_dict()
+
+
+@router.get("/products/export")
+async def export_products_file(
+    telegram_id: int,
+    format: str = Query("csv", pattern="^(csv|jsonl)$"),
+    session: AsyncSession = Depends(get_session)
+):
+    """Выгрузить все товары в CSV или JSON Lines (формат загрузки)"""
+    await verify_admin(telegram_id, session)
+    
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_products(ProductAdminSchema, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="products.{format}"'}
+    )
+
+
+@router.post("/products/scheduled")
+async def create_scheduled_changes(
+    telegram_id: int,
+    schedule: ScheduledChangeCreateSchema,
+    session: AsyncSession = Depends(get_session)
+):
+    """Запланировать изменение цен, скидок, бейджа или наличия на момент effective_at
+    
+    Все изменения, наступившие к одному моменту, применяются вместе
+    сгруппированными UPDATE (services.scheduled_changes).
+    """
+    await verify_admin(telegram_id, session)
+    
+    if bool(schedule.product_ids) == (schedule.category_id is not None):
+        raise HTTPException(status_code=400, detail="Укажите либо product_ids, либо category_id")
+    if not schedule.changes:
+        raise HTTPException(status_code=400, detail="Не задано ни одного изменения")
+    
+    try:
+        changes = {name: parse_value(name, value) for name, value in schedule.changes.items()}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if schedule.product_ids:
+        product_ids = set(schedule.product_ids)
+        result = await session.execute(
+            select(func.count()).select_from(Product).where(Product.id.in_(product_ids))
+        )
+        if result.scalar_one() != len(product_ids):
+            raise HTTPException(status_code=404, detail="Товар не найден")
+    else:
+        result = await session.execute(
+            select(Category.id).where(Category.id == schedule.category_id)
+        )
+        if result.scalar_one_or_none() is None:
+            raise HTTPException(status_code=404, detail="Категория не найдена")
+    
+    count = schedule_changes(
+        session,
+        schedule.effective_at,
+        changes,
+        product_ids=sorted(set(schedule.product_ids)) if schedule.product_ids else None,
+        category_id=schedule.category_id
+    )
+    await session.commit()
+    wake_scheduled_changes()
+    
+    return {"message": "Изменения запланированы", "scheduled": count}
+
+
+@router.get("/products/scheduled", response_model=List[ScheduledChangeSchema])
+async def get_scheduled_changes(
+    telegram_id: int,
+    include_applied: bool = False,
+    limit: int = Query(100, ge=1, le=500),
+    session: AsyncSession = Depends(get_session)
+):
+    """Запланированные изменения по времени наступления"""
+    await verify_admin(telegram_id, session)
+    
+    query = (
+        select(ScheduledProductChange)
+        .order_by(ScheduledProductChange.effective_at, ScheduledProductChange.id)
+        .limit(limit)
+    )
+    if not include_applied:
+        query = query.where(ScheduledProductChange.applied_at.is_(None))
+    
+    result = await session.execute(query)
+    return result.scalars().all()
+
+
+@router.get("/products/scheduled/preview")
+async def preview_scheduled_changes(
+    telegram_id: int,
+    at: datetime,
+    session: AsyncSession = Depends(get_session)
+):
+    """Какими станут товары к моменту at: текущие и будущие значения полей"""
+    await verify_admin(telegram_id, session)
+    
+    return await preview_changes(session, at)
+
+
+@router.delete("/products/scheduled/{change_id}")
+async def delete_scheduled_change(
+    telegram_id: int,
+    change_id: int,
+    session: AsyncSession = Depends(get_session)
+):
+    """Отменить запланированное изменение"""
+    await verify_admin(telegram_id, session)
+    
+    result = await session.execute(
+        select(ScheduledProductChange).where(ScheduledProductChange.id == change_id)
+    )
+    change = result.scalar_one_or_none()
+    
+    if not change:
+        raise HTTPException(status_code=404, detail="Изменение не найдено")
+    if change.applied_at is not None:
+        raise HTTPException(status_code=409, detail="Изменение уже применено")
+    
+    await session.delete(change)
+    await session.commit()
+    wake_scheduled_changes()
+    
+    return {"message": "Изменение отменено"}
+
+
+@router.get("/products/{product_id}/stock")
+async def get_product_stock(
+    telegram_id: int,
+    product_id: int,
+    session: AsyncSession = Depends(get_session)
+):
+    """Остатки товара по единицам измерения"""
+    await verify_admin(telegram_id, session)
+    
+    return await get_stock(session, product_id)
+
+
+@router.put("/products/{product_id}/stock")
+async def update_product_stock(
+    telegram_id: int,
+    product_id: int,
+    stock: Dict[str, Optional[float]],
+    session: AsyncSession = Depends(get_session)
+):
+    """Задать остатки: {"kg": 12.5, "piece": null}; null - не вести остаток по единице"""
+    await verify_admin(telegram_id, session)
+    
+    units = {unit.value for unit in UnitType}
+    unknown = set(stock) - units
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Неизвестные единицы: {', '.join(sorted(unknown))}")
+    if any(quantity is not None and quantity < 0 for quantity in stock.values()):
+        raise HTTPException(status_code=400, detail="Остаток не может быть отрицательным")
+    
+    result = await session.execute(
+        select(Product.id).where(Product.id == product_id)
+    )
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(status_code=404, detail="Товар не найден")
+    
+    await set_stock(session, product_id, stock)
+    await session.commit()
+    
+    return await get_stock(session, product_id)
+
+
 @router.post("/products/{product_id}/images")
 async def upload_product_image(
     telegram_id: int,
@@ -331,26 +677,22 @@ async def get_all_orders(
     telegram_id: int,
     status: Optional[str] = None,
     search: Optional[str] = None,
+    archived: bool = False,
     limit: int = 50,
     offset: int = 0,
     session: AsyncSession = Depends(get_session)
 ):
-    """Получить все заказы"""
+    """Получить все заказы (archived=1 - из архива выполненных и отмененных)"""
     await verify_admin(telegram_id, session)
     
-    query = select(Order).order_by(Order.created_at.desc())
+    order_model = ArchivedOrder if archived else Order
+    query = select(order_model).order_by(order_model.created_at.desc())
     
     if status:
-        query = query.where(Order.status == status)
+        query = query.where(order_model.status == status)
     
     if search:
-        query = query.where(
-            or_(
-                Order.order_number.ilike(f"%{search}%"),
-                Order.customer_name.ilike(f"%{search}%"),
-                Order.customer_phone.ilike(f"%{search}%")
-            )
-        )
+        query = query.where(order_search(order_model, search))
     
     query = query.limit(limit).offset(offset)
     
@@ -360,6 +702,80 @@ async def get_all_orders(
     return orders
 
 
+@router.get("/orders/board")
+async def get_orders_board(
+    telegram_id: int,
+    status: Optional[str] = None,
+    search: Optional[str] = None,
+    archived: bool = False,
+    limit: int = Query(50, ge=1, le=200),
+    before_id: Optional[int] = None,
+    session: AsyncSession = Depends(get_session)
+):
+    """Доска заказов: заказы с позициями, счетчики по статусам, поиск по номеру/телефону/имени
+    
+    Страницы - по курсору: next_cursor передается следующим запросом как before_id.
+    """
+    await verify_admin(telegram_id, session)
+    
+    order_model = ArchivedOrder if archived else Order
+    orders, counts, next_cursor = await board_page(
+        session, order_model, status, search, limit, before_id
+    )
+    
+    return {
+        "orders": [OrderSchema.model_validate(order) for order in orders],
+        "counts": counts,
+        "total": sum(counts.values()),
+        "next_cursor": next_cursor
+    }
+
+
+@router.get("/orders/export")
+async def export_orders(
+    telegram_id: int,
+    date_from: date_type = Query(..., alias="from"),
+    date_to: date_type = Query(..., alias="to"),
+    format: str = Query("csv", pattern="^(csv|xlsx)$"),
+    session: AsyncSession = Depends(get_session)
+):
+    """Выгрузка заказов с позициями за период (даты включительно) в CSV или XLSX"""
+    await verify_admin(telegram_id, session)
+    
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="Начало периода позже конца")
+    
+    filename = f"orders_{date_from.isoformat()}_{date_to.isoformat()}.{format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    
+    if format == "xlsx":
+        return StreamingResponse(
+            orders_xlsx(date_from, date_to),
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            headers=headers
+        )
+    
+    return StreamingResponse(orders_csv(date_from, date_to), media_type="text/csv", headers=headers)
+
+
+@router.get("/orders/stream")
+async def stream_orders(
+    telegram_id: int,
+    request: Request,
+    last_event_id: Optional[str] = Header(None),
+    session: AsyncSession = Depends(get_session)
+):
+    """Живые события по всем заказам: новые заказы и смена статусов (SSE)"""
+    await verify_admin(telegram_id, session)
+    await session.close()
+    
+    return StreamingResponse(
+        order_event_stream(request, None, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.put("/orders/{order_id}/status")
 async def update_order_status(
     telegram_id: int,
@@ -378,28 +794,72 @@ async def update_order_status(
     if not order:
         raise HTTPException(status_code=404, detail="Заказ не найден")
     
+    # Отмена возвращает товар на склад, возврат из отмены - снова резервирует
+    cancelled = OrderStatus.CANCELLED.value
+    if order.status != cancelled and new_status == cancelled:
+        await release_stock(session, order.id)
+    elif order.status == cancelled and new_status != cancelled:
+        if not await reserve_stock(session, await order_stock_lines(session, order.id)):
+            await session.rollback()
+            raise HTTPException(status_code=409, detail="Недостаточно товара, чтобы восстановить заказ")
+    
+    status_changed = order.status != new_status
+    if status_changed:
+        enqueue_event(
+            session,
+            OutboxEventType.CUSTOMER_ORDER_STATUS,
+            {"order_id": order.id, "status": new_status}
+        )
+        await record_status_change(session, order, new_status)
+    
     order.status = new_status
     order.updated_at = datetime.utcnow()
     await session.commit()
     
+    if status_changed:
+        wake_outbox()
+        publish_order_status(order)
+    
     return {"message": "Статус заказа обновлен"}
 
 
 # ==================== КЛИЕНТЫ ====================
 
-@router.get("/users")
+# Сортировки списка клиентов; у клиентов без заказов итоги - NULL
+USER_SORTS = {
+    "created": User.created_at.desc(),
+    "ltv": func.coalesce(CustomerStats.total_spent, 0).desc(),
+    "orders": func.coalesce(CustomerStats.orders_count, 0).desc(),
+    "last_order": CustomerStats.last_order_at.desc().nulls_last(),
+}
+
+
+@router.get("/users", response_model=List[AdminUserSchema])
 async def get_all_users(
     telegram_id: int,
     search: Optional[str] = None,
     is_blocked: Optional[bool] = None,
+    sort: str = Query("created", pattern="^(created|ltv|orders|last_order)$"),
+    ordered_within_days: Optional[int] = Query(None, ge=1),
+    min_orders: Optional[int] = Query(None, ge=1),
+    min_spent: Optional[float] = Query(None, ge=0),
     limit: int = 50,
     offset: int = 0,
     session: AsyncSession = Depends(get_session)
 ):
-    """Получить всех клиентов"""
+    """Получить всех клиентов с итогами покупок
+    
+    Итоги берутся из customer_stats, заказы не сканируются.
+    ordered_within_days - сегмент "заказывал за последние N дней".
+    """
     await verify_admin(telegram_id, session)
     
-    query = select(User).where(User.is_admin == False).order_by(User.created_at.desc())
+    query = (
+        select(User, CustomerStats)
+        .outerjoin(CustomerStats, CustomerStats.user_id == User.id)
+        .where(User.is_admin == False)
+        .order_by(USER_SORTS[sort], User.id.desc())
+    )
     
     if search:
         query = query.where(
@@ -414,10 +874,37 @@ async def get_all_users(
     if is_blocked is not None:
         query = query.where(User.is_blocked == is_blocked)
     
+    if ordered_within_days is not None:
+        query = query.where(
+            CustomerStats.last_order_at >= datetime.utcnow() - timedelta(days=ordered_within_days)
+        )
+    if min_orders is not None:
+        query = query.where(CustomerStats.orders_count >= min_orders)
+    if min_spent is not None:
+        query = query.where(CustomerStats.total_spent >= min_spent)
+    
     query = query.limit(limit).offset(offset)
     
     result = await session.execute(query)
-    users = result.scalars().all()
+    
+    users = []
+    for user, stats in result.all():
+        item = AdminUserSchema(
+            id=user.id,
+            telegram_id=user.telegram_id,
+            username=user.username,
+            first_name=user.first_name,
+            last_name=user.last_name,
+            phone=user.phone,
+            is_blocked=user.is_blocked,
+            created_at=user.created_at
+        )
+        if stats:
+            item.orders_count = stats.orders_count
+            item.total_spent = stats.total_spent
+            item.first_order_at = stats.first_order_at
+            item.last_order_at = stats.last_order_at
+        users.append(item)
     
     return users
 
@@ -462,6 +949,7 @@ async def create_promo_code(
     promo.code = promo.code.upper()
     session.add(promo)
     await session.commit()
+    invalidate_promo_cache()
     
     return {"message": "Промокод создан", "id": promo.id}
 
@@ -598,6 +1086,7 @@ async def update_setting(
         session.add(setting)
     
     await session.commit()
+    invalidate_pricing_cache()
     
     return {"message": "Настройка обновлена"}
 
@@ -616,32 +1105,155 @@ async def get_all_settings(
     return settings_list
 
 
+# ==================== СБОРКА ЗАКАЗОВ ====================
+
+@router.get("/picklist")
+async def get_picklist(
+    telegram_id: int,
+    date: date_type,
+    interval_id: Optional[int] = None,
+    format: str = Query("json", pattern="^(json|csv)$"),
+    session: AsyncSession = Depends(get_session)
+):
+    """Лист сборки на дату и интервал доставки: суммарно по товарам (json или csv)"""
+    await verify_admin(telegram_id, session)
+    
+    if format == "csv":
+        filename = f"picklist_{date.isoformat()}" + (f"_{interval_id}" if interval_id else "") + ".csv"
+        return StreamingResponse(
+            picklist_csv(date, interval_id),
+            media_type="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+    
+    result = await session.execute(picklist_query(date, interval_id))
+    
+    return {
+        "date": date,
+        "interval_id": interval_id,
+        "categories": group_by_category(result.all())
+    }
+
+
+# ==================== ОБСЛУЖИВАНИЕ ====================
+
+@router.post("/maintenance/run")
+async def run_maintenance_now(
+    telegram_id: int,
+    session: AsyncSession = Depends(get_session)
+):
+    """Запустить обслуживание корзин вне расписания"""
+    await verify_admin(telegram_id, session)
+    
+    report = await run_maintenance()
+    
+    return report.as_dict()
+
+
 # ==================== СТАТИСТИКА ====================
 
 @router.get("/stats")
 async def get_stats(
     telegram_id: int,
-    date_from: Optional[datetime] = None,
-    date_to: Optional[datetime] = None,
+    date_from: Optional[date_type] = None,
+    date_to: Optional[date_type] = None,
     session: AsyncSession = Depends(get_session)
 ):
-    """Получить статистику"""
+    """Получить статистику за дни с date_from по date_to включительно"""
     await verify_admin(telegram_id, session)
     
-    query = select(
-        func.count(Order.id).label("total_orders"),
-        func.sum(Order.total).label("total_revenue")
-    ).where(Order.status != OrderStatus.CANCELLED.value)
-    
-    if date_from:
-        query = query.where(Order.created_at >= date_from)
-    if date_to:
-        query = query.where(Order.created_at <= date_to)
-    
-    result = await session.execute(query)
-    stats = result.one()
+    # Сводка по дням: стоимость не зависит от объема истории заказов
+    total_orders, total_revenue = await sales_totals(session, date_from, date_to)
     
     return {
-        "total_orders": stats.total_orders or 0,
-        "total_revenue": float(stats.total_revenue or 0)
+        "total_orders": total_orders,
+        "total_revenue": total_revenue
     }
+
+
+@router.post("/stats/rebuild")
+async def rebuild_stats(
+    telegram_id: int,
+    session: AsyncSession = Depends(get_session)
+):
+    """Пересчитать сводку заказов по дням и итоги покупателей с нуля"""
+    await verify_admin(telegram_id, session)
+    
+    rows = await rebuild_daily_stats(session)
+    customers = await rebuild_customer_stats(session)
+    
+    return {"message": "Статистика пересчитана", "rows": rows, "customers": customers}
+
+
+# ==================== АНАЛИТИКА ====================
+
+@router.get("/analytics/products")
+async def analytics_top_products(
+    telegram_id: int,
+    limit: int = Query(20, ge=1, le=200),
+    by: str = Query("revenue", pattern="^(revenue|quantity)$"),
+    date_from: Optional[date_type] = None,
+    date_to: Optional[date_type] = None,
+    session: AsyncSession = Depends(get_session)
+):
+    """Топ товаров по выручке или количеству (по единицам измерения)"""
+    await verify_admin(telegram_id, session)
+    
+    snapshot = await get_snapshot(session)
+    return snapshot.top_products(limit, by, date_from, date_to)
+
+
+@router.get("/analytics/categories")
+async def analytics_categories(
+    telegram_id: int,
+    date_from: Optional[date_type] = None,
+    date_to: Optional[date_type] = None,
+    session: AsyncSession = Depends(get_session)
+):
+    """Выручка по категориям"""
+    await verify_admin(telegram_id, session)
+    
+    snapshot = await get_snapshot(session)
+    return snapshot.category_revenue(date_from, date_to)
+
+
+@router.get("/analytics/weekdays")
+async def analytics_weekdays(
+    telegram_id: int,
+    date_from: Optional[date_type] = None,
+    date_to: Optional[date_type] = None,
+    session: AsyncSession = Depends(get_session)
+):
+    """Выручка и заказы по дням недели"""
+    await verify_admin(telegram_id, session)
+    
+    snapshot = await get_snapshot(session)
+    return snapshot.by_weekday(date_from, date_to)
+
+
+@router.get("/analytics/hours")
+async def analytics_hours(
+    telegram_id: int,
+    date_from: Optional[date_type] = None,
+    date_to: Optional[date_type] = None,
+    session: AsyncSession = Depends(get_session)
+):
+    """Выручка и заказы по часам"""
+    await verify_admin(telegram_id, session)
+    
+    snapshot = await get_snapshot(session)
+    return snapshot.by_hour(date_from, date_to)
+
+
+@router.get("/analytics/basket")
+async def analytics_basket(
+    telegram_id: int,
+    date_from: Optional[date_type] = None,
+    date_to: Optional[date_type] = None,
+    session: AsyncSession = Depends(get_session)
+):
+    """Средний чек, позиций в заказе и доля повторных покупателей"""
+    await verify_admin(telegram_id, session)
+    
+    snapshot = await get_snapshot(session)
+    return snapshot.basket_metrics(date_from, date_to)
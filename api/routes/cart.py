@@ -1,12 +1,19 @@
 """API роуты для корзины и избранного"""
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional, Union
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
+from sqlalchemy import select, delete, literal, and_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import selectinload
 from pydantic import BaseModel
 
 from database import get_session
-from database.models import CartItem, Favorite, Product, User
+from database.models import CartItem, CartVersion, Favorite, Product, User
+from api.routes.products import ProductSchema
+from services.carts import cart_etag, bump_cart_version, build_cart
+from services.idempotency import request_scope, get_saved_response, save_response
+from services.popularity import counter as popularity_counter
+from services.recommendations import index as recommendation_index, recommended_products, CANDIDATES_FACTOR
 
 router = APIRouter(prefix="/api", tags=["cart"])
 
@@ -37,6 +44,12 @@ class CartItemUpdateSchema(BaseModel):
     quantity: float
 
 
+class CartMutationSchema(BaseModel):
+    message: str
+    version: int
+    items: List[CartItemSchema] = []
+
+
 class FavoriteSchema(BaseModel):
     id: int
     product_id: int
@@ -45,70 +58,99 @@ class FavoriteSchema(BaseModel):
         from_attributes = True
 
 
+class FavoritesSyncSchema(BaseModel):
+    product_ids: List[int]
+
+
 # ==================== КОРЗИНА ====================
 
+async def finish_cart_mutation(
+    session: AsyncSession,
+    request: Request,
+    response: Response,
+    user_id: int,
+    message: str,
+    idempotency_key: Optional[str]
+):
+    """Завершить изменение корзины
+    
+    Увеличивает версию, собирает новую корзину для ответа, сохраняет ответ
+    по ключу идемпотентности и фиксирует всё одной транзакцией.
+    """
+    version = await bump_cart_version(session, user_id)
+    body = {
+        "message": message,
+        "version": version,
+        "items": await build_cart(session, user_id)
+    }
+    
+    if idempotency_key:
+        scope = request_scope(request)
+        if not await save_response(session, idempotency_key, scope, body):
+            # Тот же запрос уже выполнен параллельно
+            await session.rollback()
+            return await get_saved_response(session, idempotency_key, scope)
+    
+    await session.commit()
+    
+    response.headers["ETag"] = cart_etag(version)
+    return body
+
+
+async def replay_cart_mutation(session: AsyncSession, request: Request, idempotency_key: Optional[str]):
+    """Сохраненный ответ на повторный запрос или None"""
+    if not idempotency_key:
+        return None
+    return await get_saved_response(session, idempotency_key, request_scope(request))
+
+
 @router.get("/cart/{telegram_id}", response_model=List[CartItemSchema])
 async def get_cart(
     telegram_id: int,
+    request: Request,
+    response: Response,
     session: AsyncSession = Depends(get_session)
 ):
-    """Получить корзину пользователя"""
-    # Получаем пользователя
+    """Получить корзину пользователя
+    
+    Поддерживает If-None-Match: если версия корзины не изменилась,
+    возвращается 304 без сборки корзины.
+    """
+    # Пользователь и версия корзины одним запросом
     result = await session.execute(
-        select(User).where(User.telegram_id == telegram_id)
+        select(User.id, CartVersion.version)
+        .outerjoin(CartVersion, CartVersion.user_id == User.id)
+        .where(User.telegram_id == telegram_id)
     )
-    user = result.scalar_one_or_none()
+    row = result.one_or_none()
     
-    if not user:
+    if not row:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     
-    # Получаем товары в корзине
-    result = await session.execute(
-        select(CartItem).where(CartItem.user_id == user.id)
-    )
-    cart_items = result.scalars().all()
-    
-    # Формируем ответ
-    items = []
-    for item in cart_items:
-        # Получаем информацию о товаре
-        product_result = await session.execute(
-            select(Product).where(Product.id == item.product_id)
-        )
-        product = product_result.scalar_one_or_none()
-        
-        if product:
-            # Получаем главное изображение
-            main_image = None
-            if product.images:
-                for img in product.images:
-                    if img.is_main:
-                        main_image = img.image_url
-                        break
-                if not main_image and product.images:
-                    main_image = product.images[0].image_url
-            
-            items.append({
-                "id": item.id,
-                "product_id": item.product_id,
-                "product_name": product.name,
-                "quantity": item.quantity,
-                "unit": item.unit,
-                "price_per_unit": item.price_per_unit,
-                "total": item.quantity * item.price_per_unit,
-                "product_image": main_image
-            })
-    
-    return items
-
-
-@router.post("/cart/{telegram_id}")
+    user_id, version = row
+    etag = cart_etag(version or 0)
+    
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    response.headers["ETag"] = etag
+    return await build_cart(session, user_id)
+
+
+@router.post("/cart/{telegram_id}", response_model=CartMutationSchema)
 async def add_to_cart(
     telegram_id: int,
     item_data: CartItemCreateSchema,
+    request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
     session: AsyncSession = Depends(get_session)
 ):
     """Добавить товар в корзину"""
+    replay = await replay_cart_mutation(session, request, idempotency_key)
+    if replay:
+        return replay
+    
     # Получаем пользователя
     result = await session.execute(
         select(User).where(User.telegram_id == telegram_id)
@@ -140,45 +182,45 @@ async def add_to_cart(
     if price_per_unit is None:
         raise HTTPException(status_code=400, detail="Недопустимая единица измерения")
     
-    # Проверяем, есть ли уже такой товар в корзине
-    result = await session.execute(
-        select(CartItem).where(
-            and_(
-                CartItem.user_id == user.id,
-                CartItem.product_id == item_data.product_id,
-                CartItem.unit == item_data.unit
-            )
-        )
+    # Одним запросом: параллельное добавление того же товара не упрется в уникальный ключ.
+    # Уже лежащая в корзине позиция получает текущую цену - как при повторе заказа
+    insert_stmt = sqlite_insert(CartItem).values(
+        user_id=user.id,
+        product_id=item_data.product_id,
+        quantity=item_data.quantity,
+        unit=item_data.unit,
+        price_per_unit=price_per_unit
     )
-    existing_item = result.scalar_one_or_none()
-    
-    if existing_item:
-        # Обновляем количество
-        existing_item.quantity += item_data.quantity
-    else:
-        # Создаем новый элемент корзины
-        cart_item = CartItem(
-            user_id=user.id,
-            product_id=item_data.product_id,
-            quantity=item_data.quantity,
-            unit=item_data.unit,
-            price_per_unit=price_per_unit
+    await session.execute(
+        insert_stmt.on_conflict_do_update(
+            index_elements=["user_id", "product_id", "unit"],
+            set_={
+                "quantity": CartItem.quantity + insert_stmt.excluded.quantity,
+                "price_per_unit": insert_stmt.excluded.price_per_unit
+            }
         )
-        session.add(cart_item)
-    
-    await session.commit()
+    )
     
-    return {"message": "Товар добавлен в корзину"}
+    body = await finish_cart_mutation(session, request, response, user.id, "Товар добавлен в корзину", idempotency_key)
+    popularity_counter.record_cart_add(item_data.product_id)
+    return body
 
 
-@router.put("/cart/{telegram_id}/{cart_item_id}")
+@router.put("/cart/{telegram_id}/{cart_item_id}", response_model=CartMutationSchema)
 async def update_cart_item(
     telegram_id: int,
     cart_item_id: int,
     update_data: CartItemUpdateSchema,
+    request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
     session: AsyncSession = Depends(get_session)
 ):
     """Обновить количество товара в корзине"""
+    replay = await replay_cart_mutation(session, request, idempotency_key)
+    if replay:
+        return replay
+    
     # Получаем пользователя
     result = await session.execute(
         select(User).where(User.telegram_id == telegram_id)
@@ -207,18 +249,23 @@ async def update_cart_item(
     else:
         cart_item.quantity = update_data.quantity
     
-    await session.commit()
-    
-    return {"message": "Корзина обновлена"}
+    return await finish_cart_mutation(session, request, response, user.id, "Корзина обновлена", idempotency_key)
 
 
-@router.delete("/cart/{telegram_id}/{cart_item_id}")
+@router.delete("/cart/{telegram_id}/{cart_item_id}", response_model=CartMutationSchema)
 async def remove_from_cart(
     telegram_id: int,
     cart_item_id: int,
+    request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
     session: AsyncSession = Depends(get_session)
 ):
     """Удалить товар из корзины"""
+    replay = await replay_cart_mutation(session, request, idempotency_key)
+    if replay:
+        return replay
+    
     # Получаем пользователя
     result = await session.execute(
         select(User).where(User.telegram_id == telegram_id)
@@ -243,17 +290,22 @@ async def remove_from_cart(
         raise HTTPException(status_code=404, detail="Элемент корзины не найден")
     
     await session.delete(cart_item)
-    await session.commit()
-    
-    return {"message": "Товар удален из корзины"}
+    return await finish_cart_mutation(session, request, response, user.id, "Товар удален из корзины", idempotency_key)
 
 
-@router.delete("/cart/{telegram_id}")
+@router.delete("/cart/{telegram_id}", response_model=CartMutationSchema)
 async def clear_cart(
     telegram_id: int,
+    request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
     session: AsyncSession = Depends(get_session)
 ):
     """Очистить корзину"""
+    replay = await replay_cart_mutation(session, request, idempotency_key)
+    if replay:
+        return replay
+    
     # Получаем пользователя
     result = await session.execute(
         select(User).where(User.telegram_id == telegram_id)
@@ -264,27 +316,47 @@ async def clear_cart(
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     
     # Удаляем все элементы корзины
+    await session.execute(
+        delete(CartItem).where(CartItem.user_id == user.id)
+    )
+    return await finish_cart_mutation(session, request, response, user.id, "Корзина очищена", idempotency_key)
+
+
+@router.get("/cart/{telegram_id}/suggestions", response_model=List[ProductSchema])
+async def get_cart_suggestions(
+    telegram_id: int,
+    limit: int = Query(8, ge=1, le=50),
+    session: AsyncSession = Depends(get_session)
+):
+    """Что часто берут вместе с товарами корзины"""
+    # Пользователь и товары корзины одним запросом
     result = await session.execute(
-        select(CartItem).where(CartItem.user_id == user.id)
+        select(User.id, CartItem.product_id)
+        .outerjoin(CartItem, CartItem.user_id == User.id)
+        .where(User.telegram_id == telegram_id)
     )
-    cart_items = result.scalars().all()
-    
-    for item in cart_items:
-        await session.delete(item)
+    rows = result.all()
     
-    await session.commit()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
     
-    return {"message": "Корзина очищена"}
+    product_ids = [product_id for _, product_id in rows if product_id is not None]
+    ranked = recommendation_index.suggestions(product_ids, limit * CANDIDATES_FACTOR)
+    return await recommended_products(session, ranked, limit)
 
 
 # ==================== ИЗБРАННОЕ ====================
 
-@router.get("/favorites/{telegram_id}", response_model=List[int])
+@router.get("/favorites/{telegram_id}", response_model=Union[List[ProductSchema], List[int]])
 async def get_favorites(
     telegram_id: int,
+    hydrate: bool = False,
     session: AsyncSession = Depends(get_session)
 ):
-    """Получить избранные товары пользователя"""
+    """Получить избранные товары пользователя
+    
+    С hydrate=1 возвращает полные карточки товаров вместо списка ID.
+    """
     # Получаем пользователя
     result = await session.execute(
         select(User).where(User.telegram_id == telegram_id)
@@ -294,6 +366,18 @@ async def get_favorites(
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     
+    if hydrate:
+        # Карточки товаров одним запросом через JOIN
+        result = await session.execute(
+            select(Product)
+            .join(Favorite, Favorite.product_id == Product.id)
+            .options(selectinload(Product.images))
+            .where(Favorite.user_id == user.id)
+            .where(Product.is_active == True)
+            .order_by(Favorite.created_at.desc())
+        )
+        return [ProductSchema.model_validate(p) for p in result.scalars().all()]
+    
     # Получаем избранные товары
     result = await session.execute(
         select(Favorite.product_id).where(Favorite.user_id == user.id)
@@ -303,13 +387,13 @@ async def get_favorites(
     return list(favorite_ids)
 
 
-@router.post("/favorites/{telegram_id}/{product_id}")
-async def add_to_favorites(
+@router.put("/favorites/{telegram_id}", response_model=List[int])
+async def sync_favorites(
     telegram_id: int,
-    product_id: int,
+    sync_data: FavoritesSyncSchema,
     session: AsyncSession = Depends(get_session)
 ):
-    """Добавить товар в избранное"""
+    """Синхронизировать избранное с переданным набором товаров"""
     # Получаем пользователя
     result = await session.execute(
         select(User).where(User.telegram_id == telegram_id)
@@ -319,25 +403,64 @@ async def add_to_favorites(
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     
-    # Проверяем, не добавлен ли уже товар в избранное
-    result = await session.execute(
-        select(Favorite).where(
+    product_ids = set(sync_data.product_ids)
+    
+    # Удаляем всё, чего нет в новом наборе
+    await session.execute(
+        delete(Favorite).where(
             and_(
                 Favorite.user_id == user.id,
-                Favorite.product_id == product_id
+                Favorite.product_id.not_in(product_ids)
             )
         )
     )
-    existing = result.scalar_one_or_none()
     
-    if existing:
-        return {"message": "Товар уже в избранном"}
+    # Добавляем недостающие, существующие пары пропускает уникальный индекс
+    if product_ids:
+        await session.execute(
+            sqlite_insert(Favorite)
+            .from_select(
+                ["user_id", "product_id"],
+                select(literal(user.id), Product.id).where(Product.id.in_(product_ids))
+            )
+            .on_conflict_do_nothing(index_elements=["user_id", "product_id"])
+        )
+    
+    await session.commit()
+    
+    result = await session.execute(
+        select(Favorite.product_id).where(Favorite.user_id == user.id)
+    )
+    return list(result.scalars().all())
+
+
+@router.post("/favorites/{telegram_id}/{product_id}")
+async def add_to_favorites(
+    telegram_id: int,
+    product_id: int,
+    session: AsyncSession = Depends(get_session)
+):
+    """Добавить товар в избранное"""
+    # Получаем пользователя
+    result = await session.execute(
+        select(User).where(User.telegram_id == telegram_id)
+    )
+    user = result.scalar_one_or_none()
+    
+    if not user:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
     
-    # Добавляем в избранное
-    favorite = Favorite(user_id=user.id, product_id=product_id)
-    session.add(favorite)
+    # Повторное добавление гасится уникальным индексом (user_id, product_id)
+    result = await session.execute(
+        sqlite_insert(Favorite)
+        .values(user_id=user.id, product_id=product_id)
+        .on_conflict_do_nothing(index_elements=["user_id", "product_id"])
+    )
     await session.commit()
     
+    if result.rowcount == 0:
+        return {"message": "Товар уже в избранном"}
+    
     return {"message": "Товар добавлен в избранное"}
 
 
@@ -358,18 +481,14 @@ async def remove_from_favorites(
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     
     # Удаляем из избранного
-    result = await session.execute(
-        select(Favorite).where(
+    await session.execute(
+        delete(Favorite).where(
             and_(
                 Favorite.user_id == user.id,
                 Favorite.product_id == product_id
             )
         )
     )
-    favorite = result.scalar_one_or_none()
-    
-    if favorite:
-        await session.delete(favorite)
-        await session.commit()
+    await session.commit()
     
     return {"message": "Товар удален из избранного"}
@@ -1,17 +1,30 @@
 """API роуты для заказов"""
-from typing import List, Optional
+from typing import List, Optional, Union
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
+from sqlalchemy import select, insert, update, delete, literal, and_, func
+from sqlalchemy.orm import selectinload
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from pydantic import BaseModel
 
 from database import get_session
 from database.models import (
-    Order, OrderItem, User, Product, CartItem, PromoCode,
-    DeliveryInterval, Settings as DBSettings
+    Order, OrderItem, ArchivedOrder, ArchivedOrderItem, User, Product, ProductStock,
+    CartItem, PromoRedemption, DeliveryInterval
 )
-from shared.utils import check_min_order_amount, check_free_delivery, is_time_in_interval
+from services.carts import bump_cart_version, build_cart, unit_price
+from services.idempotency import request_scope, get_saved_response, save_response
+from services.order_numbers import allocate_order_number
+from services.order_events import order_event_stream, publish_order_created
+from services.outbox import OutboxEventType, enqueue_event, wake_outbox
+from services.popularity import counter as popularity_counter
+from services.pricing import calculate_quote, invalidate_promo_cache, redeem_promo
+from services.recommendations import wake_recommendations
+from services.stats import record_order_created
+from services.stock import reserve_stock
+from shared.utils import is_time_in_interval, normalize_phone
 
 router = APIRouter(prefix="/api/orders", tags=["orders"])
 
@@ -25,6 +38,9 @@ class OrderItemSchema(BaseModel):
     unit: str
     price_per_unit: float
     subtotal: float
+    
+    class Config:
+        from_attributes = True
 
 
 class OrderCreateSchema(BaseModel):
@@ -40,6 +56,23 @@ class OrderCreateSchema(BaseModel):
     comment: Optional[str] = None
 
 
+class QuoteRequestSchema(BaseModel):
+    delivery_type: str = "delivery"  # delivery, pickup
+    promo_code: Optional[str] = None
+
+
+class QuoteSchema(BaseModel):
+    subtotal: float
+    delivery_cost: float
+    discount_amount: float
+    total: float
+    min_order_amount: float
+    free_delivery_from: float
+    promo_applied: bool
+    is_valid: bool
+    errors: List[str] = []
+
+
 class OrderSchema(BaseModel):
     id: int
     order_number: str
@@ -57,21 +90,79 @@ class OrderSchema(BaseModel):
     status: str
     comment: Optional[str] = None
     created_at: datetime
+    archived: bool = False
     items: List[OrderItemSchema] = []
     
     class Config:
         from_attributes = True
 
 
+class OrderSummarySchema(BaseModel):
+    """Шапка заказа для списков: без позиций, только их количество"""
+    id: int
+    order_number: str
+    delivery_type: str
+    delivery_date: Optional[datetime] = None
+    total: float
+    status: str
+    created_at: datetime
+    archived: bool = False
+    items_count: int = 0
+    
+    class Config:
+        from_attributes = True
+
+
 # ==================== ЗАКАЗЫ ====================
 
-@router.post("/create/{telegram_id}")
-async def create_order(
+async def fetch_order_page(
+    session: AsyncSession,
+    order_model,
+    item_model,
     telegram_id: int,
-    order_data: OrderCreateSchema,
+    limit: int,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    summary: bool = False
+) -> list:
+    """Страница истории из рабочей (Order) или архивной (ArchivedOrder) таблицы
+    
+    Возвращает пары (заказ, количество позиций); количество считается
+    только при summary, иначе позиции подгружаются selectinload.
+    """
+    query = (
+        select(order_model)
+        .join(User, User.id == order_model.user_id)
+        .where(User.telegram_id == telegram_id)
+        .order_by(order_model.id.desc())
+        .limit(limit + 1)
+    )
+    if before_id is not None:
+        query = query.where(order_model.id < before_id)
+    if after_id is not None:
+        query = query.where(order_model.id > after_id)
+    
+    if summary:
+        items_count = (
+            select(func.count(item_model.id))
+            .where(item_model.order_id == order_model.id)
+            .correlate(order_model)
+            .scalar_subquery()
+        )
+        result = await session.execute(query.add_columns(items_count.label("items_count")))
+        return [tuple(row) for row in result.all()]
+    
+    result = await session.execute(query.options(selectinload(order_model.items)))
+    return [(order, None) for order in result.scalars().all()]
+
+
+@router.post("/quote/{telegram_id}", response_model=QuoteSchema)
+async def quote_order(
+    telegram_id: int,
+    quote_data: QuoteRequestSchema,
     session: AsyncSession = Depends(get_session)
 ):
-    """Создать заказ из корзины"""
+    """Предварительный расчет заказа по текущей корзине"""
     # Получаем пользователя
     result = await session.execute(
         select(User).where(User.telegram_id == telegram_id)
@@ -81,90 +172,127 @@ async def create_order(
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     
-    # Получаем товары из корзины
+    # Только количество и цена - объекты корзины не нужны
     result = await session.execute(
-        select(CartItem).where(CartItem.user_id == user.id)
+        select(CartItem.quantity, CartItem.price_per_unit).where(CartItem.user_id == user.id)
     )
-    cart_items = result.scalars().all()
     
-    if not cart_items:
-        raise HTTPException(status_code=400, detail="Корзина пуста")
+    quote = await calculate_quote(
+        session,
+        result.all(),
+        quote_data.delivery_type,
+        quote_data.promo_code
+    )
+    
+    return {
+        "subtotal": quote.subtotal,
+        "delivery_cost": quote.delivery_cost,
+        "discount_amount": quote.discount_amount,
+        "total": quote.total,
+        "min_order_amount": quote.min_order_amount,
+        "free_delivery_from": quote.free_delivery_from,
+        "promo_applied": quote.promo_code_id is not None,
+        "is_valid": quote.is_valid,
+        "errors": quote.errors
+    }
+
+
+@router.post("/create/{telegram_id}")
+async def create_order(
+    telegram_id: int,
+    order_data: OrderCreateSchema,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None),
+    session: AsyncSession = Depends(get_session)
+):
+    """Создать заказ из корзины
     
-    # Рассчитываем сумму
-    subtotal = sum(item.quantity * item.price_per_unit for item in cart_items)
+    Сначала выполняются все проверки (только чтение), затем заказ
+    записывается фиксированным числом запросов в одной короткой
+    транзакции - независимо от количества позиций в корзине.
+    Повтор с тем же Idempotency-Key возвращает уже созданный заказ.
+    """
+    if idempotency_key:
+        replay = await get_saved_response(session, idempotency_key, request_scope(request))
+        if replay:
+            return replay
     
-    # Получаем настройки
-    min_order_result = await session.execute(
-        select(DBSettings).where(DBSettings.key == "min_order_amount")
+    # Получаем пользователя
+    result = await session.execute(
+        select(User).where(User.telegram_id == telegram_id)
     )
-    min_order_setting = min_order_result.scalar_one_or_none()
-    min_order_amount = float(min_order_setting.value) if min_order_setting else 0
+    user = result.scalar_one_or_none()
     
-    # Проверяем минимальную сумму заказа
-    if not check_min_order_amount(subtotal, min_order_amount):
-        raise HTTPException(
-            status_code=400,
-            detail=f"Минимальная сумма заказа: {min_order_amount} ₽"
+    if not user:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+    
+    # Корзина вместе с товарами, текущими ценами и остатками - одним запросом
+    current_price = unit_price(CartItem.unit)
+    result = await session.execute(
+        select(
+            CartItem, Product.name, Product.is_active, Product.is_available,
+            current_price, ProductStock.quantity
+        )
+        .outerjoin(Product, Product.id == CartItem.product_id)
+        .outerjoin(
+            ProductStock,
+            and_(
+                ProductStock.product_id == CartItem.product_id,
+                ProductStock.unit == CartItem.unit
+            )
         )
+        .where(CartItem.user_id == user.id)
+        .order_by(CartItem.id)
+    )
+    cart_rows = result.all()
     
-    # Проверяем промокод
-    discount_amount = 0
-    promo_code_id = None
+    if not cart_rows:
+        raise HTTPException(status_code=400, detail="Корзина пуста")
     
-    if order_data.promo_code:
-        result = await session.execute(
-            select(PromoCode).where(
-                and_(
-                    PromoCode.code == order_data.promo_code.upper(),
-                    PromoCode.is_active == True
-                )
+    # Проверяем доступность товаров, остатки и актуальность цен
+    changed_prices = {}
+    stock_lines = []
+    for cart_item, product_name, is_active, is_available, price, stock in cart_rows:
+        if product_name is None or not is_active or not is_available or price is None:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Товар «{product_name or cart_item.product_id}» сейчас недоступен"
             )
-        )
-        promo = result.scalar_one_or_none()
-        
-        if promo:
-            # Проверяем срок действия
-            now = datetime.utcnow()
-            if promo.valid_from and promo.valid_from > now:
-                raise HTTPException(status_code=400, detail="Промокод еще не действует")
-            if promo.valid_until and promo.valid_until < now:
-                raise HTTPException(status_code=400, detail="Срок действия промокода истек")
-            
-            # Проверяем минимальную сумму
-            if promo.min_order_amount and subtotal < promo.min_order_amount:
+        if stock is not None:
+            if stock < cart_item.quantity:
                 raise HTTPException(
-                    status_code=400,
-                    detail=f"Минимальная сумма для промокода: {promo.min_order_amount} ₽"
+                    status_code=409,
+                    detail=f"Товара «{product_name}» осталось {stock:g}. Уменьшите количество в корзине"
                 )
-            
-            # Проверяем количество использований
-            if promo.max_uses and promo.current_uses >= promo.max_uses:
-                raise HTTPException(status_code=400, detail="Промокод исчерпан")
-            
-            # Рассчитываем скидку
-            if promo.discount_percent:
-                discount_amount = subtotal * (promo.discount_percent / 100)
-            elif promo.discount_fixed:
-                discount_amount = min(promo.discount_fixed, subtotal)
-            
-            promo_code_id = promo.id
-            promo.current_uses += 1
-    
-    # Рассчитываем стоимость доставки
-    delivery_cost = 0
-    if order_data.delivery_type == "delivery":
-        free_delivery_result = await session.execute(
-            select(DBSettings).where(DBSettings.key == "free_delivery_from")
+            stock_lines.append((cart_item.product_id, cart_item.unit, cart_item.quantity))
+        if price != cart_item.price_per_unit:
+            changed_prices[cart_item.id] = price
+    
+    if changed_prices:
+        # Обновляем цены в корзине и просим клиента подтвердить новую сумму
+        await session.execute(
+            update(CartItem),
+            [{"id": item_id, "price_per_unit": price} for item_id, price in changed_prices.items()]
         )
-        free_delivery_setting = free_delivery_result.scalar_one_or_none()
-        free_delivery_from = float(free_delivery_setting.value) if free_delivery_setting else 0
-        
-        if not check_free_delivery(subtotal, free_delivery_from):
-            delivery_cost_result = await session.execute(
-                select(DBSettings).where(DBSettings.key == "delivery_cost")
-            )
-            delivery_cost_setting = delivery_cost_result.scalar_one_or_none()
-            delivery_cost = float(delivery_cost_setting.value) if delivery_cost_setting else 0
+        await bump_cart_version(session, user.id)
+        await session.commit()
+        raise HTTPException(
+            status_code=409,
+            detail="Цены на некоторые товары изменились. Проверьте корзину и подтвердите заказ"
+        )
+    
+    # Рассчитываем сумму, скидку и доставку
+    quote = await calculate_quote(
+        session,
+        [(cart_item.quantity, cart_item.price_per_unit) for cart_item, *_ in cart_rows],
+        order_data.delivery_type,
+        order_data.promo_code
+    )
+    
+    if not quote.is_valid:
+        raise HTTPException(status_code=400, detail=quote.errors[0])
+    
+    promo_code_id = quote.promo_code_id
     
     # Проверяем интервал доставки
     if order_data.delivery_interval_id:
@@ -184,13 +312,24 @@ async def create_order(
                 detail=f"Этот интервал можно выбрать только с {interval.available_from} до {interval.available_to}"
             )
     
-    # Итоговая сумма
-    total = subtotal + delivery_cost - discount_amount
+    # ---- Запись: с этого места держим блокировку на запись ----
+    
+    # Списываем использование промокода (атомарно, без чтения счетчика)
+    if promo_code_id and not await redeem_promo(session, promo_code_id):
+        await session.rollback()
+        invalidate_promo_cache()
+        raise HTTPException(status_code=400, detail="Промокод исчерпан")
+    
+    # Резервируем остатки одним пакетным условным UPDATE
+    if not await reserve_stock(session, stock_lines):
+        await session.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail="Некоторые товары закончились. Обновите корзину"
+        )
     
     # Генерируем номер заказа
-    order_count_result = await session.execute(select(Order))
-    order_count = len(order_count_result.scalars().all())
-    order_number = f"ORD{datetime.utcnow().strftime('%Y%m%d')}{order_count + 1:04d}"
+    order_number = await allocate_order_number(session)
     
     # Создаем заказ
     order = Order(
@@ -198,119 +337,170 @@ async def create_order(
         order_number=order_number,
         customer_name=order_data.customer_name,
         customer_phone=order_data.customer_phone,
+        phone_digits=normalize_phone(order_data.customer_phone),
         delivery_type=order_data.delivery_type,
         delivery_address=order_data.delivery_address,
         delivery_district=order_data.delivery_district,
         delivery_interval_id=order_data.delivery_interval_id,
         delivery_date=order_data.delivery_date,
         payment_type=order_data.payment_type,
-        subtotal=subtotal,
-        delivery_cost=delivery_cost,
-        discount_amount=discount_amount,
-        total=total,
+        subtotal=quote.subtotal,
+        delivery_cost=quote.delivery_cost,
+        discount_amount=quote.discount_amount,
+        total=quote.total,
         promo_code_id=promo_code_id,
         comment=order_data.comment
     )
     session.add(order)
     await session.flush()
     
-    # Создаем элементы заказа
-    for cart_item in cart_items:
-        # Получаем название товара
-        product_result = await session.execute(
-            select(Product).where(Product.id == cart_item.product_id)
-        )
-        product = product_result.scalar_one_or_none()
-        
-        if product:
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=cart_item.product_id,
-                product_name=product.name,
-                quantity=cart_item.quantity,
-                unit=cart_item.unit,
-                price_per_unit=cart_item.price_per_unit,
-                subtotal=cart_item.quantity * cart_item.price_per_unit
-            )
-            session.add(order_item)
-            
-            # Удаляем из корзины
-            await session.delete(cart_item)
+    # Журнал использований промокода
+    if promo_code_id:
+        session.add(PromoRedemption(
+            promo_code_id=promo_code_id,
+            user_id=user.id,
+            order_id=order.id,
+            discount_amount=quote.discount_amount
+        ))
     
-    await session.commit()
+    # Элементы заказа - одним INSERT
+    await session.execute(
+        insert(OrderItem),
+        [
+            {
+                "order_id": order.id,
+                "product_id": cart_item.product_id,
+                "product_name": product_name,
+                "quantity": cart_item.quantity,
+                "unit": cart_item.unit,
+                "price_per_unit": cart_item.price_per_unit,
+                "subtotal": cart_item.quantity * cart_item.price_per_unit,
+                # Отмена вернет на склад ровно это
+                "stock_reserved": cart_item.quantity if stock is not None else None
+            }
+            for cart_item, product_name, _, _, _, stock in cart_rows
+        ]
+    )
     
-    return {
+    # Очищаем корзину одним DELETE
+    await session.execute(
+        delete(CartItem).where(CartItem.user_id == user.id)
+    )
+    
+    await bump_cart_version(session, user.id)
+    await record_order_created(session, order)
+    
+    # Уведомления - через очередь в той же транзакции, без задержки оформления
+    enqueue_event(session, OutboxEventType.ADMIN_NEW_ORDER, {"order_id": order.id})
+    enqueue_event(session, OutboxEventType.CUSTOMER_ORDER_CREATED, {"order_id": order.id})
+    
+    response_body = {
         "message": "Заказ успешно создан",
         "order_number": order_number,
         "order_id": order.id,
-        "total": total
+        "total": quote.total
     }
+    
+    # Ответ сохраняется вместе с заказом - повтор не создаст второй заказ
+    if idempotency_key:
+        scope = request_scope(request)
+        if not await save_response(session, idempotency_key, scope, response_body):
+            await session.rollback()
+            return await get_saved_response(session, idempotency_key, scope)
+    
+    await session.commit()
+    wake_outbox()
+    wake_recommendations()
+    popularity_counter.record_order(cart_item.product_id for cart_item, *_ in cart_rows)
+    publish_order_created(order)
+    
+    # Счетчик использований промокода изменился
+    if promo_code_id:
+        invalidate_promo_cache()
+    
+    return response_body
 
 
-@router.get("/{telegram_id}", response_model=List[OrderSchema])
-async def get_user_orders(
+@router.get("/stream/{telegram_id}")
+async def stream_user_orders(
     telegram_id: int,
+    request: Request,
+    last_event_id: Optional[str] = Header(None),
     session: AsyncSession = Depends(get_session)
 ):
-    """Получить заказы пользователя"""
-    # Получаем пользователя
+    """Живые изменения заказов пользователя (Server-Sent Events)"""
     result = await session.execute(
-        select(User).where(User.telegram_id == telegram_id)
+        select(User.id).where(User.telegram_id == telegram_id)
     )
-    user = result.scalar_one_or_none()
+    user_id = result.scalar_one_or_none()
     
-    if not user:
+    if user_id is None:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     
-    # Получаем заказы
-    result = await session.execute(
-        select(Order)
-        .where(Order.user_id == user.id)
-        .order_by(Order.created_at.desc())
+    # Соединение с БД не держим на все время потока
+    await session.close()
+    
+    return StreamingResponse(
+        order_event_stream(request, user_id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get(
+    "/{telegram_id}",
+    response_model=Union[List[OrderSchema], List[OrderSummarySchema]]
+)
+async def get_user_orders(
+    telegram_id: int,
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    before_id: Optional[int] = None,
+    summary: bool = False,
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    Получить заказы пользователя (от новых к старым).
+    
+    Постраничная выдача по курсору: следующую страницу запрашивают с
+    before_id из заголовка X-Next-Cursor. При summary=1 возвращаются только
+    шапки заказов и количество позиций. Заказы, перенесенные в архив,
+    подмешиваются в выдачу по тому же курсору.
+    """
+    hot = await fetch_order_page(session, Order, OrderItem, telegram_id, limit, before_id, summary=summary)
+    
+    # Архив: на полной горячей странице - только заказы между ее границами
+    # (обычно их нет), иначе - продолжение истории
+    after_id = hot[-1][0].id if len(hot) > limit else None
+    cold = await fetch_order_page(
+        session, ArchivedOrder, ArchivedOrderItem, telegram_id, limit, before_id, after_id, summary=summary
     )
-    orders = result.scalars().all()
-    
-    # Формируем ответ
-    orders_data = []
-    for order in orders:
-        # Получаем элементы заказа
-        items_result = await session.execute(
-            select(OrderItem).where(OrderItem.order_id == order.id)
+    
+    rows = sorted(hot + cold, key=lambda row: row[0].id, reverse=True)[:limit + 1]
+    
+    if not rows:
+        # Пустая страница: различаем "нет заказов" и "нет пользователя"
+        result = await session.execute(
+            select(User.id).where(User.telegram_id == telegram_id)
         )
-        items = items_result.scalars().all()
-        
-        order_dict = {
-            "id": order.id,
-            "order_number": order.order_number,
-            "customer_name": order.customer_name,
-            "customer_phone": order.customer_phone,
-            "delivery_type": order.delivery_type,
-            "delivery_address": order.delivery_address,
-            "delivery_district": order.delivery_district,
-            "delivery_date": order.delivery_date,
-            "payment_type": order.payment_type,
-            "subtotal": order.subtotal,
-            "delivery_cost": order.delivery_cost,
-            "discount_amount": order.discount_amount,
-            "total": order.total,
-            "status": order.status,
-            "comment": order.comment,
-            "created_at": order.created_at,
-            "items": [
-                {
-                    "product_id": item.product_id,
-                    "product_name": item.product_name,
-                    "quantity": item.quantity,
-                    "unit": item.unit,
-                    "price_per_unit": item.price_per_unit,
-                    "subtotal": item.subtotal
-                }
-                for item in items
-            ]
-        }
-        orders_data.append(order_dict)
-    
-    return orders_data
+        if result.scalar_one_or_none() is None:
+            raise HTTPException(status_code=404, detail="Пользователь не найден")
+        return []
+    
+    # Лишняя строка означает, что есть следующая страница
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = str(rows[-1][0].id)
+    
+    if summary:
+        return [
+            OrderSummarySchema.model_validate(order).model_copy(
+                update={"items_count": count}
+            )
+            for order, count in rows
+        ]
+    
+    return [order for order, _ in rows]
 
 
 @router.get("/detail/{order_id}", response_model=OrderSchema)
@@ -320,6 +510,34 @@ async def get_order_detail(
     session: AsyncSession = Depends(get_session)
 ):
     """Получить детали заказа"""
+    # Сначала рабочая таблица, затем архив
+    for order_model in (Order, ArchivedOrder):
+        result = await session.execute(
+            select(order_model)
+            .join(User, User.id == order_model.user_id)
+            .where(
+                and_(
+                    order_model.id == order_id,
+                    User.telegram_id == telegram_id
+                )
+            )
+            .options(selectinload(order_model.items))
+        )
+        order = result.scalar_one_or_none()
+        
+        if order:
+            return order
+    
+    raise HTTPException(status_code=404, detail="Заказ не найден")
+
+
+@router.post("/{order_id}/repeat/{telegram_id}")
+async def repeat_order(
+    order_id: int,
+    telegram_id: int,
+    session: AsyncSession = Depends(get_session)
+):
+    """Повторить заказ: скопировать его товары в корзину по текущим ценам"""
     # Получаем пользователя
     result = await session.execute(
         select(User).where(User.telegram_id == telegram_id)
@@ -329,54 +547,74 @@ async def get_order_detail(
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     
-    # Получаем заказ
-    result = await session.execute(
-        select(Order).where(
-            and_(
-                Order.id == order_id,
-                Order.user_id == user.id
+    # Получаем заказ: из рабочей таблицы или из архива
+    for order_model, item_model in ((Order, OrderItem), (ArchivedOrder, ArchivedOrderItem)):
+        result = await session.execute(
+            select(order_model.id).where(
+                and_(
+                    order_model.id == order_id,
+                    order_model.user_id == user.id
+                )
             )
         )
+        if result.scalar_one_or_none() is not None:
+            break
+    else:
+        raise HTTPException(status_code=404, detail="Заказ не найден")
+    
+    price = unit_price(item_model.unit)
+    available = and_(
+        Product.is_active == True,
+        Product.is_available == True,
+        price.is_not(None)
     )
-    order = result.scalar_one_or_none()
     
-    if not order:
-        raise HTTPException(status_code=404, detail="Заказ не найден")
+    # Позиции, которые не получится добавить (товар снят или нет цены для единицы)
+    result = await session.execute(
+        select(item_model.product_id, item_model.product_name, item_model.unit)
+        .outerjoin(Product, Product.id == item_model.product_id)
+        .where(item_model.order_id == order_id)
+        .where(~available | Product.id.is_(None))
+    )
+    skipped = [
+        {"product_id": product_id, "product_name": product_name, "unit": unit}
+        for product_id, product_name, unit in result.all()
+    ]
     
-    # Получаем элементы заказа
-    items_result = await session.execute(
-        select(OrderItem).where(OrderItem.order_id == order.id)
+    # Копируем доступные позиции одним INSERT ... SELECT; если товар уже
+    # в корзине, увеличиваем количество и ставим текущую цену (как add_to_cart)
+    insert_stmt = sqlite_insert(CartItem).from_select(
+        ["user_id", "product_id", "quantity", "unit", "price_per_unit", "created_at"],
+        select(
+            literal(user.id),
+            item_model.product_id,
+            item_model.quantity,
+            item_model.unit,
+            price,
+            literal(datetime.utcnow())
+        )
+        .join(Product, Product.id == item_model.product_id)
+        .where(item_model.order_id == order_id)
+        .where(available)
     )
-    items = items_result.scalars().all()
-    
-    order_dict = {
-        "id": order.id,
-        "order_number": order.order_number,
-        "customer_name": order.customer_name,
-        "customer_phone": order.customer_phone,
-        "delivery_type": order.delivery_type,
-        "delivery_address": order.delivery_address,
-        "delivery_district": order.delivery_district,
-        "delivery_date": order.delivery_date,
-        "payment_type": order.payment_type,
-        "subtotal": order.subtotal,
-        "delivery_cost": order.delivery_cost,
-        "discount_amount": order.discount_amount,
-        "total": order.total,
-        "status": order.status,
-        "comment": order.comment,
-        "created_at": order.created_at,
-        "items": [
-            {
-                "product_id": item.product_id,
-                "product_name": item.product_name,
-                "quantity": item.quantity,
-                "unit": item.unit,
-                "price_per_unit": item.price_per_unit,
-                "subtotal": item.subtotal
+    result = await session.execute(
+        insert_stmt.on_conflict_do_update(
+            index_elements=["user_id", "product_id", "unit"],
+            set_={
+                "quantity": CartItem.quantity + insert_stmt.excluded.quantity,
+                "price_per_unit": insert_stmt.excluded.price_per_unit
             }
-            for item in items
-        ]
-    }
+        )
+    )
+    added = result.rowcount
+    
+    version = await bump_cart_version(session, user.id)
+    await session.commit()
     
-    return order_dict
+    return {
+        "message": "Товары заказа добавлены в корзину" if added else "Товары заказа недоступны",
+        "added": added,
+        "skipped": skipped,
+        "version": version,
+        "items": await build_cart(session, user.id)
+    }
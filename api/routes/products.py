@@ -1,13 +1,14 @@
 """API роуты для продуктов и категорий"""
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, or_, and_
 from sqlalchemy.orm import selectinload
 from pydantic import BaseModel
 
 from database import get_session
-from database.models import Product, Category, ProductImage, BadgeType
+from database.models import Product, Category, ProductImage, ProductPopularity, BadgeType
+from services.recommendations import index as recommendation_index, recommended_products, CANDIDATES_FACTOR
 from shared.config import settings
 from shared.utils import save_upload_file
 
@@ -126,12 +127,26 @@ async def get_products(
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
     include_inactive: bool = False,
+    sort: str = Query("default", pattern="^(default|popular)$"),
     limit: int = 50,
     offset: int = 0,
     session: AsyncSession = Depends(get_session)
 ):
-    """Получить список товаров с фильтрами"""
-    query = select(Product).options(selectinload(Product.images)).order_by(Product.sort_order, Product.name)
+    """Получить список товаров с фильтрами
+    
+    sort=popular - по затухающей популярности (services.popularity),
+    товары без статистики - в конце в обычном порядке.
+    """
+    query = select(Product).options(selectinload(Product.images))
+    
+    if sort == "popular":
+        query = (
+            query
+            .outerjoin(ProductPopularity, ProductPopularity.product_id == Product.id)
+            .order_by(ProductPopularity.score.desc().nulls_last(), Product.sort_order, Product.name)
+        )
+    else:
+        query = query.order_by(Product.sort_order, Product.name)
     
     # Фильтры
     conditions = []
@@ -187,36 +202,24 @@ async def get_products(
     return products
 
 
-@router.get("/{product_id}", response_model=ProductSchema)
-async def get_product(
-    product_id: int,
-    session: AsyncSession = Depends(get_session)
-):
-    """Получить товар по ID"""
-    result = await session.execute(
-        select(Product).options(selectinload(Product.images)).where(Product.id == product_id)
-    )
-    product = result.scalar_one_or_none()
-    
-    if not product:
-        raise HTTPException(status_code=404, detail="Товар не найден")
-    
-    return product
-
-
 @router.get("/popular", response_model=List[ProductSchema])
 async def get_popular_products(
     limit: int = 10,
     session: AsyncSession = Depends(get_session)
 ):
-    """Получить популярные товары"""
+    """Получить популярные товары
+    
+    По затухающей популярности (заказы и добавления в корзину);
+    товары с меткой "хит" без статистики идут следом.
+    """
     result = await session.execute(
         select(Product)
         .options(selectinload(Product.images))
+        .outerjoin(ProductPopularity, ProductPopularity.product_id == Product.id)
         .where(Product.is_active == True)
         .where(Product.is_available == True)
-        .where(Product.badge == BadgeType.HIT.value)
-        .order_by(Product.sort_order)
+        .where(or_(ProductPopularity.score.is_not(None), Product.badge == BadgeType.HIT.value))
+        .order_by(ProductPopularity.score.desc().nulls_last(), Product.sort_order)
         .limit(limit)
     )
     products = result.scalars().all()
@@ -240,3 +243,35 @@ async def get_sale_products(
     )
     products = result.scalars().all()
     return products
+
+
+@router.get("/{product_id}", response_model=ProductSchema)
+async def get_product(
+    product_id: int,
+    session: AsyncSession = Depends(get_session)
+):
+    """Получить товар по ID"""
+    result = await session.execute(
+        select(Product).options(selectinload(Product.images)).where(Product.id == product_id)
+    )
+    product = result.scalar_one_or_none()
+    
+    if not product:
+        raise HTTPException(status_code=404, detail="Товар не найден")
+    
+    return product
+
+
+@router.get("/{product_id}/related", response_model=List[ProductSchema])
+async def get_related_products(
+    product_id: int,
+    limit: int = Query(8, ge=1, le=50),
+    session: AsyncSession = Depends(get_session)
+):
+    """Часто покупают вместе с товаром
+    
+    Порядок берется из индекса совместных покупок в памяти,
+    из БД читаются только карточки найденных товаров.
+    """
+    ranked = recommendation_index.related(product_id, limit * CANDIDATES_FACTOR)
+    return await recommended_products(session, ranked, limit)
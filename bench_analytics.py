@@ -0,0 +1,70 @@
+"""Замер аналитики продаж на синтетическом снимке
+
+Строит снимок из N позиций заказов (по умолчанию 1 000 000) без базы
+данных и замеряет каждый отчет services.analytics.
+
+    python bench_analytics.py [число_позиций]
+"""
+import sys
+import time
+from pathlib import Path
+
+# Добавляем корневую директорию в PYTHONPATH
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+import numpy as np
+
+from services.analytics import SalesSnapshot, UNITS
+
+
+def build_snapshot(lines: int, seed: int = 42) -> SalesSnapshot:
+    """Снимок: ~4 позиции в заказе, 20 000 покупателей, 500 товаров в 20 категориях, 2 года"""
+    rng = np.random.default_rng(seed)
+    orders = lines // 4
+    
+    order_id = np.sort(rng.integers(1, orders + 1, lines))
+    order_user = rng.integers(1, 20001, orders + 1)
+    order_ts = np.sort(rng.integers(1_700_000_000, 1_700_000_000 + 2 * 365 * 86400, orders + 1))
+    
+    snapshot = SalesSnapshot()
+    snapshot.append(
+        order_id=order_id,
+        user_id=order_user[order_id],
+        product_id=rng.integers(1, 501, lines),
+        unit=rng.integers(0, len(UNITS), lines),
+        cancelled=rng.random(lines) < 0.05,
+        created_ts=order_ts[order_id],
+        quantity=rng.uniform(0.5, 5, lines).round(1),
+        revenue=rng.uniform(50, 2000, lines).round(2)
+    )
+    
+    snapshot.product_category = np.concatenate(([-1], rng.integers(1, 21, 500)))
+    snapshot.product_names = {product_id: f"Товар {product_id}" for product_id in range(1, 501)}
+    snapshot.category_names = {category_id: f"Категория {category_id}" for category_id in range(1, 21)}
+    return snapshot
+
+
+def measure(name: str, func, repeat: int = 5):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    print(f"  {name:<28} {min(timings) * 1000:8.1f} мс (лучшее из {repeat})")
+
+
+if __name__ == "__main__":
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    
+    print(f"📊 Синтетический снимок: {lines:,} позиций".replace(",", " "))
+    started = time.perf_counter()
+    snapshot = build_snapshot(lines)
+    print(f"  {'построение снимка':<28} {(time.perf_counter() - started) * 1000:8.1f} мс")
+    
+    measure("топ товаров по выручке", lambda: snapshot.top_products(20))
+    measure("топ товаров по количеству", lambda: snapshot.top_products(20, by="quantity"))
+    measure("выручка по категориям", snapshot.category_revenue)
+    measure("по дням недели", snapshot.by_weekday)
+    measure("по часам", snapshot.by_hour)
+    measure("средний чек и повторные", snapshot.basket_metrics)
@@ -0,0 +1,121 @@
+"""Замер оформления заказа в зависимости от числа позиций корзины
+
+Создает временную базу SQLite, наполняет корзину из N позиций (у каждого
+товара ведется остаток) и замеряет POST /api/orders/create: время
+и число SQL-запросов на одно оформление. Запросов должно быть
+одинаково при любом N - оформление не ходит в базу по каждой позиции.
+
+    python bench_checkout.py [повторов]
+"""
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Добавляем корневую директорию в PYTHONPATH
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+# Отдельная база, чтобы не трогать рабочую
+DB_DIR = tempfile.mkdtemp(prefix="bench_checkout_")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{DB_DIR}/bench.db"
+os.environ.setdefault("BOT_TOKEN", "bench")
+os.environ.setdefault("ADMIN_ID", "0")
+
+import logging
+
+import httpx
+from sqlalchemy import event, delete
+
+from api.main import app
+from database.database import engine, async_session_maker, init_db
+from database.models import Category, Product, ProductStock, User, CartItem
+
+LINES = (1, 10, 50, 100)
+TELEGRAM_ID = 100
+
+ORDER_BODY = {
+    "customer_name": "bench",
+    "customer_phone": "+70000000000",
+    "delivery_type": "pickup",
+    "payment_type": "cash",
+}
+
+
+async def prepare() -> tuple:
+    """Схема, товары с остатками и покупатель; вернуть id покупателя и [(id товара, цена)]"""
+    await init_db()
+    async with async_session_maker() as session:
+        category = Category(name="Bench")
+        session.add(category)
+        await session.flush()
+        
+        products = [
+            Product(category_id=category.id, name=f"Товар {i}", price_kg=100.0 + i)
+            for i in range(max(LINES))
+        ]
+        session.add_all(products)
+        await session.flush()
+        session.add_all(
+            ProductStock(product_id=product.id, unit="kg", quantity=1_000_000)
+            for product in products
+        )
+        
+        user = User(telegram_id=TELEGRAM_ID, first_name="bench")
+        session.add(user)
+        await session.commit()
+        return user.id, [(product.id, product.price_kg) for product in products]
+
+
+async def fill_cart(user_id: int, products: list, lines: int):
+    """Корзина из первых lines товаров по текущим ценам"""
+    async with async_session_maker() as session:
+        await session.execute(delete(CartItem).where(CartItem.user_id == user_id))
+        session.add_all(
+            CartItem(user_id=user_id, product_id=product_id, quantity=1, unit="kg", price_per_unit=price)
+            for product_id, price in products[:lines]
+        )
+        await session.commit()
+
+
+async def main(repeat: int):
+    user_id, products = await prepare()
+    
+    statements = [0]
+    
+    def count_statement(*_args, **_kwargs):
+        statements[0] += 1
+    
+    event.listen(engine.sync_engine, "before_cursor_execute", count_statement)
+    
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"🛒 Оформление заказа, {repeat} повторов на размер корзины")
+        for lines in LINES:
+            timings = []
+            for _ in range(repeat):
+                await fill_cart(user_id, products, lines)
+                statements[0] = 0
+                started = time.perf_counter()
+                response = await client.post(f"/api/orders/create/{TELEGRAM_ID}", json=ORDER_BODY)
+                timings.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise SystemExit(f"Ошибка оформления: {response.status_code} {response.text}")
+            
+            print(
+                f"  {lines:>4} позиций  {statistics.median(timings) * 1000:8.1f} мс (медиана)"
+                f"  {min(timings) * 1000:8.1f} мс (лучшее)  {statements[0]:3d} SQL-запросов"
+            )
+
+
+if __name__ == "__main__":
+    engine.echo = False
+    logging.disable(logging.CRITICAL)
+    try:
+        asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20))
+    finally:
+        shutil.rmtree(DB_DIR, ignore_errors=True)
@@ -1,6 +1,7 @@
 """Подключение к базе данных"""
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
+from database.migrations import upgrade_schema
 from shared.config import settings
 
 # Создание движка базы данных
@@ -30,6 +31,7 @@ async def get_session() -> AsyncSession:
 
 
 async def init_db():
-    """Инициализация базы данных"""
+    """Инициализация базы данных: новые таблицы и доводка существующих"""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(upgrade_schema, Base.metadata)
@@ -0,0 +1,136 @@
+"""Доведение схемы существующей базы до моделей
+
+create_all создает только недостающие таблицы: новые колонки, индексы
+и ограничения в уже существующих таблицах он не трогает. upgrade_schema
+выполняется сразу после него при каждом запуске (init_db), до любых
+запросов приложения. Каждый шаг сам смотрит на текущую схему и на уже
+доведенной базе ничего не делает, поэтому таблица версий не нужна.
+
+Новые колонки существующих таблиц должны быть nullable: SQLite
+добавляет колонку без значения по умолчанию только так.
+"""
+from typing import List
+
+from sqlalchemy import MetaData, inspect
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateTable
+
+
+def _add_missing_columns(conn: Connection, metadata: MetaData):
+    """ALTER TABLE ... ADD COLUMN для колонок моделей, которых нет в таблицах"""
+    inspector = inspect(conn)
+    for table in metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable:
+                raise RuntimeError(f"Колонку {table.name}.{column.name} нельзя добавить: она NOT NULL")
+            
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}')
+
+
+def _create_missing_indexes(conn: Connection, metadata: MetaData):
+    """Индексы моделей, которых еще нет в базе"""
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def _has_unique(conn: Connection, table: str, columns: List[str]) -> bool:
+    """Есть ли в таблице уникальный индекс или ограничение ровно по columns"""
+    inspector = inspect(conn)
+    existing = [constraint["column_names"] for constraint in inspector.get_unique_constraints(table)]
+    existing += [index["column_names"] for index in inspector.get_indexes(table) if index["unique"]]
+    return any(sorted(names) == sorted(columns) for names in existing)
+
+
+def _unique_favorites(conn: Connection):
+    """Уникальность (user_id, product_id) в избранном - на ней держится ON CONFLICT"""
+    if _has_unique(conn, "favorites", ["user_id", "product_id"]):
+        return
+    
+    # Дубли - следствие гонки при добавлении; оставляем самую раннюю запись
+    conn.exec_driver_sql(
+        "DELETE FROM favorites WHERE id NOT IN "
+        "(SELECT min(id) FROM favorites GROUP BY user_id, product_id)"
+    )
+    conn.exec_driver_sql(
+        "CREATE UNIQUE INDEX uq_favorites_user_product ON favorites (user_id, product_id)"
+    )
+
+
+def _unique_cart_items(conn: Connection):
+    """Уникальность (user_id, product_id, unit) в корзине - на ней держится ON CONFLICT"""
+    if _has_unique(conn, "cart_items", ["user_id", "product_id", "unit"]):
+        return
+    
+    # Дубли сливаются в самую раннюю строку: количество складывается,
+    # цена - из последнего добавления, как при повторном добавлении товара
+    same_line = (
+        "d.user_id = cart_items.user_id AND d.product_id = cart_items.product_id "
+        "AND d.unit = cart_items.unit"
+    )
+    conn.exec_driver_sql(
+        "UPDATE cart_items SET "
+        f"quantity = (SELECT sum(d.quantity) FROM cart_items d WHERE {same_line}), "
+        f"price_per_unit = (SELECT d.price_per_unit FROM cart_items d WHERE {same_line} ORDER BY d.id DESC LIMIT 1) "
+        "WHERE id IN (SELECT min(id) FROM cart_items GROUP BY user_id, product_id, unit HAVING count(*) > 1)"
+    )
+    conn.exec_driver_sql(
+        "DELETE FROM cart_items WHERE id NOT IN "
+        "(SELECT min(id) FROM cart_items GROUP BY user_id, product_id, unit)"
+    )
+    conn.exec_driver_sql(
+        "CREATE UNIQUE INDEX uq_cart_items_user_product_unit ON cart_items (user_id, product_id, unit)"
+    )
+
+
+def _autoincrement(conn: Connection, metadata: MetaData, name: str, archive: str):
+    """Пересоздать таблицу как AUTOINCREMENT, если она создана без него
+    
+    Без AUTOINCREMENT SQLite выдает max(id) + 1, и id заказа, ушедшего
+    в архив, достается новому. Опцию таблицы можно задать только при
+    создании, поэтому таблица пересоздается с копированием строк, а счетчик
+    в sqlite_sequence ставится выше всех id - и рабочих, и архивных.
+    Индексы таблицы пропадают вместе со старой и создаются заново
+    в _create_missing_indexes.
+    """
+    sql = conn.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).scalar()
+    if sql is None or "AUTOINCREMENT" in sql.upper():
+        return
+    
+    # Копия метаданных нужна, чтобы DDL разрешил внешние ключи новой таблицы
+    scratch = MetaData()
+    for table in metadata.sorted_tables:
+        table.to_metadata(scratch)
+    rebuilt = scratch.tables[name].to_metadata(scratch, name=f"{name}_new")
+    columns = ", ".join(f'"{column.name}"' for column in rebuilt.columns)
+    
+    conn.execute(CreateTable(rebuilt))
+    conn.exec_driver_sql(f'INSERT INTO "{name}_new" ({columns}) SELECT {columns} FROM "{name}"')
+    conn.exec_driver_sql(f'DROP TABLE "{name}"')
+    conn.exec_driver_sql(f'ALTER TABLE "{name}_new" RENAME TO "{name}"')
+    
+    last_id = conn.exec_driver_sql(
+        f'SELECT max(coalesce((SELECT max(id) FROM "{name}"), 0), '
+        f'coalesce((SELECT max(id) FROM "{archive}"), 0))'
+    ).scalar()
+    updated = conn.exec_driver_sql(
+        "UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = ?", (last_id, name)
+    )
+    if not updated.rowcount:
+        conn.exec_driver_sql("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (name, last_id))
+
+
+def upgrade_schema(conn: Connection, metadata: MetaData):
+    """Довести таблицы, созданные прежними версиями, до текущих моделей"""
+    _add_missing_columns(conn, metadata)
+    _unique_favorites(conn)
+    _unique_cart_items(conn)
+    _autoincrement(conn, metadata, "orders", "archived_orders")
+    _autoincrement(conn, metadata, "order_items", "archived_order_items")
+    _create_missing_indexes(conn, metadata)
@@ -1,8 +1,9 @@
 """Модели базы данных"""
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional, List
 from sqlalchemy import (
-    Integer, String, Float, Boolean, Text, DateTime, ForeignKey, Enum, JSON
+    Integer, String, Float, Boolean, Text, Date, DateTime, ForeignKey, Enum, JSON,
+    UniqueConstraint, Index
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from enum import Enum as PyEnum
@@ -153,11 +154,62 @@ class ProductImage(Base):
     product: Mapped["Product"] = relationship("Product", back_populates="images")
 
 
+class ProductStock(Base):
+    """Остаток товара по единице измерения
+    
+    Нет строки - остаток не ведется (товар не ограничен).
+    """
+    __tablename__ = "product_stock"
+    
+    product_id: Mapped[int] = mapped_column(Integer, ForeignKey("products.id"), primary_key=True)
+    unit: Mapped[str] = mapped_column(String(20), primary_key=True)
+    quantity: Mapped[float] = mapped_column(Float, default=0, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class ProductPopularity(Base):
+    """Популярность товара: затухающая сумма заказов и добавлений в корзину
+    
+    score - log2 суммы весов событий, приведенных к общей эпохе
+    (см. services.popularity); больше - популярнее.
+    """
+    __tablename__ = "product_popularity"
+    __table_args__ = (
+        # Сортировка каталога sort=popular
+        Index("ix_product_popularity_score", "score"),
+    )
+    
+    product_id: Mapped[int] = mapped_column(Integer, ForeignKey("products.id"), primary_key=True)
+    score: Mapped[float] = mapped_column(Float, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class ScheduledProductChange(Base):
+    """Отложенное изменение поля товара или всех товаров категории"""
+    __tablename__ = "scheduled_product_changes"
+    __table_args__ = (
+        # Ожидающие изменения: WHERE applied_at IS NULL AND effective_at <= ?
+        Index("ix_scheduled_product_changes_pending", "applied_at", "effective_at"),
+    )
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    product_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey("products.id"), nullable=True)
+    category_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey("categories.id"), nullable=True)
+    field: Mapped[str] = mapped_column(String(30), nullable=False)
+    value: Mapped[Optional[str]] = mapped_column(JSON, nullable=True)
+    effective_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)  # UTC
+    applied_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
 # ==================== ИЗБРАННОЕ ====================
 
 class Favorite(Base):
     """Избранные товары"""
     __tablename__ = "favorites"
+    __table_args__ = (
+        UniqueConstraint("user_id", "product_id", name="uq_favorites_user_product"),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"))
@@ -174,6 +226,10 @@ class Favorite(Base):
 class CartItem(Base):
     """Элемент корзины"""
     __tablename__ = "cart_items"
+    __table_args__ = (
+        # Одна строка на товар и единицу измерения; индекс обслуживает и выборку по user_id
+        UniqueConstraint("user_id", "product_id", "unit", name="uq_cart_items_user_product_unit"),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"))
@@ -188,11 +244,47 @@ class CartItem(Base):
     product: Mapped["Product"] = relationship("Product", back_populates="cart_items")
 
 
+class CartVersion(Base):
+    """Версия корзины пользователя (для ETag)"""
+    __tablename__ = "cart_versions"
+    
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+
+class ArchivedCartItem(Base):
+    """Архив брошенных корзин"""
+    __tablename__ = "archived_cart_items"
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, index=True)
+    product_id: Mapped[int] = mapped_column(Integer)
+    quantity: Mapped[float] = mapped_column(Float, nullable=False)
+    unit: Mapped[str] = mapped_column(String(20), nullable=False)
+    price_per_unit: Mapped[float] = mapped_column(Float, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime)
+    archived_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
 # ==================== ЗАКАЗЫ ====================
 
 class Order(Base):
     """Модель заказа"""
     __tablename__ = "orders"
+    __table_args__ = (
+        # История заказов пользователя: WHERE user_id = ? ORDER BY id DESC
+        Index("ix_orders_user_id_id", "user_id", "id"),
+        # Лист сборки: заказы слота доставки в нужных статусах
+        Index("ix_orders_delivery_slot", "delivery_date", "delivery_interval_id", "status"),
+        # Доска заказов: вкладка статуса от новых к старым и счетчики по статусам
+        Index("ix_orders_status_id", "status", "id"),
+        # Поиск заказов по началу телефона (цифры без кода страны)
+        Index("ix_orders_phone_digits", "phone_digits"),
+        # Выгрузка заказов за период
+        Index("ix_orders_created_at", "created_at"),
+        # id переезжает в архив вместе с заказом - SQLite не должен выдавать его повторно
+        {"sqlite_autoincrement": True},
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"))
@@ -201,6 +293,7 @@ class Order(Base):
     # Контактные данные
     customer_name: Mapped[str] = mapped_column(String(255), nullable=False)
     customer_phone: Mapped[str] = mapped_column(String(20), nullable=False)
+    phone_digits: Mapped[Optional[str]] = mapped_column(String(20), nullable=True)  # Цифры телефона для поиска
     
     # Доставка
     delivery_type: Mapped[str] = mapped_column(String(20), nullable=False)  # delivery, pickup
@@ -237,9 +330,22 @@ class Order(Base):
     promo_code: Mapped[Optional["PromoCode"]] = relationship("PromoCode")
 
 
+class OrderSequence(Base):
+    """Счетчик номеров заказов по дням"""
+    __tablename__ = "order_sequences"
+    
+    day: Mapped[str] = mapped_column(String(8), primary_key=True)  # yyyymmdd
+    last_value: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+
 class OrderItem(Base):
     """Элемент заказа"""
     __tablename__ = "order_items"
+    __table_args__ = (
+        # Позиции заказа; покрывает и суммирование в листе сборки
+        Index("ix_order_items_order_id", "order_id", "product_id", "unit", "quantity"),
+        {"sqlite_autoincrement": True},
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     order_id: Mapped[int] = mapped_column(Integer, ForeignKey("orders.id"))
@@ -249,12 +355,122 @@ class OrderItem(Base):
     unit: Mapped[str] = mapped_column(String(20), nullable=False)
     price_per_unit: Mapped[float] = mapped_column(Float, nullable=False)
     subtotal: Mapped[float] = mapped_column(Float, nullable=False)
+    stock_reserved: Mapped[Optional[float]] = mapped_column(Float, nullable=True)  # Списано со склада при оформлении
     
     # Отношения
     order: Mapped["Order"] = relationship("Order", back_populates="items")
     product: Mapped["Product"] = relationship("Product", back_populates="order_items")
 
 
+class ArchivedOrder(Base):
+    """Архив завершенных и отмененных заказов (поля и id - как в orders)"""
+    __tablename__ = "archived_orders"
+    __table_args__ = (
+        Index("ix_archived_orders_user_id_id", "user_id", "id"),
+        Index("ix_archived_orders_phone_digits", "phone_digits"),
+        Index("ix_archived_orders_created_at", "created_at"),
+    )
+    
+    # Признак для схем ответа: заказ прочитан из архива
+    archived = True
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"))
+    order_number: Mapped[str] = mapped_column(String(50), unique=True, nullable=False)
+    customer_name: Mapped[str] = mapped_column(String(255), nullable=False)
+    customer_phone: Mapped[str] = mapped_column(String(20), nullable=False)
+    phone_digits: Mapped[Optional[str]] = mapped_column(String(20), nullable=True)
+    delivery_type: Mapped[str] = mapped_column(String(20), nullable=False)
+    delivery_address: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    delivery_district: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    delivery_interval_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    delivery_date: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    payment_type: Mapped[str] = mapped_column(String(20), nullable=False)
+    subtotal: Mapped[float] = mapped_column(Float, nullable=False)
+    delivery_cost: Mapped[float] = mapped_column(Float, default=0)
+    discount_amount: Mapped[float] = mapped_column(Float, default=0)
+    total: Mapped[float] = mapped_column(Float, nullable=False)
+    promo_code_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    comment: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    status: Mapped[str] = mapped_column(String(20), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime)
+    updated_at: Mapped[datetime] = mapped_column(DateTime)
+    archived_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    
+    # Отношения
+    items: Mapped[List["ArchivedOrderItem"]] = relationship("ArchivedOrderItem", back_populates="order")
+
+
+class ArchivedOrderItem(Base):
+    """Архив элементов заказов"""
+    __tablename__ = "archived_order_items"
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    order_id: Mapped[int] = mapped_column(Integer, ForeignKey("archived_orders.id"), index=True)
+    product_id: Mapped[int] = mapped_column(Integer)
+    product_name: Mapped[str] = mapped_column(String(255), nullable=False)
+    quantity: Mapped[float] = mapped_column(Float, nullable=False)
+    unit: Mapped[str] = mapped_column(String(20), nullable=False)
+    price_per_unit: Mapped[float] = mapped_column(Float, nullable=False)
+    subtotal: Mapped[float] = mapped_column(Float, nullable=False)
+    stock_reserved: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    
+    # Отношения
+    order: Mapped["ArchivedOrder"] = relationship("ArchivedOrder", back_populates="items")
+
+
+# ==================== СТАТИСТИКА ====================
+
+class OrderDailyStats(Base):
+    """Сводка заказов по дням и статусам (обновляется вместе с заказами)"""
+    __tablename__ = "orders_daily_stats"
+    
+    day: Mapped[date] = mapped_column(Date, primary_key=True)  # День создания заказа (UTC)
+    status: Mapped[str] = mapped_column(String(20), primary_key=True)
+    orders_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    revenue: Mapped[float] = mapped_column(Float, default=0, nullable=False)
+
+
+class CustomerStats(Base):
+    """Итоги покупателя по неотмененным заказам (обновляются вместе с заказами)"""
+    __tablename__ = "customer_stats"
+    __table_args__ = (
+        # Сортировка клиентов по сумме покупок
+        Index("ix_customer_stats_total_spent", "total_spent"),
+        # Сегменты вида "заказывал за последние N дней"
+        Index("ix_customer_stats_last_order_at", "last_order_at"),
+    )
+    
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), primary_key=True)
+    orders_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    total_spent: Mapped[float] = mapped_column(Float, default=0, nullable=False)
+    first_order_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    last_order_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+
+# ==================== РЕКОМЕНДАЦИИ ====================
+
+class ProductPairCount(Base):
+    """Число заказов, где товары встретились вместе (контрольная точка индекса рекомендаций)"""
+    __tablename__ = "product_pair_counts"
+    
+    # Пара хранится один раз: product_id <= related_id;
+    # при product_id == related_id - число заказов с самим товаром
+    product_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    related_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    orders_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+
+class RecommendationState(Base):
+    """Докуда учтены заказы в контрольной точке индекса рекомендаций (одна строка)"""
+    __tablename__ = "recommendation_state"
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    last_order_id: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    orders_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
 # ==================== ПРОМОКОДЫ ====================
 
 class PromoCode(Base):
@@ -275,6 +491,22 @@ class PromoCode(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
 
+class PromoRedemption(Base):
+    """Использования промокодов (журнал по пользователям)"""
+    __tablename__ = "promo_redemptions"
+    __table_args__ = (
+        Index("ix_promo_redemptions_promo_user", "promo_code_id", "user_id"),
+    )
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    promo_code_id: Mapped[int] = mapped_column(Integer, ForeignKey("promo_codes.id"))
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"))
+    # Без внешнего ключа: заказ со временем переезжает в archived_orders
+    order_id: Mapped[int] = mapped_column(Integer, unique=True)
+    discount_amount: Mapped[float] = mapped_column(Float, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
 # ==================== ИНТЕРВАЛЫ ДОСТАВКИ ====================
 
 class DeliveryInterval(Base):
@@ -308,6 +540,47 @@ class Settings(Base):
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+# ==================== ИДЕМПОТЕНТНОСТЬ ====================
+
+class IdempotencyKey(Base):
+    """Сохраненные ответы для повторных запросов с Idempotency-Key"""
+    __tablename__ = "idempotency_keys"
+    
+    key: Mapped[str] = mapped_column(String(100), primary_key=True)
+    scope: Mapped[str] = mapped_column(String(255), primary_key=True)  # Метод и путь запроса
+    status_code: Mapped[int] = mapped_column(Integer, nullable=False)
+    response: Mapped[dict] = mapped_column(JSON, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+
+
+# ==================== ИСХОДЯЩИЕ СОБЫТИЯ ====================
+
+class OutboxStatus(PyEnum):
+    """Статусы исходящих событий"""
+    PENDING = "pending"  # Ожидает доставки
+    SENT = "sent"  # Доставлено
+    FAILED = "failed"  # Доставка не удалась
+
+
+class OutboxEvent(Base):
+    """Исходящее событие (transactional outbox): пишется в одной транзакции с заказом"""
+    __tablename__ = "outbox_events"
+    __table_args__ = (
+        # Выборка очереди: WHERE status = 'pending' AND next_attempt_at <= ?
+        Index("ix_outbox_events_status_next_attempt", "status", "next_attempt_at"),
+    )
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    event_type: Mapped[str] = mapped_column(String(50), nullable=False)
+    payload: Mapped[dict] = mapped_column(JSON, nullable=False)
+    status: Mapped[str] = mapped_column(String(20), default=OutboxStatus.PENDING.value)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    processed_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+
 # ==================== СООБЩЕНИЯ ====================
 
 class Message(Base):
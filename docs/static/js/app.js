@@ -116,19 +116,47 @@ async function loadProducts(categoryId = null, search = null) {
     }
 }
 
-// Загрузка корзины
+// Загрузка корзины (условный запрос по версии корзины)
+let cartEtag = null;
+
 async function loadCart() {
     if (!userId) return;
     
     try {
-        const cart = await apiRequest(`/api/cart/${userId}`);
-        state.cart = cart;
+        const response = await fetch(`${API_BASE_URL}/api/cart/${userId}`, {
+            headers: cartEtag ? { 'If-None-Match': cartEtag } : {}
+        });
+        
+        // Корзина не менялась
+        if (response.status === 304) return;
+        
+        if (!response.ok) {
+            throw new Error('Ошибка загрузки корзины');
+        }
+        
+        cartEtag = response.headers.get('ETag');
+        state.cart = await response.json();
         updateCartBadge();
     } catch (error) {
         console.error('Error loading cart:', error);
     }
 }
 
+// Ключ идемпотентности: повтор запроса с тем же ключом не выполнит его дважды
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+}
+
+// Применение ответа на изменение корзины (новая версия и содержимое)
+function applyCartMutation(result) {
+    cartEtag = `"cart-${result.version}"`;
+    state.cart = result.items;
+    updateCartBadge();
+}
+
 // Загрузка избранного
 async function loadFavorites() {
     if (!userId) return;
@@ -159,8 +187,9 @@ async function addToCart(productId, quantity = 1, unit = 'kg') {
     }
 
     try {
-        await apiRequest(`/api/cart/${userId}`, {
+        const result = await apiRequest(`/api/cart/${userId}`, {
             method: 'POST',
+            headers: { 'Idempotency-Key': newIdempotencyKey() },
             body: JSON.stringify({
                 product_id: productId,
                 quantity: quantity,
@@ -168,7 +197,7 @@ async function addToCart(productId, quantity = 1, unit = 'kg') {
             })
         });
 
-        await loadCart();
+        applyCartMutation(result);
         safeShowPopup({
             title: 'Успешно',
             message: 'Товар добавлен в корзину',
@@ -179,31 +208,40 @@ async function addToCart(productId, quantity = 1, unit = 'kg') {
     }
 }
 
+// Синхронизация избранного (один PUT на серию переключений)
+let favoritesSyncTimeout = null;
+
+function scheduleFavoritesSync() {
+    clearTimeout(favoritesSyncTimeout);
+    favoritesSyncTimeout = setTimeout(async () => {
+        try {
+            state.favorites = await apiRequest(`/api/favorites/${userId}`, {
+                method: 'PUT',
+                body: JSON.stringify({ product_ids: state.favorites })
+            });
+        } catch (error) {
+            console.error('Error syncing favorites:', error);
+            await loadFavorites();
+        }
+        renderProducts();
+    }, 400);
+}
+
 // Переключение избранного
-async function toggleFavorite(productId) {
+function toggleFavorite(productId) {
     if (!userId) {
         safeShowAlert('Необходимо авторизоваться');
         return;
     }
     
-    try {
-        const isFavorite = state.favorites.includes(productId);
-        
-        if (isFavorite) {
-            await apiRequest(`/api/favorites/${userId}/${productId}`, {
-                method: 'DELETE'
-            });
-        } else {
-            await apiRequest(`/api/favorites/${userId}/${productId}`, {
-                method: 'POST'
-            });
-        }
-        
-        await loadFavorites();
-        renderProducts();
-    } catch (error) {
-        console.error('Error toggling favorite:', error);
+    if (state.favorites.includes(productId)) {
+        state.favorites = state.favorites.filter(id => id !== productId);
+    } else {
+        state.favorites = [...state.favorites, productId];
     }
+    
+    renderProducts();
+    scheduleFavoritesSync();
 }
 
 // ==================== РЕНДЕРИНГ ====================
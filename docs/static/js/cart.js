@@ -11,11 +11,14 @@ const API_BASE_URL = window.CONFIG ? window.CONFIG.API_BASE_URL : window.locatio
 
 let cartState = {
     items: [],
-    settings: {},
     intervals: [],
-    selectedPromo: null
+    selectedPromo: null,
+    quote: null,
+    checkoutKey: null
 };
 
+let quoteTimeout = null;
+
 // ==================== API ====================
 
 async function apiRequest(endpoint, options = {}) {
@@ -58,17 +61,6 @@ async function loadCart() {
     }
 }
 
-// Загрузка настроек
-async function loadSettings() {
-    try {
-        const settings = await apiRequest('/api/settings/public');
-        cartState.settings = settings;
-        updateSummary();
-    } catch (error) {
-        console.error('Error loading settings:', error);
-    }
-}
-
 // Загрузка интервалов доставки
 async function loadIntervals() {
     try {
@@ -80,6 +72,50 @@ async function loadIntervals() {
     }
 }
 
+// Ключ идемпотентности: повтор запроса с тем же ключом не выполнит его дважды
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+}
+
+// Ответ на изменение корзины уже содержит новую корзину
+function applyCartMutation(result) {
+    cartState.items = result.items;
+    renderCart();
+    updateSummary();
+}
+
+// Расчет заказа на сервере
+async function fetchQuote() {
+    clearTimeout(quoteTimeout);
+    
+    const deliveryType = document.querySelector('input[name="delivery_type"]:checked')?.value || 'delivery';
+    
+    try {
+        cartState.quote = await apiRequest(`/api/orders/quote/${userId}`, {
+            method: 'POST',
+            body: JSON.stringify({
+                delivery_type: deliveryType,
+                promo_code: cartState.selectedPromo
+            })
+        });
+    } catch (error) {
+        console.error('Error loading quote:', error);
+        cartState.quote = null;
+    }
+    
+    renderSummary();
+    return cartState.quote;
+}
+
+// Отложенный пересчет, чтобы не дергать сервер на каждый клик
+function scheduleQuote() {
+    clearTimeout(quoteTimeout);
+    quoteTimeout = setTimeout(fetchQuote, 300);
+}
+
 // Обновление количества
 async function updateQuantity(itemId, newQuantity) {
     if (newQuantity <= 0) {
@@ -88,11 +124,12 @@ async function updateQuantity(itemId, newQuantity) {
     }
     
     try {
-        await apiRequest(`/api/cart/${userId}/${itemId}`, {
+        const result = await apiRequest(`/api/cart/${userId}/${itemId}`, {
             method: 'PUT',
+            headers: { 'Idempotency-Key': newIdempotencyKey() },
             body: JSON.stringify({ quantity: newQuantity })
         });
-        await loadCart();
+        applyCartMutation(result);
     } catch (error) {
         console.error('Error updating quantity:', error);
     }
@@ -101,10 +138,11 @@ async function updateQuantity(itemId, newQuantity) {
 // Удаление товара
 async function removeItem(itemId) {
     try {
-        await apiRequest(`/api/cart/${userId}/${itemId}`, {
-            method: 'DELETE'
+        const result = await apiRequest(`/api/cart/${userId}/${itemId}`, {
+            method: 'DELETE',
+            headers: { 'Idempotency-Key': newIdempotencyKey() }
         });
-        await loadCart();
+        applyCartMutation(result);
     } catch (error) {
         console.error('Error removing item:', error);
     }
@@ -115,10 +153,11 @@ async function clearCart() {
     tg.showConfirm('Очистить корзину?', async (confirmed) => {
         if (confirmed) {
             try {
-                await apiRequest(`/api/cart/${userId}`, {
-                    method: 'DELETE'
+                const result = await apiRequest(`/api/cart/${userId}`, {
+                    method: 'DELETE',
+                    headers: { 'Idempotency-Key': newIdempotencyKey() }
                 });
-                await loadCart();
+                applyCartMutation(result);
             } catch (error) {
                 console.error('Error clearing cart:', error);
             }
@@ -134,12 +173,13 @@ async function applyPromoCode() {
     if (!code) return;
     
     cartState.selectedPromo = code;
-    updateSummary();
-    tg.showPopup({
-        title: 'Промокод',
-        message: 'Промокод будет применен при оформлении заказа',
-        buttons: [{type: 'ok'}]
-    });
+    const quote = await fetchQuote();
+    
+    if (quote && !quote.promo_applied) {
+        tg.showAlert(quote.errors[0] || 'Промокод не найден');
+        cartState.selectedPromo = null;
+        await fetchQuote();
+    }
 }
 
 // Оформление заказа
@@ -170,11 +210,25 @@ async function checkout() {
         return;
     }
     
+    // Заказ оформляем только по актуальному и корректному расчету
+    const quote = await fetchQuote();
+    if (!quote || !quote.is_valid) {
+        tg.showAlert(quote?.errors[0] || 'Не удалось рассчитать заказ');
+        return;
+    }
+    
+    // Один ключ на попытку оформления: повторное нажатие не создаст второй заказ
+    if (!cartState.checkoutKey) {
+        cartState.checkoutKey = newIdempotencyKey();
+    }
+    
     try {
         const result = await apiRequest(`/api/orders/create/${userId}`, {
             method: 'POST',
+            headers: { 'Idempotency-Key': cartState.checkoutKey },
             body: JSON.stringify(orderData)
         });
+        cartState.checkoutKey = null;
         
         tg.showPopup({
             title: 'Заказ оформлен!',
@@ -187,6 +241,8 @@ async function checkout() {
         }, 1500);
     } catch (error) {
         console.error('Error creating order:', error);
+        // Цены или наличие могли измениться - показываем актуальную корзину
+        await loadCart();
     }
 }
 
@@ -249,26 +305,24 @@ function renderIntervals() {
 }
 
 function updateSummary() {
-    const subtotal = cartState.items.reduce((sum, item) => sum + item.total, 0);
-    const minOrder = parseFloat(cartState.settings.min_order_amount || 0);
-    const freeDeliveryFrom = parseFloat(cartState.settings.free_delivery_from || 0);
-    const deliveryCost = parseFloat(cartState.settings.delivery_cost || 0);
+    scheduleQuote();
+}
+
+function renderSummary() {
+    const quote = cartState.quote;
+    if (!quote) return;
     
-    // Проверяем тип доставки
     const deliveryType = document.querySelector('input[name="delivery_type"]:checked')?.value;
-    const actualDeliveryCost = (deliveryType === 'delivery' && subtotal < freeDeliveryFrom) ? deliveryCost : 0;
-    
-    const total = subtotal + actualDeliveryCost;
     
     // Обновляем итоги
     const subtotalEl = document.getElementById('subtotal');
     const deliveryEl = document.getElementById('deliveryCost');
     const totalEl = document.getElementById('total');
     
-    if (subtotalEl) subtotalEl.textContent = `${subtotal.toFixed(2)} ₽`;
+    if (subtotalEl) subtotalEl.textContent = `${quote.subtotal.toFixed(2)} ₽`;
     if (deliveryEl) {
-        if (actualDeliveryCost > 0) {
-            deliveryEl.textContent = `${actualDeliveryCost.toFixed(2)} ₽`;
+        if (quote.delivery_cost > 0) {
+            deliveryEl.textContent = `${quote.delivery_cost.toFixed(2)} ₽`;
         } else if (deliveryType === 'delivery') {
             deliveryEl.textContent = 'Бесплатно';
             deliveryEl.style.color = 'var(--primary-green)';
@@ -276,15 +330,19 @@ function updateSummary() {
             deliveryEl.textContent = '0 ₽';
         }
     }
-    if (totalEl) totalEl.textContent = `${total.toFixed(2)} ₽`;
+    if (totalEl) totalEl.textContent = `${quote.total.toFixed(2)} ₽`;
     
     // Проверяем минимальную сумму
     const minOrderWarning = document.getElementById('minOrderWarning');
     const checkoutBtn = document.getElementById('checkoutBtn');
+    const minOrder = quote.min_order_amount;
+    const freeDeliveryFrom = quote.free_delivery_from;
     
-    if (subtotal < minOrder) {
+    if (!quote.is_valid) {
         if (minOrderWarning) {
-            minOrderWarning.textContent = `Минимальная сумма заказа: ${minOrder} ₽. Добавьте еще товаров на ${(minOrder - subtotal).toFixed(2)} ₽`;
+            minOrderWarning.textContent = quote.subtotal < minOrder
+                ? `Минимальная сумма заказа: ${minOrder} ₽. Добавьте еще товаров на ${(minOrder - quote.subtotal).toFixed(2)} ₽`
+                : quote.errors[0];
             minOrderWarning.style.display = 'flex';
         }
         if (checkoutBtn) checkoutBtn.disabled = true;
@@ -293,7 +351,7 @@ function updateSummary() {
         if (checkoutBtn) checkoutBtn.disabled = false;
         
         // Показываем информацию о бесплатной доставке
-        if (deliveryType === 'delivery' && subtotal >= freeDeliveryFrom && freeDeliveryFrom > 0) {
+        if (deliveryType === 'delivery' && quote.subtotal >= freeDeliveryFrom && freeDeliveryFrom > 0) {
             const freeDeliveryInfo = document.getElementById('freeDeliveryInfo');
             if (freeDeliveryInfo) {
                 freeDeliveryInfo.textContent = `✓ Бесплатная доставка при заказе от ${freeDeliveryFrom} ₽`;
@@ -340,7 +398,6 @@ function goBack() {
 async function init() {
     await Promise.all([
         loadCart(),
-        loadSettings(),
         loadIntervals()
     ]);
     
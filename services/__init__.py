@@ -0,0 +1,129 @@
+"""Инициализация модуля services"""
+from .pricing import (
+    Quote, calculate_quote, get_pricing_settings, get_active_promo,
+    invalidate_pricing_cache, invalidate_promo_cache, redeem_promo
+)
+from .carts import (
+    unit_price, cart_etag, get_cart_version, bump_cart_version, bump_cart_versions, build_cart
+)
+from .order_numbers import allocate_order_number, format_order_number
+from .idempotency import request_scope, get_saved_response, save_response
+from .outbox import OutboxEventType, enqueue_event, wake_outbox, process_outbox_batch, outbox_loop
+from .order_events import (
+    hub as order_event_hub, publish_order_created, publish_order_status, order_event_stream,
+    publish_catalog_changed
+)
+from .batching import in_batches
+from .order_archive import archive_orders
+from .picklist import picklist_query, group_by_category, picklist_csv
+from .stats import (
+    record_order_created, record_status_change, rebuild_daily_stats, rebuild_customer_stats,
+    ensure_daily_stats, sales_totals, DashboardStats, dashboard_stats
+)
+from .stock import reserve_stock, release_stock, order_stock_lines, sync_availability, get_stock, set_stock
+from .catalog_io import ImportReport, read_csv_rows, read_jsonl_rows, import_products, export_products
+from .catalog_bulk import BulkResult, product_filter, build_changes, apply_bulk_changes
+from .order_board import prefix_match, order_search, status_counts, board_page, backfill_phone_digits
+from .order_export import export_query, export_chunks, orders_csv, orders_xlsx
+from .analytics import SalesSnapshot, snapshot as sales_snapshot, get_snapshot
+from .recommendations import (
+    CoOccurrenceIndex, index as recommendation_index, wake_recommendations, recommended_products,
+    recommendations_loop
+)
+from .popularity import PopularityCounter, counter as popularity_counter, ensure_popularity, popularity_loop
+from .scheduled_changes import (
+    ScheduleReport, parse_value, schedule_changes, pending_changes, apply_due_changes, preview_changes,
+    wake_scheduled_changes, scheduled_changes_loop
+)
+from .maintenance import MaintenanceReport, run_maintenance, maintenance_loop
+
+__all__ = [
+    'Quote',
+    'calculate_quote',
+    'get_pricing_settings',
+    'get_active_promo',
+    'invalidate_pricing_cache',
+    'invalidate_promo_cache',
+    'redeem_promo',
+    'unit_price',
+    'cart_etag',
+    'get_cart_version',
+    'bump_cart_version',
+    'bump_cart_versions',
+    'build_cart',
+    'allocate_order_number',
+    'format_order_number',
+    'request_scope',
+    'get_saved_response',
+    'save_response',
+    'OutboxEventType',
+    'enqueue_event',
+    'wake_outbox',
+    'process_outbox_batch',
+    'outbox_loop',
+    'order_event_hub',
+    'publish_order_created',
+    'publish_order_status',
+    'order_event_stream',
+    'publish_catalog_changed',
+    'in_batches',
+    'archive_orders',
+    'picklist_query',
+    'group_by_category',
+    'picklist_csv',
+    'record_order_created',
+    'record_status_change',
+    'rebuild_daily_stats',
+    'rebuild_customer_stats',
+    'ensure_daily_stats',
+    'sales_totals',
+    'DashboardStats',
+    'dashboard_stats',
+    'reserve_stock',
+    'release_stock',
+    'order_stock_lines',
+    'sync_availability',
+    'get_stock',
+    'set_stock',
+    'ImportReport',
+    'read_csv_rows',
+    'read_jsonl_rows',
+    'import_products',
+    'export_products',
+    'BulkResult',
+    'product_filter',
+    'build_changes',
+    'apply_bulk_changes',
+    'prefix_match',
+    'order_search',
+    'status_counts',
+    'board_page',
+    'backfill_phone_digits',
+    'export_query',
+    'export_chunks',
+    'orders_csv',
+    'orders_xlsx',
+    'SalesSnapshot',
+    'sales_snapshot',
+    'get_snapshot',
+    'CoOccurrenceIndex',
+    'recommendation_index',
+    'wake_recommendations',
+    'recommended_products',
+    'recommendations_loop',
+    'PopularityCounter',
+    'popularity_counter',
+    'ensure_popularity',
+    'popularity_loop',
+    'ScheduleReport',
+    'parse_value',
+    'schedule_changes',
+    'pending_changes',
+    'apply_due_changes',
+    'preview_changes',
+    'wake_scheduled_changes',
+    'scheduled_changes_loop',
+    'MaintenanceReport',
+    'run_maintenance',
+    'maintenance_loop'
+]
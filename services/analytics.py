@@ -0,0 +1,329 @@
+"""Аналитика продаж по колоночному снимку позиций заказов
+
+Позиции заказов (рабочих и архивных) один раз загружаются в память
+в виде массивов NumPy - по массиву на колонку: заказ, покупатель,
+товар, единица, день, день недели, час, количество, сумма. Дальше
+снимок догружается только новыми заказами (id больше водяного знака),
+а смена статусов подтягивается отдельным запросом по updated_at.
+
+Отчеты считаются векторными группировками по массивам (np.bincount,
+np.unique) - без отдельного SQL-запроса на каждый виджет. Категория
+берется по текущей категории товара, поэтому перенос товара в другую
+категорию сразу виден в отчетах. Отмененные заказы не учитываются.
+
+Сумма позиции - subtotal без доставки и скидки на заказ. Дни и часы
+считаются в часовом поясе магазина (ANALYTICS_UTC_OFFSET).
+"""
+import asyncio
+import time
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import select, case, cast, func, Integer
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import (
+    Order, OrderItem, ArchivedOrder, ArchivedOrderItem, Product, Category, OrderStatus, UnitType
+)
+from services.picklist import UNIT_NAMES, NO_CATEGORY
+from shared.config import settings
+
+
+# Коды единиц измерения в снимке
+UNIT_CODES = {unit.value: code for code, unit in enumerate(UnitType)}
+UNITS = [unit.value for unit in UnitType]
+
+# Строк в одной порции при загрузке
+LOAD_CHUNK_SIZE = 10000
+
+WEEKDAY_NAMES = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+
+# Колонки снимка и их типы
+COLUMNS = {
+    "order_id": np.int64,
+    "user_id": np.int64,
+    "product_id": np.int64,
+    "unit": np.int8,
+    "cancelled": np.bool_,
+    "day": np.int32,  # Дней с 1970-01-01 по времени магазина
+    "weekday": np.int8,  # 0 - понедельник
+    "hour": np.int8,
+    "quantity": np.float64,
+    "revenue": np.float64,
+}
+
+EPOCH = date(1970, 1, 1)
+
+
+def _day_number(day: date) -> int:
+    return (day - EPOCH).days
+
+
+class SalesSnapshot:
+    """Колоночный снимок позиций заказов и группировки по нему"""
+    
+    def __init__(self):
+        self.columns: Dict[str, np.ndarray] = {
+            name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()
+        }
+        self.watermark = 0  # Последний загруженный id заказа
+        self.synced_at: Optional[datetime] = None  # Последняя сверка статусов
+        self.refreshed_at = 0.0
+        self.product_category = np.full(1, -1, dtype=np.int64)
+        self.product_names: Dict[int, str] = {}
+        self.category_names: Dict[int, str] = {}
+        self._lock = asyncio.Lock()
+    
+    @property
+    def size(self) -> int:
+        return len(self.columns["order_id"])
+    
+    # ==================== ЗАГРУЗКА ====================
+    
+    def append(self, order_id, user_id, product_id, unit, cancelled, created_ts, quantity, revenue):
+        """Добавить позиции (массивы одинаковой длины); created_ts - секунды UTC"""
+        local = np.asarray(created_ts, dtype=np.int64) + settings.ANALYTICS_UTC_OFFSET * 3600
+        days = local // 86400
+        chunk = {
+            "order_id": order_id,
+            "user_id": user_id,
+            "product_id": product_id,
+            "unit": unit,
+            "cancelled": cancelled,
+            "day": days,
+            # 1970-01-01 - четверг
+            "weekday": (days + 3) % 7,
+            "hour": (local % 86400) // 3600,
+            "quantity": quantity,
+            "revenue": revenue,
+        }
+        for name, dtype in COLUMNS.items():
+            self.columns[name] = np.concatenate(
+                (self.columns[name], np.asarray(chunk[name], dtype=dtype))
+            )
+        if len(order_id):
+            self.watermark = max(self.watermark, int(np.max(order_id)))
+    
+    async def _load_lines(self, session: AsyncSession, order_model, item_model, after_id: int) -> List[np.ndarray]:
+        """Позиции заказов с id > after_id порциями (строки - массивы из 8 чисел)"""
+        created_ts = cast(func.strftime("%s", order_model.created_at), Integer)
+        unit_code = case(
+            *((item_model.unit == unit, code) for unit, code in UNIT_CODES.items()),
+            else_=0
+        )
+        query = (
+            select(
+                item_model.order_id,
+                order_model.user_id,
+                item_model.product_id,
+                unit_code,
+                case((order_model.status == OrderStatus.CANCELLED.value, 1), else_=0),
+                created_ts,
+                item_model.quantity,
+                item_model.subtotal
+            )
+            .join(order_model, order_model.id == item_model.order_id)
+            .where(order_model.id > after_id)
+            .execution_options(yield_per=LOAD_CHUNK_SIZE)
+        )
+        
+        chunks = []
+        result = await session.stream(query)
+        async for partition in result.partitions():
+            chunks.append(np.array(partition, dtype=np.float64))
+        return chunks
+    
+    async def _sync_statuses(self, session: AsyncSession, since: datetime):
+        """Отметить отмену (и снятие отмены) заказов, измененных после since"""
+        result = await session.execute(
+            select(Order.id, Order.status)
+            .where(Order.updated_at >= since)
+            .where(Order.id <= self.watermark)
+        )
+        changed = result.all()
+        if not changed:
+            return
+        
+        ids = np.array([order_id for order_id, _ in changed], dtype=np.int64)
+        cancelled_ids = np.array(
+            [order_id for order_id, status in changed if status == OrderStatus.CANCELLED.value],
+            dtype=np.int64
+        )
+        touched = np.isin(self.columns["order_id"], ids)
+        self.columns["cancelled"][touched] = np.isin(self.columns["order_id"][touched], cancelled_ids)
+    
+    async def _load_catalog(self, session: AsyncSession):
+        result = await session.execute(select(Product.id, Product.category_id, Product.name))
+        products = result.all()
+        
+        size = max([product_id for product_id, _, _ in products] + [0]) + 1
+        lookup = np.full(size, -1, dtype=np.int64)
+        for product_id, category_id, _ in products:
+            lookup[product_id] = category_id if category_id is not None else -1
+        self.product_category = lookup
+        self.product_names = {product_id: name for product_id, _, name in products}
+        
+        result = await session.execute(select(Category.id, Category.name))
+        self.category_names = dict(result.all())
+    
+    async def refresh(self, session: AsyncSession, force: bool = False):
+        """Догрузить новые заказы и статусы (не чаще ANALYTICS_REFRESH_INTERVAL)"""
+        async with self._lock:
+            fresh = time.monotonic() - self.refreshed_at < settings.ANALYTICS_REFRESH_INTERVAL
+            if not force and self.synced_at is not None and fresh:
+                return
+            
+            started_at = datetime.utcnow()
+            if self.synced_at is None:
+                # Первая загрузка: архив и рабочие заказы целиком
+                chunks = await self._load_lines(session, ArchivedOrder, ArchivedOrderItem, 0)
+                chunks += await self._load_lines(session, Order, OrderItem, 0)
+            else:
+                await self._sync_statuses(session, self.synced_at)
+                chunks = await self._load_lines(session, Order, OrderItem, self.watermark)
+            
+            # Массивы снимка копируются один раз на обновление, а не на порцию
+            if chunks:
+                rows = np.concatenate(chunks)
+                self.append(*(rows[:, index] for index in range(rows.shape[1])))
+            
+            await self._load_catalog(session)
+            self.synced_at = started_at
+            self.refreshed_at = time.monotonic()
+    
+    # ==================== ГРУППИРОВКИ ====================
+    
+    def _mask(self, date_from: Optional[date], date_to: Optional[date]) -> np.ndarray:
+        mask = ~self.columns["cancelled"]
+        if date_from:
+            mask &= self.columns["day"] >= _day_number(date_from)
+        if date_to:
+            mask &= self.columns["day"] <= _day_number(date_to)
+        return mask
+    
+    def _categories(self, product_ids: np.ndarray) -> np.ndarray:
+        lookup = self.product_category
+        known = product_ids < len(lookup)
+        return np.where(known, lookup[np.where(known, product_ids, 0)], -1)
+    
+    def top_products(
+        self,
+        limit: int = 20,
+        by: str = "revenue",
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None
+    ) -> List[dict]:
+        """Товары с наибольшей выручкой (или количеством), по единицам измерения"""
+        mask = self._mask(date_from, date_to)
+        key = self.columns["product_id"][mask] * len(UNITS) + self.columns["unit"][mask]
+        if not len(key):
+            return []
+        
+        revenue = np.bincount(key, weights=self.columns["revenue"][mask])
+        quantity = np.bincount(key, weights=self.columns["quantity"][mask])
+        lines = np.bincount(key)
+        
+        ranked = revenue if by == "revenue" else quantity
+        present = np.flatnonzero(lines)
+        top = present[np.argsort(-ranked[present], kind="stable")[:limit]]
+        
+        return [
+            {
+                "product_id": int(index // len(UNITS)),
+                "product_name": self.product_names.get(int(index // len(UNITS)), f"Товар #{index // len(UNITS)}"),
+                "unit": UNITS[index % len(UNITS)],
+                "unit_name": UNIT_NAMES.get(UNITS[index % len(UNITS)]),
+                "revenue": round(float(revenue[index]), 2),
+                "quantity": round(float(quantity[index]), 3),
+                "lines": int(lines[index])
+            }
+            for index in top
+        ]
+    
+    def category_revenue(self, date_from: Optional[date] = None, date_to: Optional[date] = None) -> List[dict]:
+        """Выручка и число позиций по категориям, по убыванию выручки"""
+        mask = self._mask(date_from, date_to)
+        # -1 (без категории) сдвигается в 0
+        key = self._categories(self.columns["product_id"][mask]) + 1
+        if not len(key):
+            return []
+        
+        revenue = np.bincount(key, weights=self.columns["revenue"][mask])
+        lines = np.bincount(key)
+        present = np.flatnonzero(lines)
+        ordered = present[np.argsort(-revenue[present], kind="stable")]
+        
+        return [
+            {
+                "category_id": int(index - 1) if index else None,
+                "category_name": self.category_names.get(int(index - 1), NO_CATEGORY),
+                "revenue": round(float(revenue[index]), 2),
+                "lines": int(lines[index])
+            }
+            for index in ordered
+        ]
+    
+    def _by_slot(self, column: str, slots: int, date_from, date_to) -> tuple:
+        mask = self._mask(date_from, date_to)
+        key = self.columns[column][mask].astype(np.int64)
+        revenue = np.bincount(key, weights=self.columns["revenue"][mask], minlength=slots)
+        orders = np.zeros(slots, dtype=np.int64)
+        if len(key):
+            # Заказ считается один раз: его позиции попадают в один слот
+            _, first = np.unique(self.columns["order_id"][mask], return_index=True)
+            orders = np.bincount(key[first], minlength=slots)
+        return revenue, orders
+    
+    def by_weekday(self, date_from: Optional[date] = None, date_to: Optional[date] = None) -> List[dict]:
+        """Выручка и заказы по дням недели"""
+        revenue, orders = self._by_slot("weekday", 7, date_from, date_to)
+        return [
+            {"weekday": day, "name": WEEKDAY_NAMES[day], "revenue": round(float(revenue[day]), 2), "orders": int(orders[day])}
+            for day in range(7)
+        ]
+    
+    def by_hour(self, date_from: Optional[date] = None, date_to: Optional[date] = None) -> List[dict]:
+        """Выручка и заказы по часам"""
+        revenue, orders = self._by_slot("hour", 24, date_from, date_to)
+        return [
+            {"hour": hour, "revenue": round(float(revenue[hour]), 2), "orders": int(orders[hour])}
+            for hour in range(24)
+        ]
+    
+    def basket_metrics(self, date_from: Optional[date] = None, date_to: Optional[date] = None) -> dict:
+        """Средний чек, позиций в заказе и доля повторных покупателей"""
+        mask = self._mask(date_from, date_to)
+        order_ids = self.columns["order_id"][mask]
+        if not len(order_ids):
+            return {
+                "orders": 0, "customers": 0, "revenue": 0.0, "average_basket": 0.0,
+                "average_lines": 0.0, "repeat_customers": 0, "repeat_customer_rate": 0.0
+            }
+        
+        orders, first, order_index = np.unique(order_ids, return_index=True, return_inverse=True)
+        order_revenue = np.bincount(order_index, weights=self.columns["revenue"][mask])
+        order_lines = np.bincount(order_index)
+        
+        _, orders_per_customer = np.unique(self.columns["user_id"][mask][first], return_counts=True)
+        repeat = int(np.count_nonzero(orders_per_customer > 1))
+        
+        return {
+            "orders": len(orders),
+            "customers": len(orders_per_customer),
+            "revenue": round(float(order_revenue.sum()), 2),
+            "average_basket": round(float(order_revenue.mean()), 2),
+            "average_lines": round(float(order_lines.mean()), 2),
+            "repeat_customers": repeat,
+            "repeat_customer_rate": round(repeat / len(orders_per_customer), 4)
+        }
+
+
+# Снимок процесса API
+snapshot = SalesSnapshot()
+
+
+async def get_snapshot(session: AsyncSession) -> SalesSnapshot:
+    """Снимок, догруженный до текущего состояния"""
+    await snapshot.refresh(session)
+    return snapshot
@@ -0,0 +1,37 @@
+"""Обход больших выборок пачками для фоновых задач
+
+Пачка - MAINTENANCE_BATCH_SIZE строк, каждая обрабатывается в своей
+короткой транзакции: SQLite держит блокировку на запись только пока
+идет пачка, и запросы API проходят между пачками.
+"""
+from typing import AsyncIterator, List
+
+from sqlalchemy import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import ColumnElement, Select
+
+from shared.config import settings
+
+
+async def in_batches(session: AsyncSession, query: Select, key: ColumnElement) -> AsyncIterator[List[Row]]:
+    """Строки query пачками по возрастанию key; коммит - после обработки каждой пачки
+    
+    key должен быть среди колонок query. Следующая пачка начинается после
+    последнего key предыдущей, так что строки, которые обработка оставила
+    подходящими под выборку, второй раз не попадут. Если обработка пачки
+    упала, коммита не будет.
+    """
+    last_key = None
+    while True:
+        batch_query = query.order_by(key).limit(settings.MAINTENANCE_BATCH_SIZE)
+        if last_key is not None:
+            batch_query = batch_query.where(key > last_key)
+        
+        result = await session.execute(batch_query)
+        rows = result.all()
+        if not rows:
+            return
+        
+        yield rows
+        await session.commit()
+        last_key = rows[-1]._mapping[key]
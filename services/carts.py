@@ -0,0 +1,103 @@
+"""Состояние корзины: версии и сборка ответа
+
+Версия корзины - монотонный счетчик на пользователя, который
+увеличивается при каждом изменении корзины. Используется как ETag
+для условных запросов GET /api/cart/{telegram_id}.
+"""
+from typing import Iterable, List, Optional
+
+from sqlalchemy import select, case
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from database.models import CartItem, CartVersion, Product
+
+
+def unit_price(unit_column):
+    """Текущая цена товара для единицы измерения (SQL-выражение)"""
+    return case(
+        (unit_column == "kg", Product.price_kg),
+        (unit_column == "piece", Product.price_piece),
+        (unit_column == "package", Product.price_package),
+        (unit_column == "box", Product.price_box),
+    )
+
+
+def cart_etag(version: int) -> str:
+    """ETag для версии корзины"""
+    return f'"cart-{version}"'
+
+
+async def get_cart_version(session: AsyncSession, user_id: int) -> int:
+    """Текущая версия корзины (0, если корзина еще не менялась)"""
+    result = await session.execute(
+        select(CartVersion.version).where(CartVersion.user_id == user_id)
+    )
+    return result.scalar_one_or_none() or 0
+
+
+async def bump_cart_version(session: AsyncSession, user_id: int) -> int:
+    """Увеличить версию корзины пользователя и вернуть новое значение"""
+    result = await session.execute(
+        sqlite_insert(CartVersion)
+        .values(user_id=user_id, version=1)
+        .on_conflict_do_update(
+            index_elements=["user_id"],
+            set_={"version": CartVersion.version + 1}
+        )
+        .returning(CartVersion.version)
+    )
+    return result.scalar_one()
+
+
+async def bump_cart_versions(session: AsyncSession, user_ids: Iterable[int]):
+    """Увеличить версии корзин нескольких пользователей одним запросом"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    
+    await session.execute(
+        sqlite_insert(CartVersion)
+        .values([{"user_id": user_id, "version": 1} for user_id in user_ids])
+        .on_conflict_do_update(
+            index_elements=["user_id"],
+            set_={"version": CartVersion.version + 1}
+        )
+    )
+
+
+async def build_cart(session: AsyncSession, user_id: int) -> List[dict]:
+    """Собрать содержимое корзины (позиции и товары одним запросом, изображения - вторым)"""
+    result = await session.execute(
+        select(CartItem, Product)
+        .join(Product, Product.id == CartItem.product_id)
+        .options(selectinload(Product.images))
+        .where(CartItem.user_id == user_id)
+        .order_by(CartItem.id)
+    )
+    
+    items = []
+    for item, product in result.all():
+        # Получаем главное изображение
+        main_image: Optional[str] = None
+        if product.images:
+            for img in product.images:
+                if img.is_main:
+                    main_image = img.image_url
+                    break
+            if not main_image:
+                main_image = product.images[0].image_url
+        
+        items.append({
+            "id": item.id,
+            "product_id": item.product_id,
+            "product_name": product.name,
+            "quantity": item.quantity,
+            "unit": item.unit,
+            "price_per_unit": item.price_per_unit,
+            "total": item.quantity * item.price_per_unit,
+            "product_image": main_image
+        })
+    
+    return items
@@ -0,0 +1,152 @@
+"""Массовые изменения каталога одним UPDATE
+
+Наценка или скидка на цены (в процентах или на сумму), скидки, бейдж,
+перенос в другую категорию и порядок сортировки применяются к набору
+товаров, заданному списком id и/или фильтром, одним оператором
+UPDATE ... WHERE. В режиме предпросмотра тот же набор выражений
+считается через SELECT - видно цены до и после, ничего не меняется.
+
+После изменения публикуется одно событие catalog_changed на всю
+операцию, а не по событию на товар.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, update, func, case, and_, true, literal
+from sqlalchemy.sql.expression import ColumnElement
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Product
+
+
+# Колонки цен, к которым применяется изменение цены
+PRICE_COLUMNS = ("price_kg", "price_piece", "price_package", "price_box", "price_multi")
+
+# Поля, которые задаются значением как есть
+PLAIN_FIELDS = ("discount_percent", "discount_fixed", "badge", "category_id", "sort_order")
+
+# Строк в предпросмотре
+PREVIEW_LIMIT = 100
+
+
+@dataclass
+class BulkResult:
+    """Итоги массовой операции"""
+    matched: int = 0
+    updated: int = 0
+    dry_run: bool = False
+    non_positive_prices: int = 0
+    preview: List[dict] = field(default_factory=list)
+    
+    def as_dict(self) -> dict:
+        return {
+            "matched": self.matched,
+            "updated": self.updated,
+            "dry_run": self.dry_run,
+            "non_positive_prices": self.non_positive_prices,
+            "preview": self.preview
+        }
+
+
+def product_filter(
+    product_ids: Optional[List[int]] = None,
+    category_id: Optional[int] = None,
+    is_active: Optional[bool] = None
+):
+    """Условие WHERE для набора товаров"""
+    conditions = []
+    if product_ids is not None:
+        conditions.append(Product.id.in_(product_ids))
+    if category_id is not None:
+        conditions.append(Product.category_id == category_id)
+    if is_active is not None:
+        conditions.append(Product.is_active == is_active)
+    return and_(true(), *conditions)
+
+
+def build_changes(changes: dict, order_ids: Optional[List[int]] = None) -> Dict[str, object]:
+    """Колонка -> новое значение (SQL-выражение от текущего)
+    
+    changes - переданные поля схемы операции: price_percent/price_delta
+    с price_units, поля из PLAIN_FIELDS и reorder. При reorder
+    sort_order выставляется по позиции товара в order_ids.
+    """
+    values = {}
+    
+    price_units = changes.get("price_units") or PRICE_COLUMNS
+    if changes.get("price_percent") is not None:
+        factor = 1 + changes["price_percent"] / 100
+        for name in price_units:
+            column = Product.__table__.c[name]
+            values[name] = func.round(column * factor, 2)
+    elif changes.get("price_delta") is not None:
+        for name in price_units:
+            column = Product.__table__.c[name]
+            values[name] = func.round(column + changes["price_delta"], 2)
+    
+    for name in PLAIN_FIELDS:
+        if name in changes:
+            values[name] = changes[name]
+    
+    if changes.get("reorder") and order_ids:
+        values["sort_order"] = case(
+            {product_id: position for position, product_id in enumerate(order_ids)},
+            value=Product.id,
+            else_=Product.sort_order
+        )
+    
+    return values
+
+
+async def apply_bulk_changes(
+    session: AsyncSession,
+    where,
+    values: Dict[str, object],
+    dry_run: bool = False
+) -> BulkResult:
+    """Применить изменения к товарам под where (или показать, что изменится)
+    
+    Если после изменения какая-то цена станет нулевой или отрицательной,
+    ничего не меняется - в результате non_positive_prices > 0.
+    """
+    result = BulkResult(dry_run=dry_run)
+    
+    # Сколько товаров попадает и сколько из них получат неположительную цену
+    counters = [func.count()]
+    non_positive = None
+    for name in PRICE_COLUMNS:
+        if name in values:
+            condition = values[name] <= 0
+            non_positive = condition if non_positive is None else non_positive | condition
+    if non_positive is not None:
+        counters.append(func.coalesce(func.sum(case((non_positive, 1), else_=0)), 0))
+    
+    row = (await session.execute(select(*counters).select_from(Product).where(where))).one()
+    result.matched = row[0]
+    result.non_positive_prices = row[1] if non_positive is not None else 0
+    
+    if dry_run:
+        columns = [Product.id, Product.name]
+        for name, value in values.items():
+            columns.append(Product.__table__.c[name].label(f"{name}_before"))
+            columns.append(
+                (value if isinstance(value, ColumnElement) else literal(value)).label(f"{name}_after")
+            )
+        rows = await session.execute(
+            select(*columns).where(where).order_by(Product.id).limit(PREVIEW_LIMIT)
+        )
+        result.preview = [dict(row._mapping) for row in rows]
+        return result
+    
+    if result.non_positive_prices or not result.matched:
+        return result
+    
+    updated = await session.execute(
+        update(Product)
+        .where(where)
+        .values(**values, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    result.updated = updated.rowcount
+    return result
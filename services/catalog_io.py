@@ -0,0 +1,287 @@
+"""Массовая загрузка и выгрузка каталога (CSV и JSON Lines)
+
+Файл читается построчно, каждая строка проверяется схемой товара
+из админки. Строка с id обновляет товар (меняются только переданные
+поля), строка без id создает новый. Проверенные строки копятся
+и записываются пачками по CATALOG_IMPORT_BATCH_SIZE: один upsert
+(INSERT ... ON CONFLICT(id) DO UPDATE) на пачку и коммит на пачку.
+Ошибочные строки не прерывают загрузку - они попадают в отчет
+с номером строки файла. Если файл обрывается или пачка не записалась,
+загрузка останавливается, а отчет говорит, до какой строки файла
+изменения уже сохранены (committed_through_row) и дошла ли загрузка
+до конца (complete).
+
+Выгрузка отдает товары потоком из курсора, не собирая таблицу в памяти.
+Формат CSV тот же, что принимает загрузка: разделитель ";",
+граммовки через запятую, пустая ячейка - пустое значение.
+"""
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import AsyncIterator, BinaryIO, Iterator, List, Tuple, Type, Union
+
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.database import async_session_maker
+from database.models import Product, Category
+from services.stock import sync_availability
+from shared.config import settings
+from shared.csv_stream import csv_header, csv_rows
+
+
+# Больше ошибок в отчет не попадает - только их количество
+MAX_REPORTED_ERRORS = 500
+
+# Номер строки файла и ее поля (или ошибка разбора)
+RawRow = Tuple[int, Union[dict, ValueError]]
+
+
+@dataclass
+class ImportReport:
+    """Итоги загрузки каталога"""
+    processed: int = 0
+    created: int = 0
+    updated: int = 0
+    failed: int = 0
+    errors: List[dict] = field(default_factory=list)
+    batches_committed: int = 0
+    committed_through_row: int = 0  # Последняя строка файла в сохраненных пачках
+    complete: bool = True
+    
+    def add_error(self, row: int, messages: List[str]):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "errors": messages})
+    
+    def as_dict(self) -> dict:
+        return {
+            "processed": self.processed,
+            "created": self.created,
+            "updated": self.updated,
+            "failed": self.failed,
+            "errors": sorted(self.errors, key=lambda error: error["row"]),
+            "errors_truncated": self.failed > len(self.errors),
+            "batches_committed": self.batches_committed,
+            "committed_through_row": self.committed_through_row,
+            "complete": self.complete
+        }
+
+
+# ==================== ЧТЕНИЕ ФАЙЛА ====================
+
+def _text(file: BinaryIO) -> io.TextIOWrapper:
+    # utf-8-sig - файлы из Excel начинаются с BOM
+    return io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+
+
+def read_csv_rows(file: BinaryIO, schema: Type[BaseModel]) -> Iterator[RawRow]:
+    """Строки CSV как словари полей схемы"""
+    fields = schema.model_fields
+    reader = csv.DictReader(_text(file), delimiter=";")
+    
+    for row in reader:
+        data = {}
+        for name, value in row.items():
+            if name is None or (name != "id" and name not in fields):
+                continue
+            value = (value or "").strip()
+            
+            if value == "":
+                # Пустая ячейка очищает необязательное поле, остальные не трогает
+                if name != "id" and not fields[name].is_required() and fields[name].default is None:
+                    data[name] = None
+                continue
+            
+            if name == "available_weights":
+                data[name] = [part.strip() for part in value.split(",") if part.strip()]
+            else:
+                data[name] = value
+        
+        # Строка 1 - заголовок
+        yield reader.line_num, data
+
+
+def read_jsonl_rows(file: BinaryIO) -> Iterator[RawRow]:
+    """Строки JSON Lines; пустые строки пропускаются"""
+    for line_num, line in enumerate(_text(file), 1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_num, ValueError(f"Некорректный JSON: {e.msg}")
+            continue
+        
+        if not isinstance(data, dict):
+            yield line_num, ValueError("Ожидался JSON-объект")
+            continue
+        
+        yield line_num, data
+
+
+# ==================== ЗАГРУЗКА ====================
+
+def _validation_messages(error: ValidationError) -> List[str]:
+    return [
+        f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}"
+        for item in error.errors()
+    ]
+
+
+async def _write_batch(session: AsyncSession, batch: List[Tuple[int, dict]], report: ImportReport):
+    """Записать пачку проверенных строк и закоммитить"""
+    # Категории пачки - одним запросом
+    category_ids = {values["category_id"] for _, values in batch if "category_id" in values}
+    result = await session.execute(
+        select(Category.id).where(Category.id.in_(category_ids))
+    )
+    known_categories = set(result.scalars().all())
+    
+    rows = []
+    for row_num, values in batch:
+        if "category_id" in values and values["category_id"] not in known_categories:
+            report.add_error(row_num, [f"category_id: категория {values['category_id']} не найдена"])
+            continue
+        rows.append(values)
+    
+    if not rows:
+        return
+    
+    product_ids = [values["id"] for values in rows if values["id"] is not None]
+    existing = set()
+    if product_ids:
+        result = await session.execute(
+            select(Product.id).where(Product.id.in_(product_ids))
+        )
+        existing = set(result.scalars().all())
+    
+    # executemany требует одинаковых ключей - группируем по набору полей
+    groups = {}
+    for values in rows:
+        groups.setdefault(tuple(sorted(values)), []).append(values)
+    
+    for keys, group in groups.items():
+        insert_stmt = sqlite_insert(Product)
+        set_ = {key: insert_stmt.excluded[key] for key in keys if key != "id"}
+        set_["updated_at"] = datetime.utcnow()
+        await session.execute(
+            insert_stmt.on_conflict_do_update(index_elements=["id"], set_=set_),
+            group
+        )
+    
+    # Доступность товаров с учетом остатков остается за складом
+    await sync_availability(session, existing)
+    await session.commit()
+    
+    updated = sum(1 for values in rows if values["id"] in existing)
+    report.updated += updated
+    report.created += len(rows) - updated
+
+
+async def _commit_batch(session: AsyncSession, batch: List[Tuple[int, dict]], report: ImportReport) -> bool:
+    """Записать пачку и отметить ее в отчете; False - пачка не записалась"""
+    try:
+        await _write_batch(session, batch, report)
+    except SQLAlchemyError as e:
+        await session.rollback()
+        report.add_error(batch[0][0], [f"Строки {batch[0][0]}-{batch[-1][0]} не сохранены: {e.__class__.__name__}"])
+        report.complete = False
+        return False
+    
+    report.batches_committed += 1
+    report.committed_through_row = batch[-1][0]
+    return True
+
+
+async def import_products(
+    session: AsyncSession,
+    rows: Iterator[RawRow],
+    schema: Type[BaseModel]
+) -> ImportReport:
+    """Загрузить товары из строк файла пачками"""
+    report = ImportReport()
+    batch: List[Tuple[int, dict]] = []
+    last_row = 0
+    
+    try:
+        for row_num, data in rows:
+            last_row = row_num
+            report.processed += 1
+            
+            if isinstance(data, ValueError):
+                report.add_error(row_num, [str(data)])
+                continue
+            
+            product_id = data.pop("id", None)
+            try:
+                product_id = int(product_id) if product_id is not None else None
+                if product_id is not None and product_id <= 0:
+                    raise ValueError
+            except (TypeError, ValueError):
+                report.add_error(row_num, ["id: должен быть положительным целым"])
+                continue
+            
+            try:
+                values = schema(**data).dict(exclude_unset=True)
+            except ValidationError as e:
+                report.add_error(row_num, _validation_messages(e))
+                continue
+            
+            values["id"] = product_id
+            batch.append((row_num, values))
+            
+            if len(batch) >= settings.CATALOG_IMPORT_BATCH_SIZE:
+                if not await _commit_batch(session, batch, report):
+                    return report
+                batch = []
+    except (UnicodeDecodeError, csv.Error) as e:
+        # Дальше файл не разобрать; уже прочитанное сохраняем
+        report.add_error(last_row + 1, [f"Файл не читается дальше этой строки: {e}"])
+        report.complete = False
+    
+    if batch:
+        await _commit_batch(session, batch, report)
+    
+    return report
+
+
+# ==================== ВЫГРУЗКА ====================
+
+def _csv_cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, list):
+        return ",".join(str(item) for item in value)
+    return str(value)
+
+
+async def export_products(schema: Type[BaseModel], format: str = "csv") -> AsyncIterator[str]:
+    """Все товары построчно в CSV или JSON Lines (для StreamingResponse)
+    
+    Курсор читает в отдельной сессии, открытой на все время скачивания файла.
+    """
+    columns = ["id"] + list(schema.model_fields)
+    query = (
+        select(*(Product.__table__.c[name] for name in columns))
+        .order_by(Product.id)
+        .execution_options(yield_per=settings.CATALOG_IMPORT_BATCH_SIZE)
+    )
+    
+    if format == "csv":
+        yield csv_header(columns)
+    
+    async with async_session_maker() as session:
+        result = await session.stream(query)
+        async for row in result:
+            if format == "csv":
+                yield csv_rows([[_csv_cell(value) for value in row]])
+            else:
+                yield json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n"
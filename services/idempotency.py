@@ -0,0 +1,63 @@
+"""Ключи идемпотентности (заголовок Idempotency-Key)
+
+Успешный ответ сохраняется в той же транзакции, что и само изменение.
+Повтор запроса с тем же ключом возвращает сохраненный ответ одним
+поиском по первичному ключу, не выполняя операцию заново.
+Ошибки не сохраняются - такой запрос можно повторить с тем же ключом.
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import IdempotencyKey
+from shared.config import settings
+
+
+def request_scope(request: Request) -> str:
+    """Область действия ключа: метод и путь запроса"""
+    return f"{request.method} {request.url.path}"
+
+
+async def get_saved_response(session: AsyncSession, key: str, scope: str) -> Optional[JSONResponse]:
+    """Сохраненный ответ для ключа или None"""
+    result = await session.execute(
+        select(IdempotencyKey.status_code, IdempotencyKey.response)
+        .where(IdempotencyKey.key == key)
+        .where(IdempotencyKey.scope == scope)
+    )
+    row = result.one_or_none()
+    
+    if not row:
+        return None
+    
+    status_code, body = row
+    return JSONResponse(content=body, status_code=status_code, headers={"Idempotent-Replay": "true"})
+
+
+async def save_response(session: AsyncSession, key: str, scope: str, body: dict, status_code: int = 200) -> bool:
+    """Сохранить ответ в текущей транзакции
+    
+    Возвращает False, если ключ уже занят параллельным запросом -
+    тогда вызывающий должен откатить транзакцию и отдать сохраненный ответ.
+    """
+    result = await session.execute(
+        sqlite_insert(IdempotencyKey)
+        .values(key=key, scope=scope, status_code=status_code, response=body)
+        .on_conflict_do_nothing(index_elements=["key", "scope"])
+    )
+    return result.rowcount == 1
+
+
+async def purge_expired_keys(session: AsyncSession) -> int:
+    """Удалить ключи старше IDEMPOTENCY_TTL_HOURS"""
+    cutoff = datetime.utcnow() - timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS)
+    result = await session.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.created_at < cutoff)
+    )
+    await session.commit()
+    return result.rowcount
@@ -0,0 +1,146 @@
+"""Обслуживание данных: корзины, цены, старые ключи и события, архив заказов
+
+Фоновая задача внутри процесса API. Брошенной считается корзина,
+в которую пользователь ничего не добавлял дольше CART_TTL_DAYS.
+Такие корзины удаляются (или переносятся в архив) пачками
+(services.batching), чтобы не держать блокировку SQLite долго.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, delete, update, insert, func, and_, literal
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.database import async_session_maker
+from database.models import CartItem, ArchivedCartItem, Product
+from services.batching import in_batches
+from services.carts import bump_cart_versions, unit_price
+from services.idempotency import purge_expired_keys
+from services.order_archive import archive_orders
+from services.outbox import purge_sent_events
+from shared.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MaintenanceReport:
+    """Итоги прохода обслуживания"""
+    carts_removed: int = 0
+    cart_items_removed: int = 0
+    cart_items_archived: int = 0
+    prices_refreshed: int = 0
+    idempotency_keys_removed: int = 0
+    outbox_events_removed: int = 0
+    orders_archived: int = 0
+    order_items_archived: int = 0
+    
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+# Текущая цена товара для единицы измерения позиции корзины
+current_unit_price = unit_price(CartItem.unit)
+
+
+async def purge_abandoned_carts(session: AsyncSession, report: MaintenanceReport):
+    """Удалить (или архивировать) корзины старше CART_TTL_DAYS"""
+    cutoff = datetime.utcnow() - timedelta(days=settings.CART_TTL_DAYS)
+    
+    # Пользователи, у которых последнее добавление в корзину старше порога
+    abandoned_users = (
+        select(CartItem.user_id)
+        .group_by(CartItem.user_id)
+        .having(func.max(CartItem.created_at) < cutoff)
+    )
+    
+    async for rows in in_batches(session, abandoned_users, CartItem.user_id):
+        batch = [row.user_id for row in rows]
+        
+        # Порог проверяется заново в самих запросах: пока шла выборка,
+        # пользователь мог положить товар, и его корзина уже не брошена
+        abandoned = (
+            select(CartItem.user_id)
+            .where(CartItem.user_id.in_(batch))
+            .group_by(CartItem.user_id)
+            .having(func.max(CartItem.created_at) < cutoff)
+        )
+        
+        if settings.CART_ARCHIVE:
+            result = await session.execute(
+                insert(ArchivedCartItem).from_select(
+                    ["user_id", "product_id", "quantity", "unit", "price_per_unit", "created_at", "archived_at"],
+                    select(
+                        CartItem.user_id,
+                        CartItem.product_id,
+                        CartItem.quantity,
+                        CartItem.unit,
+                        CartItem.price_per_unit,
+                        CartItem.created_at,
+                        literal(datetime.utcnow())
+                    ).where(CartItem.user_id.in_(abandoned))
+                )
+            )
+            report.cart_items_archived += result.rowcount
+        
+        result = await session.execute(
+            delete(CartItem)
+            .where(CartItem.user_id.in_(abandoned))
+            .returning(CartItem.user_id)
+        )
+        removed = result.scalars().all()
+        removed_users = set(removed)
+        report.cart_items_removed += len(removed)
+        report.carts_removed += len(removed_users)
+        await bump_cart_versions(session, removed_users)
+
+
+async def refresh_cart_prices(session: AsyncSession, report: MaintenanceReport):
+    """Обновить цены в корзинах по текущим ценам товаров одним UPDATE"""
+    stale = and_(
+        CartItem.product_id == Product.id,
+        current_unit_price.is_not(None),
+        CartItem.price_per_unit != current_unit_price
+    )
+    
+    # Корзины этих пользователей изменятся - сбрасываем их версии
+    result = await session.execute(
+        select(CartItem.user_id).where(stale).distinct()
+    )
+    await bump_cart_versions(session, result.scalars().all())
+    
+    result = await session.execute(
+        update(CartItem)
+        .where(stale)
+        .values(price_per_unit=current_unit_price)
+        .execution_options(synchronize_session=False)
+    )
+    report.prices_refreshed = result.rowcount
+    await session.commit()
+
+
+async def run_maintenance() -> MaintenanceReport:
+    """Один проход обслуживания"""
+    report = MaintenanceReport()
+    
+    async with async_session_maker() as session:
+        await purge_abandoned_carts(session, report)
+        await refresh_cart_prices(session, report)
+        report.idempotency_keys_removed = await purge_expired_keys(session)
+        report.outbox_events_removed = await purge_sent_events(session)
+        report.orders_archived, report.order_items_archived = await archive_orders(session)
+    
+    logger.info("Обслуживание корзин: %s", report.as_dict())
+    return report
+
+
+async def maintenance_loop():
+    """Периодический запуск обслуживания"""
+    while True:
+        try:
+            await run_maintenance()
+        except Exception:
+            logger.exception("Ошибка обслуживания корзин")
+        await asyncio.sleep(settings.MAINTENANCE_INTERVAL)
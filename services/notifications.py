@@ -0,0 +1,113 @@
+"""Уведомления о заказах через Telegram бота
+
+Обработчики событий очереди (см. services.outbox). Каждый получает бота,
+сессию БД и payload события; исключение означает неудачную доставку,
+и событие будет повторено позже. Одно событие - одно сообщение,
+чтобы повтор не дублировал уже доставленное.
+"""
+from html import escape
+from typing import Optional
+
+from aiogram import Bot
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from database.models import Order, User, OrderStatus
+from shared.config import settings
+
+
+STATUS_NAMES = {
+    OrderStatus.NEW.value: "Новый",
+    OrderStatus.CONFIRMED.value: "Подтверждён",
+    OrderStatus.PREPARING.value: "Готовится",
+    OrderStatus.READY.value: "Готов",
+    OrderStatus.DELIVERING.value: "Доставляется",
+    OrderStatus.COMPLETED.value: "Выполнен",
+    OrderStatus.CANCELLED.value: "Отменён",
+}
+
+DELIVERY_NAMES = {
+    "delivery": "🚚 Доставка",
+    "pickup": "🏪 Самовывоз",
+}
+
+
+async def _load_order(session: AsyncSession, order_id: int) -> Optional[tuple]:
+    """Заказ с позициями и telegram_id покупателя"""
+    result = await session.execute(
+        select(Order, User.telegram_id)
+        .join(User, User.id == Order.user_id)
+        .where(Order.id == order_id)
+        .options(selectinload(Order.items))
+    )
+    return result.one_or_none()
+
+
+def format_admin_order(order: Order) -> str:
+    """Текст уведомления администратору о новом заказе
+    
+    Бот шлет HTML - все, что ввел покупатель, экранируется.
+    """
+    text = (
+        f"🆕 <b>Новый заказ #{order.order_number}</b>\n\n"
+        f"👤 {escape(order.customer_name)}\n"
+        f"📱 {escape(order.customer_phone)}\n"
+        f"{DELIVERY_NAMES.get(order.delivery_type, order.delivery_type)}\n"
+    )
+    if order.delivery_address:
+        text += f"📍 {escape(order.delivery_address)}\n"
+    if order.delivery_date:
+        text += f"📅 {order.delivery_date.strftime('%d.%m.%Y')}\n"
+    
+    text += "\n"
+    for item in order.items:
+        text += f"• {escape(item.product_name)} — {item.quantity:g} {escape(item.unit)} = {item.subtotal:.2f} ₽\n"
+    
+    if order.discount_amount:
+        text += f"\nСкидка: {order.discount_amount:.2f} ₽"
+    text += f"\n💰 <b>Итого: {order.total:.2f} ₽</b>"
+    
+    if order.comment:
+        text += f"\n\n💬 {escape(order.comment)}"
+    
+    return text
+
+
+async def notify_admin_new_order(bot: Bot, session: AsyncSession, payload: dict) -> None:
+    """Новый заказ: сообщение администратору"""
+    row = await _load_order(session, payload["order_id"])
+    if row is None:
+        return
+    order, _ = row
+    
+    await bot.send_message(settings.ADMIN_ID, format_admin_order(order))
+
+
+async def notify_customer_order_created(bot: Bot, session: AsyncSession, payload: dict) -> None:
+    """Новый заказ: подтверждение покупателю"""
+    row = await _load_order(session, payload["order_id"])
+    if row is None:
+        return
+    order, customer_telegram_id = row
+    
+    await bot.send_message(
+        customer_telegram_id,
+        f"✅ Заказ <b>#{order.order_number}</b> принят!\n"
+        f"Сумма: {order.total:.2f} ₽\n\n"
+        f"Мы сообщим, когда статус заказа изменится."
+    )
+
+
+async def notify_customer_order_status(bot: Bot, session: AsyncSession, payload: dict) -> None:
+    """Смена статуса заказа: сообщение покупателю"""
+    row = await _load_order(session, payload["order_id"])
+    if row is None:
+        return
+    order, customer_telegram_id = row
+    
+    status = payload.get("status", order.status)
+    await bot.send_message(
+        customer_telegram_id,
+        f"📦 Заказ <b>#{order.order_number}</b>: {escape(STATUS_NAMES.get(status, status))}"
+    )
@@ -0,0 +1,81 @@
+"""Архив заказов: горячие и холодные таблицы
+
+Выполненные и отмененные заказы, не менявшиеся дольше
+ORDER_ARCHIVE_AFTER_DAYS, переносятся из orders/order_items
+в archived_orders/archived_order_items с теми же id. Рабочие таблицы
+и их индексы остаются маленькими: в них живут заказы последних недель,
+с которыми и идет вся работа.
+
+Перенос идет пачками (services.batching): INSERT ... SELECT в архив
+и DELETE из рабочих таблиц, коммит на пачку. Статус и давность
+проверяются заново при переносе каждой пачки.
+"""
+from datetime import datetime, timedelta
+from typing import Tuple
+
+from sqlalchemy import select, insert, delete, literal
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem, OrderStatus
+from services.batching import in_batches
+from shared.config import settings
+
+
+ARCHIVED_STATUSES = (OrderStatus.COMPLETED.value, OrderStatus.CANCELLED.value)
+
+# Колонки рабочих таблиц; у архивных те же (плюс archived_at у заказа)
+ORDER_COLUMNS = [column.name for column in Order.__table__.columns]
+ORDER_ITEM_COLUMNS = [column.name for column in OrderItem.__table__.columns]
+
+
+async def archive_orders(session: AsyncSession) -> Tuple[int, int]:
+    """Перенести старые завершенные заказы в архив
+    
+    Возвращает (заказов перенесено, позиций перенесено).
+    """
+    if settings.ORDER_ARCHIVE_AFTER_DAYS <= 0:
+        return 0, 0
+    
+    cutoff = datetime.utcnow() - timedelta(days=settings.ORDER_ARCHIVE_AFTER_DAYS)
+    orders_archived = 0
+    items_archived = 0
+    
+    due = (
+        select(Order.id)
+        .where(Order.status.in_(ARCHIVED_STATUSES))
+        .where(Order.updated_at < cutoff)
+    )
+    
+    async for rows in in_batches(session, due, Order.id):
+        batch = [row.id for row in rows]
+        
+        # Условия проверяются заново в самих запросах: пока шла выборка,
+        # заказ могли вернуть в работу, и переносить его уже нельзя
+        still_due = due.where(Order.id.in_(batch))
+        
+        await session.execute(
+            insert(ArchivedOrder).from_select(
+                ORDER_COLUMNS + ["archived_at"],
+                select(*Order.__table__.columns, literal(datetime.utcnow()))
+                .where(Order.id.in_(still_due))
+            )
+        )
+        result = await session.execute(
+            insert(ArchivedOrderItem).from_select(
+                ORDER_ITEM_COLUMNS,
+                select(*OrderItem.__table__.columns).where(OrderItem.order_id.in_(still_due))
+            )
+        )
+        items_archived += result.rowcount
+        
+        # После первой вставки пачка держит блокировку на запись:
+        # удаляется ровно то, что скопировано
+        await session.execute(
+            delete(OrderItem).where(OrderItem.order_id.in_(still_due))
+        )
+        result = await session.execute(
+            delete(Order).where(Order.id.in_(still_due))
+        )
+        orders_archived += result.rowcount
+    
+    return orders_archived, items_archived
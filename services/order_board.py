@@ -0,0 +1,124 @@
+"""Доска заказов администратора: выборка, счетчики по статусам, поиск
+
+Поиск идет только по индексам и только по префиксу:
+- номер заказа ("ORD2026...") - диапазон по уникальному индексу order_number;
+- телефон в любом написании - диапазон по ix_orders_phone_digits
+  (цифры телефона без кода страны, см. shared.utils.normalize_phone);
+- одни цифры - и телефон, и номер заказа без префикса.
+Текст без цифр ищется по имени клиента подстрокой - это единственный
+путь без индекса, он идет по заказам от новых к старым до limit.
+"""
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update, func, and_, or_, true, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from database.database import async_session_maker
+from database.models import Order, ArchivedOrder
+from services.batching import in_batches
+from services.order_numbers import ORDER_NUMBER_PREFIX
+from shared.utils import normalize_phone
+
+
+# Символы, из которых может состоять введенный телефон
+PHONE_CHARS = set("0123456789+-() ")
+
+
+def prefix_match(column, prefix: str):
+    """column LIKE 'prefix%' в виде диапазона - так SQLite берет индекс"""
+    upper_bound = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return and_(column >= prefix, column < upper_bound)
+
+
+def order_search(order_model, search: str):
+    """Условие поиска заказов по номеру, телефону или имени"""
+    search = search.strip()
+    compact = search.replace(" ", "").upper()
+    
+    if compact.startswith(ORDER_NUMBER_PREFIX):
+        return prefix_match(order_model.order_number, compact)
+    
+    if set(search) <= PHONE_CHARS:
+        digits = "".join(char for char in search if char.isdigit())
+        if digits:
+            conditions = [prefix_match(order_model.order_number, ORDER_NUMBER_PREFIX + digits)]
+            
+            # Код страны мог быть введен целиком или только начат
+            candidates = {normalize_phone(search)}
+            if search.startswith("+7") or (len(digits) > 1 and digits[0] in "78"):
+                candidates.add(digits[1:])
+            for candidate in candidates:
+                if candidate:
+                    conditions.append(prefix_match(order_model.phone_digits, candidate))
+            
+            return or_(*conditions)
+    
+    return order_model.customer_name.ilike(f"%{search}%")
+
+
+async def status_counts(session: AsyncSession, order_model, where=None) -> Dict[str, int]:
+    """Число заказов по статусам одним сгруппированным запросом"""
+    result = await session.execute(
+        select(order_model.status, func.count())
+        .where(where if where is not None else true())
+        .group_by(order_model.status)
+    )
+    return dict(result.all())
+
+
+async def board_page(
+    session: AsyncSession,
+    order_model,
+    status: Optional[str] = None,
+    search: Optional[str] = None,
+    limit: int = 50,
+    before_id: Optional[int] = None
+) -> Tuple[List, Dict[str, int], Optional[int]]:
+    """Страница доски: (заказы с позициями, счетчики по статусам, курсор дальше)
+    
+    Счетчики учитывают поиск, но не фильтр статуса - это вкладки доски.
+    Позиции всех заказов страницы подгружаются одним запросом (selectinload).
+    """
+    search_condition = order_search(order_model, search) if search and search.strip() else None
+    
+    query = (
+        select(order_model)
+        .options(selectinload(order_model.items))
+        .order_by(order_model.id.desc())
+        .limit(limit + 1)
+    )
+    if search_condition is not None:
+        query = query.where(search_condition)
+    if status:
+        query = query.where(order_model.status == status)
+    if before_id is not None:
+        query = query.where(order_model.id < before_id)
+    
+    result = await session.execute(query)
+    orders = list(result.scalars().all())
+    
+    next_cursor = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        next_cursor = orders[-1].id
+    
+    counts = await status_counts(session, order_model, search_condition)
+    
+    return orders, counts, next_cursor
+
+
+async def backfill_phone_digits():
+    """Заполнить phone_digits у заказов, созданных до появления колонки"""
+    async with async_session_maker() as session:
+        for order_model in (Order, ArchivedOrder):
+            table = order_model.__table__
+            missing = select(table.c.id, table.c.customer_phone).where(table.c.phone_digits.is_(None))
+            async for rows in in_batches(session, missing, table.c.id):
+                await session.execute(
+                    update(table)
+                    .where(table.c.id == bindparam("b_id"))
+                    # updated_at не трогаем: по нему заказы уходят в архив
+                    .values(phone_digits=bindparam("b_phone_digits"), updated_at=table.c.updated_at),
+                    [{"b_id": row.id, "b_phone_digits": normalize_phone(row.customer_phone)} for row in rows]
+                )
@@ -0,0 +1,203 @@
+"""Живые события заказов (Server-Sent Events)
+
+Хаб внутри процесса API: роуты публикуют события после коммита
+(новый заказ, смена статуса), подписчики получают их через SSE.
+Покупатель видит только свои заказы, администратор - все.
+Изменения каталога (catalog_changed) получают все подписчики.
+
+- У каждого подписчика своя ограниченная очередь. Если клиент не успевает
+  читать и очередь переполнилась, она сбрасывается и клиент получает
+  событие resync - ему нужно перезагрузить список целиком.
+- Последние события хранятся в кольцевом буфере: при переподключении
+  с Last-Event-ID клиент получает пропущенное. Если пропущенного
+  в буфере уже нет (или API перезапускался) - тоже resync.
+- Раз в ORDER_STREAM_HEARTBEAT секунд отправляется комментарий-пинг,
+  чтобы прокси не закрывали простаивающее соединение.
+
+Хаб живет в памяти одного процесса: при нескольких воркерах uvicorn
+подписчик видит только события своего воркера.
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import AsyncIterator, Iterator, List, Optional
+
+from fastapi import Request
+
+from database.models import Order
+from shared.config import settings
+
+
+ORDER_CREATED = "order_created"
+ORDER_STATUS = "order_status"
+RESYNC = "resync"
+CATALOG_CHANGED = "catalog_changed"
+
+
+@dataclass
+class OrderEvent:
+    """Событие заказа"""
+    seq: int
+    event_type: str
+    user_id: Optional[int]  # Владелец заказа; None - служебное событие для всех
+    data: dict = field(default_factory=dict)
+
+
+@dataclass
+class Subscriber:
+    """Подписчик: покупатель (user_id) или администратор (user_id=None)"""
+    user_id: Optional[int]
+    queue: asyncio.Queue
+    
+    def wants(self, event: OrderEvent) -> bool:
+        return self.user_id is None or event.user_id is None or event.user_id == self.user_id
+
+
+class OrderEventHub:
+    """Публикация событий заказов и раздача подписчикам"""
+    
+    def __init__(self, backlog_size: int, queue_size: int):
+        # Идентификаторы событий уникальны в пределах запуска процесса
+        self.epoch = format(int(time.time()), "x")
+        self.queue_size = queue_size
+        self._seq = 0
+        self._backlog: deque = deque(maxlen=backlog_size)
+        self._subscribers: List[Subscriber] = []
+    
+    def event_id(self, event: OrderEvent) -> str:
+        return f"{self.epoch}-{event.seq}"
+    
+    def publish(self, event_type: str, user_id: Optional[int], data: dict) -> OrderEvent:
+        """Разослать событие подписчикам, не блокируясь на медленных"""
+        self._seq += 1
+        event = OrderEvent(seq=self._seq, event_type=event_type, user_id=user_id, data=data)
+        self._backlog.append(event)
+        
+        for subscriber in self._subscribers:
+            if not subscriber.wants(event):
+                continue
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Клиент отстал: вместо накопления - сигнал перечитать список
+                while not subscriber.queue.empty():
+                    subscriber.queue.get_nowait()
+                subscriber.queue.put_nowait(OrderEvent(seq=event.seq, event_type=RESYNC, user_id=None))
+        
+        return event
+    
+    @contextmanager
+    def subscribe(self, user_id: Optional[int]) -> Iterator[Subscriber]:
+        subscriber = Subscriber(user_id=user_id, queue=asyncio.Queue(maxsize=self.queue_size))
+        self._subscribers.append(subscriber)
+        try:
+            yield subscriber
+        finally:
+            self._subscribers.remove(subscriber)
+    
+    def missed_since(self, last_event_id: str, subscriber: Subscriber) -> Optional[List[OrderEvent]]:
+        """События после last_event_id или None, если их уже не восстановить"""
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        
+        seq = int(seq)
+        if seq > self._seq:
+            return None
+        # Буфер уже вытеснил часть пропущенного
+        if self._backlog and self._backlog[0].seq > seq + 1:
+            return None
+        
+        return [event for event in self._backlog if event.seq > seq and subscriber.wants(event)]
+    
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+    
+    @property
+    def subscribers_count(self) -> int:
+        return len(self._subscribers)
+
+
+hub = OrderEventHub(
+    backlog_size=settings.ORDER_STREAM_BACKLOG,
+    queue_size=settings.ORDER_STREAM_QUEUE_SIZE
+)
+
+
+def order_event_data(order: Order) -> dict:
+    """Поля заказа, которые уходят в событие"""
+    return {
+        "order_id": order.id,
+        "order_number": order.order_number,
+        "status": order.status,
+        "total": order.total,
+        "created_at": order.created_at.isoformat() if order.created_at else None,
+    }
+
+
+def publish_order_created(order: Order):
+    hub.publish(ORDER_CREATED, order.user_id, order_event_data(order))
+
+
+def publish_order_status(order: Order):
+    hub.publish(ORDER_STATUS, order.user_id, order_event_data(order))
+
+
+def publish_catalog_changed(data: dict):
+    """Одно событие на массовое изменение каталога"""
+    hub.publish(CATALOG_CHANGED, None, data)
+
+
+def format_sse(event: OrderEvent) -> str:
+    return (
+        f"id: {hub.event_id(event)}\n"
+        f"event: {event.event_type}\n"
+        f"data: {json.dumps(event.data, ensure_ascii=False)}\n\n"
+    )
+
+
+async def order_event_stream(
+    request: Request,
+    user_id: Optional[int],
+    last_event_id: Optional[str] = None
+) -> AsyncIterator[str]:
+    """Поток SSE для покупателя (user_id) или администратора (None)"""
+    # Подписка раньше догоняющей выдачи - ничего не потеряется между ними
+    with hub.subscribe(user_id) as subscriber:
+        yield f"retry: {settings.ORDER_STREAM_RETRY_MS}\n\n"
+        
+        last_seq = 0
+        if last_event_id:
+            missed = hub.missed_since(last_event_id, subscriber)
+            # Все, что опубликовано до этого момента, уже учтено здесь
+            last_seq = hub.last_seq
+            if missed is None:
+                yield format_sse(OrderEvent(seq=last_seq, event_type=RESYNC, user_id=None))
+            else:
+                for event in missed:
+                    yield format_sse(event)
+        
+        while True:
+            if await request.is_disconnected():
+                break
+            
+            try:
+                event = await asyncio.wait_for(
+                    subscriber.queue.get(),
+                    timeout=settings.ORDER_STREAM_HEARTBEAT
+                )
+            except asyncio.TimeoutError:
+                yield f": ping {datetime.utcnow().isoformat()}\n\n"
+                continue
+            
+            # Уже отдано при догоняющей выдаче
+            if event.seq <= last_seq and event.event_type != RESYNC:
+                continue
+            
+            last_seq = max(last_seq, event.seq)
+            yield format_sse(event)
@@ -0,0 +1,121 @@
+"""Выгрузка заказов с позициями для бухгалтерии (CSV и XLSX)
+
+Одна строка выгрузки - одна позиция заказа, поля заказа повторяются.
+Заказы за период читаются серверным курсором порциями по
+ORDER_EXPORT_CHUNK_SIZE строк (session.stream + yield_per), каждая
+порция сразу уходит клиенту - память не зависит от длины периода.
+Между порциями цикл событий свободен: чтение из SQLite идет в потоке
+aiosqlite, а форматирование порции занимает доли миллисекунды.
+
+Сначала выгружаются архивные заказы периода, затем рабочие.
+"""
+from datetime import date, datetime, time, timedelta
+from typing import AsyncIterator, List
+
+from sqlalchemy import select
+from sqlalchemy.sql import Select
+
+from database.database import async_session_maker
+from database.models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem
+from services.notifications import STATUS_NAMES
+from services.picklist import UNIT_NAMES
+from shared.config import settings
+from shared.csv_stream import csv_header, csv_rows
+from shared.xlsx import XlsxStreamWriter
+
+
+HEADER = [
+    "Номер заказа", "Дата", "Статус", "Клиент", "Телефон", "Получение", "Оплата",
+    "Товар", "Ед.", "Количество", "Цена", "Сумма позиции",
+    "Товары в заказе", "Доставка", "Скидка", "Итого по заказу"
+]
+
+DELIVERY_NAMES = {
+    "delivery": "Доставка",
+    "pickup": "Самовывоз",
+}
+
+
+def export_query(order_model, item_model, date_from: date, date_to: date) -> Select:
+    """Позиции заказов, созданных с date_from по date_to включительно"""
+    start = datetime.combine(date_from, time.min)
+    end = datetime.combine(date_to, time.min) + timedelta(days=1)
+    
+    return (
+        select(
+            order_model.order_number,
+            order_model.created_at,
+            order_model.status,
+            order_model.customer_name,
+            order_model.customer_phone,
+            order_model.delivery_type,
+            order_model.payment_type,
+            item_model.product_name,
+            item_model.unit,
+            item_model.quantity,
+            item_model.price_per_unit,
+            item_model.subtotal.label("item_subtotal"),
+            order_model.subtotal,
+            order_model.delivery_cost,
+            order_model.discount_amount,
+            order_model.total
+        )
+        .join(item_model, item_model.order_id == order_model.id)
+        .where(order_model.created_at >= start)
+        .where(order_model.created_at < end)
+        .order_by(order_model.created_at, order_model.id)
+        .execution_options(yield_per=settings.ORDER_EXPORT_CHUNK_SIZE)
+    )
+
+
+def export_row(row) -> list:
+    return [
+        row.order_number,
+        row.created_at.strftime("%Y-%m-%d %H:%M"),
+        STATUS_NAMES.get(row.status, row.status),
+        row.customer_name,
+        row.customer_phone,
+        DELIVERY_NAMES.get(row.delivery_type, row.delivery_type),
+        row.payment_type,
+        row.product_name,
+        UNIT_NAMES.get(row.unit, row.unit),
+        row.quantity,
+        row.price_per_unit,
+        row.item_subtotal,
+        row.subtotal,
+        row.delivery_cost,
+        row.discount_amount,
+        row.total
+    ]
+
+
+async def export_chunks(date_from: date, date_to: date) -> AsyncIterator[List[list]]:
+    """Строки выгрузки порциями; своя сессия - поток живет дольше запроса"""
+    async with async_session_maker() as session:
+        for order_model, item_model in ((ArchivedOrder, ArchivedOrderItem), (Order, OrderItem)):
+            result = await session.stream(export_query(order_model, item_model, date_from, date_to))
+            async for partition in result.partitions():
+                yield [export_row(row) for row in partition]
+
+
+def _csv_values(row: list) -> list:
+    return [str(value).replace(".", ",") if isinstance(value, float) else value for value in row]
+
+
+async def orders_csv(date_from: date, date_to: date) -> AsyncIterator[str]:
+    """Выгрузка в CSV (для StreamingResponse)"""
+    yield csv_header(HEADER)
+    
+    async for rows in export_chunks(date_from, date_to):
+        yield csv_rows(_csv_values(row) for row in rows)
+
+
+async def orders_xlsx(date_from: date, date_to: date) -> AsyncIterator[bytes]:
+    """Выгрузка в XLSX (для StreamingResponse)"""
+    writer = XlsxStreamWriter("Заказы")
+    yield writer.start() + writer.write_rows([HEADER])
+    
+    async for rows in export_chunks(date_from, date_to):
+        yield writer.write_rows(rows)
+    
+    yield writer.finish()
@@ -0,0 +1,62 @@
+"""Выдача номеров заказов
+
+Номер имеет вид ORDyyyymmddNNNN, где NNNN - порядковый номер заказа
+за день. Счетчик хранится в строке order_sequences на каждый день и
+увеличивается атомарно через UPDATE ... RETURNING, поэтому стоимость
+не зависит от количества заказов, а параллельные оформления
+не получают одинаковые номера.
+"""
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, update, func, cast, Integer
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Order, OrderSequence
+
+ORDER_NUMBER_PREFIX = "ORD"
+
+
+def format_order_number(day: str, value: int) -> str:
+    """Собрать номер заказа из дня (yyyymmdd) и порядкового номера"""
+    return f"{ORDER_NUMBER_PREFIX}{day}{value:04d}"
+
+
+async def allocate_order_number(session: AsyncSession, now: Optional[datetime] = None) -> str:
+    """Выделить следующий номер заказа в текущей транзакции"""
+    day = (now or datetime.utcnow()).strftime('%Y%m%d')
+    
+    # Обычный путь: счетчик дня уже существует
+    result = await session.execute(
+        update(OrderSequence)
+        .where(OrderSequence.day == day)
+        .values(last_value=OrderSequence.last_value + 1)
+        .returning(OrderSequence.last_value)
+    )
+    value = result.scalar_one_or_none()
+    
+    if value is None:
+        # Первый заказ за день: продолжаем с уже выданных номеров этого дня
+        # (диапазон по уникальному индексу order_number)
+        prefix = f"{ORDER_NUMBER_PREFIX}{day}"
+        issued = (
+            select(func.coalesce(
+                func.max(cast(func.substr(Order.order_number, len(prefix) + 1), Integer)), 0
+            ))
+            .where(Order.order_number >= prefix)
+            .where(Order.order_number < f"{prefix}~")
+            .scalar_subquery()
+        )
+        insert_stmt = sqlite_insert(OrderSequence).values(day=day, last_value=issued + 1)
+        result = await session.execute(
+            insert_stmt
+            .on_conflict_do_update(
+                index_elements=["day"],
+                set_={"last_value": OrderSequence.last_value + 1}
+            )
+            .returning(OrderSequence.last_value)
+        )
+        value = result.scalar_one()
+    
+    return format_order_number(day, value)
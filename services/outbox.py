@@ -0,0 +1,217 @@
+"""Очередь исходящих событий (transactional outbox)
+
+Событие записывается в таблицу outbox_events в той же транзакции, что и
+изменение, которое его породило (например, заказ). Если транзакция
+откатилась - события нет; если закоммитилась - оно будет доставлено,
+даже если процесс упадет сразу после ответа клиенту.
+
+Фоновый обработчик внутри процесса API забирает события пачками,
+вызывает обработчик по типу события и повторяет неудачные попытки
+с экспоненциальной паузой. После OUTBOX_MAX_ATTEMPTS неудач событие
+помечается failed и больше не повторяется.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from enum import Enum as PyEnum
+from typing import Awaitable, Callable, Dict, Optional
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from aiogram.utils.token import TokenValidationError
+from sqlalchemy import select, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.database import async_session_maker
+from database.models import OutboxEvent, OutboxStatus
+from services.notifications import (
+    notify_admin_new_order,
+    notify_customer_order_created,
+    notify_customer_order_status,
+)
+from shared.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxEventType(PyEnum):
+    """Типы исходящих событий"""
+    ADMIN_NEW_ORDER = "admin_new_order"  # Администратору: новый заказ
+    CUSTOMER_ORDER_CREATED = "customer_order_created"  # Покупателю: заказ принят
+    CUSTOMER_ORDER_STATUS = "customer_order_status"  # Покупателю: статус изменен
+
+
+Handler = Callable[[Bot, AsyncSession, dict], Awaitable[None]]
+
+HANDLERS: Dict[str, Handler] = {
+    OutboxEventType.ADMIN_NEW_ORDER.value: notify_admin_new_order,
+    OutboxEventType.CUSTOMER_ORDER_CREATED.value: notify_customer_order_created,
+    OutboxEventType.CUSTOMER_ORDER_STATUS.value: notify_customer_order_status,
+}
+
+# На сколько событие "занимается" обработчиком. Если процесс упадет
+# посреди доставки, событие снова станет доступно по истечении срока.
+CLAIM_TIMEOUT = timedelta(seconds=120)
+
+RETRY_MAX_DELAY = 3600
+
+# Будит обработчик сразу после коммита, не дожидаясь очередного опроса
+_wakeup = asyncio.Event()
+
+
+def enqueue_event(session: AsyncSession, event_type: OutboxEventType, payload: dict):
+    """Добавить событие в текущую транзакцию (коммит - на вызывающем)"""
+    session.add(OutboxEvent(event_type=event_type.value, payload=payload))
+
+
+def wake_outbox():
+    """Сообщить обработчику, что появились новые события"""
+    _wakeup.set()
+
+
+def retry_delay(attempts: int) -> int:
+    """Пауза перед следующей попыткой: 10, 20, 40... секунд, не больше часа"""
+    return min(settings.OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+
+
+async def claim_events(session: AsyncSession, now: datetime) -> list:
+    """Забрать пачку готовых к доставке событий
+    
+    Условный UPDATE переносит next_attempt_at вперед на CLAIM_TIMEOUT:
+    второй обработчик (другой воркер uvicorn) те же строки уже не выберет.
+    """
+    due = (
+        select(OutboxEvent.id)
+        .where(OutboxEvent.status == OutboxStatus.PENDING.value)
+        .where(OutboxEvent.next_attempt_at <= now)
+        .order_by(OutboxEvent.id)
+        .limit(settings.OUTBOX_BATCH_SIZE)
+    )
+    result = await session.execute(
+        update(OutboxEvent)
+        .where(OutboxEvent.id.in_(due))
+        .where(OutboxEvent.next_attempt_at <= now)
+        .values(next_attempt_at=now + CLAIM_TIMEOUT)
+        .returning(OutboxEvent.id, OutboxEvent.event_type, OutboxEvent.payload, OutboxEvent.attempts)
+    )
+    events = result.all()
+    await session.commit()
+    return sorted(events, key=lambda event: event.id)
+
+
+async def process_outbox_batch(bot: Bot) -> int:
+    """Доставить одну пачку событий, вернуть число обработанных"""
+    now = datetime.utcnow()
+    
+    async with async_session_maker() as session:
+        events = await claim_events(session, now)
+        if not events:
+            return 0
+        
+        sent_ids = []
+        failures = []  # (id, attempts, next_attempt_at или None, ошибка)
+        
+        for event in events:
+            attempts = event.attempts + 1
+            handler = HANDLERS.get(event.event_type)
+            
+            if handler is None:
+                failures.append((event.id, attempts, None, f"Неизвестный тип события: {event.event_type}"))
+                continue
+            
+            try:
+                await handler(bot, session, event.payload)
+            except TelegramRetryAfter as e:
+                # Ограничение Telegram: ждем сколько просят, попытку не считаем
+                failures.append((event.id, event.attempts, now + timedelta(seconds=e.retry_after), str(e)))
+                continue
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # Бот заблокирован или чат не существует - повтор не поможет
+                failures.append((event.id, attempts, None, str(e)))
+                continue
+            except Exception as e:
+                logger.warning("Событие %s (%s) не доставлено: %s", event.id, event.event_type, e)
+                next_attempt_at = None
+                if attempts < settings.OUTBOX_MAX_ATTEMPTS:
+                    next_attempt_at = datetime.utcnow() + timedelta(seconds=retry_delay(attempts))
+                failures.append((event.id, attempts, next_attempt_at, str(e)))
+                continue
+            
+            sent_ids.append(event.id)
+        
+        # Итоги пачки - одной транзакцией
+        if sent_ids:
+            await session.execute(
+                update(OutboxEvent)
+                .where(OutboxEvent.id.in_(sent_ids))
+                .values(
+                    status=OutboxStatus.SENT.value,
+                    attempts=OutboxEvent.attempts + 1,
+                    processed_at=datetime.utcnow(),
+                    last_error=None
+                )
+            )
+        
+        for event_id, attempts, next_attempt_at, error in failures:
+            values = {"attempts": attempts, "last_error": error[:1000]}
+            if next_attempt_at is None:
+                values.update(status=OutboxStatus.FAILED.value, processed_at=datetime.utcnow())
+            else:
+                values["next_attempt_at"] = next_attempt_at
+            await session.execute(
+                update(OutboxEvent).where(OutboxEvent.id == event_id).values(**values)
+            )
+        
+        await session.commit()
+    
+    return len(events)
+
+
+async def purge_sent_events(session: AsyncSession) -> int:
+    """Удалить доставленные события старше OUTBOX_RETENTION_DAYS"""
+    cutoff = datetime.utcnow() - timedelta(days=settings.OUTBOX_RETENTION_DAYS)
+    result = await session.execute(
+        delete(OutboxEvent)
+        .where(OutboxEvent.status == OutboxStatus.SENT.value)
+        .where(OutboxEvent.processed_at < cutoff)
+    )
+    await session.commit()
+    return result.rowcount
+
+
+async def outbox_loop(bot: Optional[Bot] = None):
+    """Фоновая доставка событий"""
+    own_bot = bot is None
+    if own_bot:
+        try:
+            bot = Bot(
+                token=settings.BOT_TOKEN,
+                default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+            )
+        except TokenValidationError:
+            logger.error("Неверный BOT_TOKEN - уведомления о заказах отключены")
+            return
+    
+    try:
+        while True:
+            _wakeup.clear()
+            
+            try:
+                processed = await process_outbox_batch(bot)
+            except Exception:
+                logger.exception("Ошибка обработки очереди событий")
+                processed = 0
+            
+            # Полная пачка - вероятно, есть еще; иначе ждем коммита или таймаута
+            if processed >= settings.OUTBOX_BATCH_SIZE:
+                continue
+            
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=settings.OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        if own_bot:
+            await bot.session.close()
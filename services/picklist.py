@@ -0,0 +1,111 @@
+"""Лист сборки: сколько какого товара собрать на слот доставки
+
+Все позиции подтвержденных и собираемых заказов на дату (и интервал)
+складываются одним сгруппированным запросом: по категории, товару
+и единице измерения. Килограммы и штуки одного товара не смешиваются -
+это разные строки листа.
+"""
+from datetime import date, datetime, time, timedelta
+from typing import AsyncIterator, List, Optional
+
+from sqlalchemy import select, func
+from sqlalchemy.sql import Select
+
+from database.database import async_session_maker
+from database.models import Order, OrderItem, Product, Category, OrderStatus
+from shared.csv_stream import csv_header, csv_rows
+
+
+# Заказы в работе у склада
+PICK_STATUSES = (OrderStatus.CONFIRMED.value, OrderStatus.PREPARING.value)
+
+UNIT_NAMES = {
+    "kg": "кг",
+    "piece": "шт",
+    "package": "уп",
+    "box": "ящ",
+}
+
+NO_CATEGORY = "Без категории"
+
+CSV_HEADER = ["Категория", "Товар", "Ед.", "Количество", "Заказов"]
+
+
+def picklist_query(day: date, interval_id: Optional[int] = None) -> Select:
+    """Сгруппированный запрос листа сборки
+    
+    Фильтр по orders идет по индексу ix_orders_delivery_slot
+    (delivery_date, delivery_interval_id, status), позиции подтягиваются
+    по ix_order_items_order_id - таблицы заказов целиком не читаются.
+    """
+    day_start = datetime.combine(day, time.min)
+    day_end = day_start + timedelta(days=1)
+    
+    query = (
+        select(
+            Category.id.label("category_id"),
+            func.coalesce(Category.name, NO_CATEGORY).label("category_name"),
+            OrderItem.product_id,
+            func.max(OrderItem.product_name).label("product_name"),
+            OrderItem.unit,
+            func.sum(OrderItem.quantity).label("quantity"),
+            func.count(func.distinct(OrderItem.order_id)).label("orders_count")
+        )
+        .select_from(Order)
+        .join(OrderItem, OrderItem.order_id == Order.id)
+        .outerjoin(Product, Product.id == OrderItem.product_id)
+        .outerjoin(Category, Category.id == Product.category_id)
+        .where(Order.delivery_date >= day_start)
+        .where(Order.delivery_date < day_end)
+        .where(Order.status.in_(PICK_STATUSES))
+        .group_by(Category.id, Category.name, Category.sort_order, OrderItem.product_id, OrderItem.unit)
+        .order_by(Category.sort_order, Category.name, func.max(OrderItem.product_name), OrderItem.unit)
+    )
+    
+    if interval_id is not None:
+        query = query.where(Order.delivery_interval_id == interval_id)
+    
+    return query
+
+
+def group_by_category(rows) -> List[dict]:
+    """Строки запроса -> категории со списками товаров (порядок сохраняется)"""
+    categories = []
+    
+    for row in rows:
+        if not categories or categories[-1]["category_id"] != row.category_id:
+            categories.append({
+                "category_id": row.category_id,
+                "category_name": row.category_name,
+                "items": []
+            })
+        
+        categories[-1]["items"].append({
+            "product_id": row.product_id,
+            "product_name": row.product_name,
+            "unit": row.unit,
+            "unit_name": UNIT_NAMES.get(row.unit, row.unit),
+            "quantity": round(row.quantity, 3),
+            "orders_count": row.orders_count
+        })
+    
+    return categories
+
+
+async def picklist_csv(day: date, interval_id: Optional[int] = None) -> AsyncIterator[str]:
+    """Лист сборки в CSV построчно (для StreamingResponse)
+    
+    Своя сессия: поток отдается уже после выхода из зависимостей роута.
+    """
+    yield csv_header(CSV_HEADER)
+    
+    async with async_session_maker() as session:
+        result = await session.stream(picklist_query(day, interval_id))
+        async for row in result:
+            yield csv_rows([[
+                row.category_name,
+                row.product_name,
+                UNIT_NAMES.get(row.unit, row.unit),
+                f"{row.quantity:g}".replace(".", ","),
+                row.orders_count
+            ]])
@@ -0,0 +1,163 @@
+"""Популярность товаров с экспоненциальным затуханием
+
+Каждое событие - заказ с товаром (POPULARITY_ORDER_WEIGHT) или
+добавление в корзину (POPULARITY_CART_WEIGHT) - прибавляет товару вес,
+который затухает вдвое за POPULARITY_HALF_LIFE_DAYS.
+
+Чтобы не пересчитывать затухание всех товаров, вес события приводится
+к общей эпохе: событие в момент t весит w * 2^((t - EPOCH) / T).
+Отношение таких сумм у двух товаров равно отношению их текущих
+затухших сумм, поэтому сортировать можно прямо по ним, а событие
+меняет одно число - O(1). Хранится log2 суммы: прибавление - это
+сложение в логарифмах, и значения не переполняются со временем.
+
+Счетчики живут в памяти процесса API и сохраняются в product_popularity
+раз в POPULARITY_SAVE_INTERVAL; каталог сортируется по сохраненным
+значениям. История заказов читается один раз - при первом запуске
+на базе с заказами (ensure_popularity).
+"""
+import asyncio
+import logging
+import math
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Set
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.database import async_session_maker
+from database.models import Order, OrderItem, ProductPopularity
+from shared.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Точка отсчета весов; менять нельзя - сохраненные значения к ней привязаны
+EPOCH = datetime(2024, 1, 1)
+
+# Первый расчет берет заказы за столько периодов полураспада:
+# более старые весят меньше 1/1000 свежих
+HISTORY_HALF_LIVES = 10
+
+# Строк в одной порции при первом расчете
+LOAD_CHUNK_SIZE = 10000
+
+
+def _log2_add(a: float, b: float) -> float:
+    """log2(2^a + 2^b) без переполнения"""
+    high, low = (a, b) if a >= b else (b, a)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def _exponent(at: datetime) -> float:
+    """Возраст эпохи в периодах полураспада"""
+    return (at - EPOCH).total_seconds() / (settings.POPULARITY_HALF_LIFE_DAYS * 86400)
+
+
+class PopularityCounter:
+    """Затухающие счетчики популярности товаров"""
+    
+    def __init__(self):
+        self.scores: Dict[int, float] = {}  # log2 суммы весов, приведенных к EPOCH
+        self.loaded = False
+        self._dirty: Set[int] = set()
+    
+    def add(self, product_id: int, weight: float, at: Optional[datetime] = None):
+        """Прибавить товару событие с весом weight"""
+        if weight <= 0:
+            return
+        
+        value = math.log2(weight) + _exponent(at or datetime.utcnow())
+        current = self.scores.get(product_id)
+        self.scores[product_id] = value if current is None else _log2_add(current, value)
+        self._dirty.add(product_id)
+    
+    def record_order(self, product_ids: Iterable[int], at: Optional[datetime] = None):
+        """Заказ: по событию на каждый товар заказа"""
+        for product_id in set(product_ids):
+            self.add(product_id, settings.POPULARITY_ORDER_WEIGHT, at)
+    
+    def record_cart_add(self, product_id: int):
+        self.add(product_id, settings.POPULARITY_CART_WEIGHT)
+    
+    def current(self, product_id: int, now: Optional[datetime] = None) -> float:
+        """Затухшая сумма весов товара на момент now"""
+        score = self.scores.get(product_id)
+        if score is None:
+            return 0.0
+        return 2 ** (score - _exponent(now or datetime.utcnow()))
+    
+    async def load(self, session: AsyncSession):
+        """Поднять сохраненные значения (события до загрузки не теряются)"""
+        result = await session.execute(select(ProductPopularity.product_id, ProductPopularity.score))
+        for product_id, score in result.all():
+            current = self.scores.get(product_id)
+            self.scores[product_id] = score if current is None else _log2_add(current, score)
+        self.loaded = True
+    
+    async def save(self, session: AsyncSession) -> int:
+        """Сохранить измененные значения, вернуть число товаров"""
+        if not self.loaded or not self._dirty:
+            return 0
+        
+        dirty, self._dirty = self._dirty, set()
+        now = datetime.utcnow()
+        rows = [
+            {"product_id": product_id, "score": self.scores[product_id], "updated_at": now}
+            for product_id in dirty
+        ]
+        
+        try:
+            upsert = sqlite_insert(ProductPopularity)
+            await session.execute(
+                upsert.on_conflict_do_update(
+                    index_elements=["product_id"],
+                    set_={"score": upsert.excluded.score, "updated_at": upsert.excluded.updated_at}
+                ),
+                rows
+            )
+            await session.commit()
+        except Exception:
+            # Не сохранилось - попробуем в следующий раз
+            self._dirty |= dirty
+            raise
+        
+        return len(rows)
+
+
+# Счетчики процесса API
+counter = PopularityCounter()
+
+
+async def ensure_popularity():
+    """Загрузить популярность; если ее еще нет - посчитать по недавним заказам"""
+    async with async_session_maker() as session:
+        await counter.load(session)
+        if counter.scores:
+            return
+        
+        cutoff = datetime.utcnow() - timedelta(days=HISTORY_HALF_LIVES * settings.POPULARITY_HALF_LIFE_DAYS)
+        result = await session.stream(
+            select(OrderItem.order_id, OrderItem.product_id, Order.created_at)
+            .join(Order, Order.id == OrderItem.order_id)
+            .where(Order.created_at >= cutoff)
+            .distinct()
+            .execution_options(yield_per=LOAD_CHUNK_SIZE)
+        )
+        async for partition in result.partitions():
+            for _, product_id, created_at in partition:
+                counter.add(product_id, settings.POPULARITY_ORDER_WEIGHT, created_at)
+        
+        await counter.save(session)
+
+
+async def popularity_loop():
+    """Периодическое сохранение счетчиков"""
+    while True:
+        await asyncio.sleep(settings.POPULARITY_SAVE_INTERVAL)
+        try:
+            async with async_session_maker() as session:
+                await counter.save(session)
+        except Exception:
+            logger.exception("Ошибка сохранения популярности товаров")
@@ -0,0 +1,218 @@
+"""Расчет стоимости заказа
+
+Общая логика для предварительного расчета (quote) и оформления заказа.
+Настройки магазина и активные промокоды кешируются в памяти процесса
+на PRICING_CACHE_TTL секунд и сбрасываются при изменении через админку.
+"""
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, update, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import PromoCode, Settings as DBSettings
+from shared.config import settings
+from shared.utils import check_min_order_amount, check_free_delivery
+
+
+# Ключи настроек, участвующие в расчете
+PRICING_KEYS = ("min_order_amount", "free_delivery_from", "delivery_cost")
+
+
+@dataclass(frozen=True)
+class PricingSettings:
+    """Настройки магазина для расчета заказа"""
+    min_order_amount: float = 0
+    free_delivery_from: float = 0
+    delivery_cost: float = 0
+
+
+@dataclass(frozen=True)
+class PromoInfo:
+    """Снимок промокода для расчета скидки"""
+    id: int
+    code: str
+    discount_percent: Optional[float]
+    discount_fixed: Optional[float]
+    min_order_amount: Optional[float]
+    max_uses: Optional[int]
+    current_uses: int
+    valid_from: Optional[datetime]
+    valid_until: Optional[datetime]
+
+
+@dataclass
+class Quote:
+    """Результат расчета заказа"""
+    subtotal: float
+    delivery_cost: float = 0
+    discount_amount: float = 0
+    total: float = 0
+    min_order_amount: float = 0
+    free_delivery_from: float = 0
+    promo_code_id: Optional[int] = None
+    errors: List[str] = field(default_factory=list)
+    
+    @property
+    def is_valid(self) -> bool:
+        return not self.errors
+
+
+# ==================== КЕШ ====================
+
+_settings_cache: Optional[PricingSettings] = None
+_settings_loaded_at: float = 0.0
+_promo_cache: Dict[str, PromoInfo] = {}
+_promo_loaded_at: Optional[float] = None
+
+
+def _is_stale(loaded_at: Optional[float]) -> bool:
+    return loaded_at is None or time.monotonic() - loaded_at > settings.PRICING_CACHE_TTL
+
+
+def invalidate_pricing_cache():
+    """Сбросить кеш настроек и промокодов"""
+    global _settings_cache
+    _settings_cache = None
+    invalidate_promo_cache()
+
+
+def invalidate_promo_cache():
+    """Сбросить кеш промокодов (после использования или изменения)"""
+    global _promo_loaded_at
+    _promo_loaded_at = None
+
+
+async def get_pricing_settings(session: AsyncSession) -> PricingSettings:
+    """Получить настройки расчета (из кеша или одним запросом)"""
+    global _settings_cache, _settings_loaded_at
+    
+    if _settings_cache is None or _is_stale(_settings_loaded_at):
+        result = await session.execute(
+            select(DBSettings.key, DBSettings.value).where(DBSettings.key.in_(PRICING_KEYS))
+        )
+        values = {key: float(value) for key, value in result.all()}
+        _settings_cache = PricingSettings(**values)
+        _settings_loaded_at = time.monotonic()
+    
+    return _settings_cache
+
+
+async def get_active_promo(session: AsyncSession, code: str) -> Optional[PromoInfo]:
+    """Найти активный промокод (все активные промокоды кешируются разом)"""
+    global _promo_cache, _promo_loaded_at
+    
+    if _is_stale(_promo_loaded_at):
+        result = await session.execute(
+            select(PromoCode).where(PromoCode.is_active == True)
+        )
+        _promo_cache = {
+            promo.code: PromoInfo(
+                id=promo.id,
+                code=promo.code,
+                discount_percent=promo.discount_percent,
+                discount_fixed=promo.discount_fixed,
+                min_order_amount=promo.min_order_amount,
+                max_uses=promo.max_uses,
+                current_uses=promo.current_uses or 0,
+                valid_from=promo.valid_from,
+                valid_until=promo.valid_until
+            )
+            for promo in result.scalars().all()
+        }
+        _promo_loaded_at = time.monotonic()
+    
+    return _promo_cache.get(code.upper())
+
+
+# ==================== ИСПОЛЬЗОВАНИЕ ====================
+
+async def redeem_promo(session: AsyncSession, promo_code_id: int) -> bool:
+    """Атомарно списать одно использование промокода
+    
+    Один условный UPDATE: лимит и срок действия проверяются самой базой,
+    поэтому параллельные оформления не превысят max_uses.
+    Возвращает False, если промокод уже исчерпан или неактивен.
+    """
+    now = datetime.utcnow()
+    result = await session.execute(
+        update(PromoCode)
+        .where(PromoCode.id == promo_code_id)
+        .where(PromoCode.is_active == True)
+        .where(or_(PromoCode.max_uses.is_(None), PromoCode.current_uses < PromoCode.max_uses))
+        .where(or_(PromoCode.valid_from.is_(None), PromoCode.valid_from <= now))
+        .where(or_(PromoCode.valid_until.is_(None), PromoCode.valid_until >= now))
+        .values(current_uses=PromoCode.current_uses + 1)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+# ==================== РАСЧЕТ ====================
+
+async def calculate_quote(
+    session: AsyncSession,
+    lines: Iterable[Tuple[float, float]],
+    delivery_type: str,
+    promo_code: Optional[str] = None
+) -> Quote:
+    """Рассчитать сумму заказа
+    
+    lines - пары (количество, цена за единицу) из корзины.
+    Ничего не пишет в базу; проблемы собираются в Quote.errors
+    в том же порядке, в каком их проверяет оформление заказа.
+    """
+    pricing = await get_pricing_settings(session)
+    
+    subtotal = sum(quantity * price for quantity, price in lines)
+    quote = Quote(
+        subtotal=subtotal,
+        min_order_amount=pricing.min_order_amount,
+        free_delivery_from=pricing.free_delivery_from
+    )
+    
+    # Проверяем минимальную сумму заказа
+    if subtotal <= 0:
+        quote.errors.append("Корзина пуста")
+    elif not check_min_order_amount(subtotal, pricing.min_order_amount):
+        quote.errors.append(f"Минимальная сумма заказа: {pricing.min_order_amount} ₽")
+    
+    # Проверяем промокод
+    if promo_code:
+        promo = await get_active_promo(session, promo_code)
+        
+        if promo:
+            now = datetime.utcnow()
+            promo_error = None
+            
+            if promo.valid_from and promo.valid_from > now:
+                promo_error = "Промокод еще не действует"
+            elif promo.valid_until and promo.valid_until < now:
+                promo_error = "Срок действия промокода истек"
+            elif promo.min_order_amount and subtotal < promo.min_order_amount:
+                promo_error = f"Минимальная сумма для промокода: {promo.min_order_amount} ₽"
+            elif promo.max_uses and promo.current_uses >= promo.max_uses:
+                promo_error = "Промокод исчерпан"
+            
+            if promo_error:
+                quote.errors.append(promo_error)
+            else:
+                # Рассчитываем скидку
+                if promo.discount_percent:
+                    quote.discount_amount = subtotal * (promo.discount_percent / 100)
+                elif promo.discount_fixed:
+                    quote.discount_amount = min(promo.discount_fixed, subtotal)
+                
+                quote.promo_code_id = promo.id
+    
+    # Рассчитываем стоимость доставки
+    if delivery_type == "delivery":
+        if not check_free_delivery(subtotal, pricing.free_delivery_from):
+            quote.delivery_cost = pricing.delivery_cost
+    
+    # Итоговая сумма
+    quote.total = subtotal + quote.delivery_cost - quote.discount_amount
+    
+    return quote
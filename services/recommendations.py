@@ -0,0 +1,280 @@
+"""Рекомендации "часто покупают вместе" по совместным покупкам
+
+Индекс живет в памяти процесса API: для каждого товара - число заказов
+с ним, для каждой пары товаров - число заказов, где они встретились
+вместе (разреженные словари, только реально встречавшиеся пары).
+Новые заказы учитываются инкрементально: фоновая задача дочитывает
+позиции заказов с id больше водяного знака - сразу после оформления
+(wake_recommendations) или раз в RECOMMENDATIONS_POLL_INTERVAL.
+
+Раз в RECOMMENDATIONS_CHECKPOINT_INTERVAL измененные счетчики
+сохраняются в product_pair_counts вместе с водяным знаком. После
+перезапуска индекс поднимается из контрольной точки и дочитывает только
+хвост заказов; с нуля он строится один раз, по рабочим и архивным.
+
+Сопутствующие товары ранжируются по lift:
+    lift(a, b) = N * n(a, b) / (n(a) * n(b))
+- во сколько раз чаще b берут вместе с a, чем в среднем по заказам.
+Пары реже RECOMMENDATIONS_MIN_PAIR_ORDERS заказов отбрасываются: на
+единичных совпадениях lift случаен. Заказ учитывается при оформлении,
+отмена его не вычитает - товары все равно выбрали вместе.
+
+Выборка рекомендаций читает только память.
+"""
+import asyncio
+import heapq
+import logging
+import time
+from typing import AsyncIterator, Dict, Iterable, List, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from database.database import async_session_maker
+from database.models import (
+    OrderItem, ArchivedOrderItem, Product, ProductPairCount, RecommendationState
+)
+from shared.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Строк в одной порции при чтении позиций и контрольной точки
+LOAD_CHUNK_SIZE = 10000
+
+# Единственная строка recommendation_state
+STATE_ID = 1
+
+# Кандидатов на одну выдачу - с запасом на снятые с продажи товары
+CANDIDATES_FACTOR = 2
+
+
+class CoOccurrenceIndex:
+    """Разреженные счетчики совместных покупок и выборка сопутствующих товаров"""
+    
+    def __init__(self):
+        self.orders_count = 0
+        self.product_counts: Dict[int, int] = {}
+        self.pair_counts: Dict[int, Dict[int, int]] = {}  # Обе стороны пары
+        self.watermark = 0  # Последний учтенный id заказа
+        self.loaded = False
+        self._dirty: Set[Tuple[int, int]] = set()  # Пары, измененные после контрольной точки
+    
+    def _add_pair(self, product_id: int, related_id: int, count: int):
+        pairs = self.pair_counts.setdefault(product_id, {})
+        pairs[related_id] = pairs.get(related_id, 0) + count
+        pairs = self.pair_counts.setdefault(related_id, {})
+        pairs[product_id] = pairs.get(product_id, 0) + count
+    
+    def add_order(self, product_ids: Iterable[int]):
+        """Учесть один заказ"""
+        products = sorted(set(product_ids))
+        if not products:
+            return
+        
+        self.orders_count += 1
+        for index, product_id in enumerate(products):
+            self.product_counts[product_id] = self.product_counts.get(product_id, 0) + 1
+            self._dirty.add((product_id, product_id))
+            for related_id in products[index + 1:]:
+                self._add_pair(product_id, related_id, 1)
+                self._dirty.add((product_id, related_id))
+    
+    def _scores(self, product_id: int) -> Dict[int, float]:
+        """lift сопутствующих товаров с достаточным числом совместных заказов"""
+        count = self.product_counts.get(product_id)
+        if not count:
+            return {}
+        
+        scale = self.orders_count / count
+        min_orders = settings.RECOMMENDATIONS_MIN_PAIR_ORDERS
+        return {
+            related_id: scale * together / self.product_counts[related_id]
+            for related_id, together in self.pair_counts.get(product_id, {}).items()
+            if together >= min_orders
+        }
+    
+    def related(self, product_id: int, limit: int = 10) -> List[Tuple[int, float]]:
+        """Сопутствующие товары: [(id товара, lift)] по убыванию lift"""
+        return heapq.nlargest(limit, self._scores(product_id).items(), key=lambda item: item[1])
+    
+    def suggestions(self, product_ids: Iterable[int], limit: int = 10) -> List[Tuple[int, float]]:
+        """Дополнения к набору товаров: сумма lift по всем товарам набора"""
+        basket = set(product_ids)
+        totals: Dict[int, float] = {}
+        for product_id in basket:
+            for related_id, score in self._scores(product_id).items():
+                if related_id not in basket:
+                    totals[related_id] = totals.get(related_id, 0) + score
+        return heapq.nlargest(limit, totals.items(), key=lambda item: item[1])
+    
+    async def _read_orders(
+        self, session: AsyncSession, item_model, after_id: int
+    ) -> AsyncIterator[Tuple[int, List[int]]]:
+        """Заказы с id > after_id по возрастанию id: (id заказа, товары)"""
+        result = await session.stream(
+            select(item_model.order_id, item_model.product_id)
+            .where(item_model.order_id > after_id)
+            .order_by(item_model.order_id)
+            .execution_options(yield_per=LOAD_CHUNK_SIZE)
+        )
+        
+        last_id = None
+        products: List[int] = []
+        async for partition in result.partitions():
+            for order_id, product_id in partition:
+                if order_id != last_id and products:
+                    yield last_id, products
+                    products = []
+                last_id = order_id
+                products.append(product_id)
+        if products:
+            yield last_id, products
+    
+    async def _load_checkpoint(self, session: AsyncSession) -> bool:
+        """Поднять счетчики из контрольной точки; False - ее еще нет"""
+        state = await session.get(RecommendationState, STATE_ID)
+        if state is None:
+            return False
+        
+        result = await session.stream(
+            select(ProductPairCount.product_id, ProductPairCount.related_id, ProductPairCount.orders_count)
+            .execution_options(yield_per=LOAD_CHUNK_SIZE)
+        )
+        async for partition in result.partitions():
+            for product_id, related_id, count in partition:
+                if product_id == related_id:
+                    self.product_counts[product_id] = count
+                else:
+                    self._add_pair(product_id, related_id, count)
+        
+        self.orders_count = state.orders_count
+        self.watermark = state.last_order_id
+        return True
+    
+    async def _build(self, session: AsyncSession):
+        """Первый запуск: вся история, архивные и рабочие заказы"""
+        for item_model in (ArchivedOrderItem, OrderItem):
+            async for order_id, products in self._read_orders(session, item_model, 0):
+                self.add_order(products)
+                self.watermark = max(self.watermark, order_id)
+    
+    async def sync(self, session: AsyncSession):
+        """Поднять индекс при первом вызове и дочитать новые заказы"""
+        if not self.loaded:
+            try:
+                if not await self._load_checkpoint(session):
+                    await self._build(session)
+            except Exception:
+                # Частично поднятый индекс не годится - при повторе начинаем заново
+                self.__init__()
+                raise
+            self.loaded = True
+        
+        # Хвост читается целиком до применения: обрыв чтения не учтет заказ дважды
+        orders = [order async for order in self._read_orders(session, OrderItem, self.watermark)]
+        for order_id, products in orders:
+            self.add_order(products)
+            self.watermark = order_id
+    
+    async def checkpoint(self, session: AsyncSession) -> int:
+        """Сохранить измененные счетчики и водяной знак одной транзакцией"""
+        if not self.loaded:
+            return 0
+        
+        dirty, self._dirty = self._dirty, set()
+        rows = [
+            {
+                "product_id": product_id,
+                "related_id": related_id,
+                "orders_count": (
+                    self.product_counts[product_id] if product_id == related_id
+                    else self.pair_counts[product_id][related_id]
+                )
+            }
+            for product_id, related_id in dirty
+        ]
+        
+        try:
+            upsert = sqlite_insert(ProductPairCount)
+            upsert = upsert.on_conflict_do_update(
+                index_elements=["product_id", "related_id"],
+                set_={"orders_count": upsert.excluded.orders_count}
+            )
+            for i in range(0, len(rows), LOAD_CHUNK_SIZE):
+                await session.execute(upsert, rows[i:i + LOAD_CHUNK_SIZE])
+            
+            state = sqlite_insert(RecommendationState).values(
+                id=STATE_ID,
+                last_order_id=self.watermark,
+                orders_count=self.orders_count
+            )
+            await session.execute(
+                state.on_conflict_do_update(
+                    index_elements=["id"],
+                    set_={
+                        "last_order_id": state.excluded.last_order_id,
+                        "orders_count": state.excluded.orders_count,
+                        "updated_at": state.excluded.updated_at
+                    }
+                )
+            )
+            await session.commit()
+        except Exception:
+            # Не сохранилось - пары останутся в следующей контрольной точке
+            self._dirty |= dirty
+            raise
+        
+        return len(rows)
+
+
+# Индекс процесса API
+index = CoOccurrenceIndex()
+
+_wakeup = asyncio.Event()
+
+
+def wake_recommendations():
+    """Сообщить фоновой задаче, что оформлен новый заказ"""
+    _wakeup.set()
+
+
+async def recommended_products(session: AsyncSession, ranked: List[Tuple[int, float]], limit: int) -> List[Product]:
+    """Карточки товаров в порядке рекомендаций (только активные и в наличии)"""
+    product_ids = [product_id for product_id, _ in ranked]
+    if not product_ids:
+        return []
+    
+    result = await session.execute(
+        select(Product)
+        .options(selectinload(Product.images))
+        .where(Product.id.in_(product_ids))
+        .where(Product.is_active == True)
+        .where(Product.is_available == True)
+    )
+    products = {product.id: product for product in result.scalars().all()}
+    return [products[product_id] for product_id in product_ids if product_id in products][:limit]
+
+
+async def recommendations_loop():
+    """Фоновое обновление индекса и контрольные точки"""
+    checkpoint_at = 0.0
+    
+    while True:
+        _wakeup.clear()
+        
+        try:
+            async with async_session_maker() as session:
+                await index.sync(session)
+                if time.monotonic() - checkpoint_at >= settings.RECOMMENDATIONS_CHECKPOINT_INTERVAL:
+                    await index.checkpoint(session)
+                    checkpoint_at = time.monotonic()
+        except Exception:
+            logger.exception("Ошибка обновления рекомендаций")
+        
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=settings.RECOMMENDATIONS_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
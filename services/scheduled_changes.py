@@ -0,0 +1,264 @@
+"""Отложенные изменения товаров: цены, скидки, бейдж, наличие
+
+Изменение - (товар или категория, поле, новое значение, момент).
+Фоновая задача спит до ближайшего момента и применяет все наступившие
+изменения сразу: изменения одной границы с одинаковыми полем и
+значением сливаются в один UPDATE по списку товаров или категорий.
+Если поле одной цели в один момент меняется несколько раз, действует
+последнее из изменений.
+updated_at у всех затронутых товаров - одна метка на проход.
+
+Порядок: по моменту, внутри одного момента сначала категории, затем
+отдельные товары - так изменение товара перекрывает изменение его
+категории. preview_changes показывает состояние товаров на любой момент
+в будущем по тем же правилам, ничего не меняя.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, asdict, field as dataclass_field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, update, func, or_, false
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.database import async_session_maker
+from database.models import Product, ScheduledProductChange, BadgeType
+from services.catalog_bulk import PRICE_COLUMNS
+from services.maintenance import MaintenanceReport, refresh_cart_prices
+from services.order_events import publish_catalog_changed
+from shared.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Поля, которые можно менять по расписанию, и тип значения
+FIELD_TYPES = {
+    **{name: float for name in PRICE_COLUMNS},
+    "old_price": float,
+    "discount_percent": float,
+    "discount_fixed": float,
+    "badge": str,
+    "is_available": bool,
+    "is_active": bool,
+}
+
+# Поля, которые нельзя сбросить в null
+NOT_NULL_FIELDS = ("is_available", "is_active")
+
+
+@dataclass
+class ScheduleReport:
+    """Итоги применения отложенных изменений"""
+    changes_applied: int = 0
+    products_updated: int = 0
+    fields: List[str] = dataclass_field(default_factory=list)
+    
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def to_utc(moment: datetime) -> datetime:
+    """Момент с часовым поясом -> наивное UTC, как в остальных таблицах"""
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def parse_value(name: str, value):
+    """Проверить значение для поля; ValueError - с текстом для ответа API"""
+    if name not in FIELD_TYPES:
+        raise ValueError(f"Поле нельзя менять по расписанию: {name}")
+    
+    if value is None:
+        if name in NOT_NULL_FIELDS:
+            raise ValueError(f"Поле {name} не может быть пустым")
+        return None
+    
+    expected = FIELD_TYPES[name]
+    if expected is bool:
+        if not isinstance(value, bool):
+            raise ValueError(f"Поле {name} ожидает true или false")
+        return value
+    
+    if expected is float:
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"Поле {name} ожидает число")
+        if name in PRICE_COLUMNS and value <= 0:
+            raise ValueError(f"Цена {name} должна быть больше нуля")
+        if value < 0:
+            raise ValueError(f"Поле {name} не может быть отрицательным")
+        return float(value)
+    
+    if value not in {badge.value for badge in BadgeType}:
+        raise ValueError("Неизвестный бейдж")
+    return value
+
+
+def _order_key(change: ScheduledProductChange):
+    """Порядок применения: момент, категории раньше товаров, очередность создания"""
+    return change.effective_at, change.product_id is not None, change.id
+
+
+def schedule_changes(
+    session: AsyncSession,
+    effective_at: datetime,
+    changes: Dict[str, object],
+    product_ids: Optional[List[int]] = None,
+    category_id: Optional[int] = None
+) -> int:
+    """Запланировать поля changes для товаров или категории (коммит - на вызывающем)"""
+    targets = (
+        [{"product_id": product_id} for product_id in product_ids]
+        if product_ids else [{"category_id": category_id}]
+    )
+    rows = [
+        ScheduledProductChange(field=name, value=value, effective_at=to_utc(effective_at), **target)
+        for target in targets
+        for name, value in changes.items()
+    ]
+    session.add_all(rows)
+    return len(rows)
+
+
+async def pending_changes(session: AsyncSession, until: Optional[datetime] = None) -> List[ScheduledProductChange]:
+    """Непримененные изменения (до момента until включительно) в порядке применения"""
+    query = select(ScheduledProductChange).where(ScheduledProductChange.applied_at.is_(None))
+    if until is not None:
+        query = query.where(ScheduledProductChange.effective_at <= until)
+    
+    result = await session.execute(query)
+    return sorted(result.scalars().all(), key=_order_key)
+
+
+async def next_boundary(session: AsyncSession) -> Optional[datetime]:
+    """Ближайший момент, на который запланированы изменения"""
+    return await session.scalar(
+        select(func.min(ScheduledProductChange.effective_at))
+        .where(ScheduledProductChange.applied_at.is_(None))
+    )
+
+
+async def apply_due_changes(session: AsyncSession, now: Optional[datetime] = None) -> ScheduleReport:
+    """Применить наступившие изменения сгруппированными UPDATE одной транзакцией"""
+    report = ScheduleReport()
+    changes = await pending_changes(session, now or datetime.utcnow())
+    if not changes:
+        return report
+    
+    # В пределах момента и уровня (категории или товары) действует последнее изменение
+    # поля цели - как в preview_changes. После этого группы одного уровня не пересекаются
+    latest: Dict[tuple, ScheduledProductChange] = {}
+    for change in changes:
+        is_product = change.product_id is not None
+        target_id = change.product_id if is_product else change.category_id
+        latest[(change.effective_at, is_product, target_id, change.field)] = change
+    
+    # (момент, товар ли, поле, значение) -> id товаров или категорий; порядок групп - порядок применения
+    groups: Dict[tuple, List[int]] = {}
+    for (effective_at, is_product, target_id, name), change in latest.items():
+        groups.setdefault((effective_at, is_product, name, change.value), []).append(target_id)
+    
+    stamp = datetime.utcnow()
+    for (_, is_product, name, value), target_ids in groups.items():
+        target = Product.id.in_(target_ids) if is_product else Product.category_id.in_(target_ids)
+        result = await session.execute(
+            update(Product)
+            .where(target)
+            .values({name: value, "updated_at": stamp})
+            .execution_options(synchronize_session=False)
+        )
+        report.products_updated += result.rowcount
+    
+    await session.execute(
+        update(ScheduledProductChange)
+        .where(ScheduledProductChange.id.in_([change.id for change in changes]))
+        .values(applied_at=stamp)
+    )
+    await session.commit()
+    
+    report.changes_applied = len(changes)
+    report.fields = sorted({change.field for change in changes})
+    
+    # Корзины хранят цену за единицу - подтягиваем новые цены сразу
+    if set(report.fields) & set(PRICE_COLUMNS):
+        await refresh_cart_prices(session, MaintenanceReport())
+    
+    publish_catalog_changed({"fields": report.fields, "products_count": report.products_updated})
+    logger.info("Отложенные изменения товаров: %s", report.as_dict())
+    return report
+
+
+async def preview_changes(session: AsyncSession, at: datetime) -> List[dict]:
+    """Товары, которые изменятся к моменту at: значения сейчас и тогда"""
+    changes = await pending_changes(session, to_utc(at))
+    if not changes:
+        return []
+    
+    product_ids = {change.product_id for change in changes if change.product_id is not None}
+    category_ids = {change.category_id for change in changes if change.product_id is None}
+    names = sorted({change.field for change in changes})
+    
+    result = await session.execute(
+        select(Product.id, Product.name, Product.category_id, *(Product.__table__.c[name] for name in names))
+        .where(or_(
+            Product.id.in_(product_ids) if product_ids else false(),
+            Product.category_id.in_(category_ids) if category_ids else false()
+        ))
+        .order_by(Product.id)
+    )
+    products = {row.id: row for row in result.all()}
+    
+    upcoming: Dict[int, Dict[str, object]] = {product_id: {} for product_id in products}
+    for change in changes:
+        if change.product_id is not None:
+            targets = [change.product_id] if change.product_id in products else []
+        else:
+            targets = [
+                product_id for product_id, row in products.items()
+                if row.category_id == change.category_id
+            ]
+        for product_id in targets:
+            upcoming[product_id][change.field] = change.value
+    
+    return [
+        {
+            "product_id": product_id,
+            "name": row.name,
+            "changes": {
+                name: {"current": getattr(row, name), "upcoming": value}
+                for name, value in upcoming[product_id].items()
+            }
+        }
+        for product_id, row in products.items()
+        if upcoming[product_id]
+    ]
+
+
+_wakeup = asyncio.Event()
+
+
+def wake_scheduled_changes():
+    """Сообщить планировщику, что расписание изменилось"""
+    _wakeup.set()
+
+
+async def scheduled_changes_loop():
+    """Применять изменения в момент их наступления"""
+    while True:
+        _wakeup.clear()
+        delay = settings.SCHEDULED_CHANGES_POLL_INTERVAL
+        
+        try:
+            async with async_session_maker() as session:
+                await apply_due_changes(session)
+                boundary = await next_boundary(session)
+            if boundary is not None:
+                delay = min(delay, max((boundary - datetime.utcnow()).total_seconds(), 0))
+        except Exception:
+            logger.exception("Ошибка применения отложенных изменений")
+        
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,244 @@
+"""Сводная статистика заказов: по дням и по покупателям
+
+Таблица orders_daily_stats хранит число заказов и выручку по паре
+(день создания, статус). Она обновляется в той же транзакции, что
+и сам заказ: создание добавляет заказ к (день, new), смена статуса
+переносит его из старого статуса в новый. Поэтому отчеты читают
+десятки строк сводки, а не всю историю заказов.
+
+Таблица customer_stats - итоги каждого покупателя по неотмененным
+заказам: число заказов, сумма, первый и последний заказ. Обновляется
+там же; отмена вычитает заказ, снятие отмены возвращает.
+
+rebuild_daily_stats и rebuild_customer_stats пересчитывают таблицы
+с нуля по рабочим и архивным заказам - после ручных правок в БД
+или при первом запуске.
+"""
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import select, delete, insert, update, func, union_all, case
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.database import async_session_maker
+from database.models import Order, ArchivedOrder, OrderDailyStats, CustomerStats, OrderStatus, User
+
+
+CANCELLED = OrderStatus.CANCELLED.value
+
+
+async def _apply(session: AsyncSession, rows: list):
+    """Прибавить к сводке строки (day, status, orders_count, revenue) одним upsert"""
+    insert_stmt = sqlite_insert(OrderDailyStats).values(rows)
+    await session.execute(
+        insert_stmt.on_conflict_do_update(
+            index_elements=["day", "status"],
+            set_={
+                "orders_count": OrderDailyStats.orders_count + insert_stmt.excluded.orders_count,
+                "revenue": OrderDailyStats.revenue + insert_stmt.excluded.revenue
+            }
+        )
+    )
+
+
+async def _add_customer_order(session: AsyncSession, order: Order):
+    """Прибавить заказ к итогам покупателя"""
+    insert_stmt = sqlite_insert(CustomerStats).values(
+        user_id=order.user_id,
+        orders_count=1,
+        total_spent=order.total,
+        first_order_at=order.created_at,
+        last_order_at=order.created_at
+    )
+    excluded = insert_stmt.excluded
+    await session.execute(
+        insert_stmt.on_conflict_do_update(
+            index_elements=["user_id"],
+            set_={
+                "orders_count": CustomerStats.orders_count + 1,
+                "total_spent": CustomerStats.total_spent + excluded.total_spent,
+                # min/max от NULL - NULL, поэтому coalesce
+                "first_order_at": func.coalesce(
+                    func.min(CustomerStats.first_order_at, excluded.first_order_at), excluded.first_order_at
+                ),
+                "last_order_at": func.coalesce(
+                    func.max(CustomerStats.last_order_at, excluded.last_order_at), excluded.last_order_at
+                ),
+            }
+        )
+    )
+
+
+async def _remove_customer_order(session: AsyncSession, order: Order):
+    """Вычесть заказ из итогов покупателя (отмена)"""
+    # Даты первого и последнего заказа - по оставшимся заказам покупателя
+    remaining = union_all(
+        select(Order.created_at)
+        .where(Order.user_id == order.user_id)
+        .where(Order.status != CANCELLED)
+        .where(Order.id != order.id),
+        select(ArchivedOrder.created_at)
+        .where(ArchivedOrder.user_id == order.user_id)
+        .where(ArchivedOrder.status != CANCELLED)
+    ).subquery()
+    
+    await session.execute(
+        update(CustomerStats)
+        .where(CustomerStats.user_id == order.user_id)
+        .values(
+            orders_count=CustomerStats.orders_count - 1,
+            total_spent=CustomerStats.total_spent - order.total,
+            first_order_at=select(func.min(remaining.c.created_at)).scalar_subquery(),
+            last_order_at=select(func.max(remaining.c.created_at)).scalar_subquery()
+        )
+    )
+
+
+async def record_order_created(session: AsyncSession, order: Order):
+    """Учесть новый заказ (в транзакции заказа)"""
+    await _apply(session, [{
+        "day": order.created_at.date(),
+        "status": order.status,
+        "orders_count": 1,
+        "revenue": order.total
+    }])
+    await _add_customer_order(session, order)
+
+
+async def record_status_change(session: AsyncSession, order: Order, new_status: str):
+    """Перенести заказ из текущего статуса в new_status (до присвоения order.status)"""
+    day = order.created_at.date()
+    await _apply(session, [
+        {"day": day, "status": order.status, "orders_count": -1, "revenue": -order.total},
+        {"day": day, "status": new_status, "orders_count": 1, "revenue": order.total},
+    ])
+    
+    if new_status == CANCELLED and order.status != CANCELLED:
+        await _remove_customer_order(session, order)
+    elif order.status == CANCELLED and new_status != CANCELLED:
+        await _add_customer_order(session, order)
+
+
+async def rebuild_daily_stats(session: AsyncSession) -> int:
+    """Пересчитать сводку по всем заказам (рабочим и архивным), вернуть число строк"""
+    orders = union_all(
+        select(Order.created_at, Order.status, Order.total),
+        select(ArchivedOrder.created_at, ArchivedOrder.status, ArchivedOrder.total)
+    ).subquery()
+    day = func.date(orders.c.created_at)
+    
+    await session.execute(delete(OrderDailyStats))
+    result = await session.execute(
+        insert(OrderDailyStats).from_select(
+            ["day", "status", "orders_count", "revenue"],
+            select(day, orders.c.status, func.count(), func.sum(orders.c.total))
+            .group_by(day, orders.c.status)
+        )
+    )
+    await session.commit()
+    return result.rowcount
+
+
+async def rebuild_customer_stats(session: AsyncSession) -> int:
+    """Пересчитать итоги покупателей по всем заказам, вернуть число покупателей"""
+    orders = union_all(
+        select(Order.user_id, Order.total, Order.created_at).where(Order.status != CANCELLED),
+        select(ArchivedOrder.user_id, ArchivedOrder.total, ArchivedOrder.created_at)
+        .where(ArchivedOrder.status != CANCELLED)
+    ).subquery()
+    
+    await session.execute(delete(CustomerStats))
+    result = await session.execute(
+        insert(CustomerStats).from_select(
+            ["user_id", "orders_count", "total_spent", "first_order_at", "last_order_at"],
+            select(
+                orders.c.user_id,
+                func.count(),
+                func.sum(orders.c.total),
+                func.min(orders.c.created_at),
+                func.max(orders.c.created_at)
+            )
+            .group_by(orders.c.user_id)
+        )
+    )
+    await session.commit()
+    return result.rowcount
+
+
+async def ensure_daily_stats():
+    """При первом запуске на существующей базе - построить сводки"""
+    async with async_session_maker() as session:
+        has_orders = await session.scalar(select(Order.id).limit(1))
+        if has_orders is None:
+            return
+        
+        if await session.scalar(select(OrderDailyStats.day).limit(1)) is None:
+            await rebuild_daily_stats(session)
+        if await session.scalar(select(CustomerStats.user_id).limit(1)) is None:
+            await rebuild_customer_stats(session)
+
+
+async def sales_totals(
+    session: AsyncSession,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None
+) -> tuple:
+    """(заказов, выручка) без отмененных за период по дням включительно"""
+    query = (
+        select(func.sum(OrderDailyStats.orders_count), func.sum(OrderDailyStats.revenue))
+        .where(OrderDailyStats.status != CANCELLED)
+    )
+    if date_from:
+        query = query.where(OrderDailyStats.day >= date_from)
+    if date_to:
+        query = query.where(OrderDailyStats.day <= date_to)
+    
+    orders_count, revenue = (await session.execute(query)).one()
+    return orders_count or 0, float(revenue or 0)
+
+
+@dataclass
+class DashboardStats:
+    """Цифры для сводки администратора в боте"""
+    today_count: int
+    today_sum: float
+    yesterday_count: int
+    yesterday_sum: float
+    month_count: int
+    month_sum: float
+    total_users: int
+    new_orders: int
+
+
+async def dashboard_stats(session: AsyncSession, today: Optional[date] = None) -> DashboardStats:
+    """Сегодня, вчера, текущий месяц и новые заказы - одним запросом по сводке"""
+    today = today or datetime.utcnow().date()
+    yesterday = today - timedelta(days=1)
+    month_start = today.replace(day=1)
+    stats = OrderDailyStats
+    
+    def period(condition, column):
+        return func.coalesce(
+            func.sum(case((condition & (stats.status != CANCELLED), column), else_=0)),
+            0
+        )
+    
+    result = await session.execute(
+        select(
+            period(stats.day == today, stats.orders_count),
+            period(stats.day == today, stats.revenue),
+            period(stats.day == yesterday, stats.orders_count),
+            period(stats.day == yesterday, stats.revenue),
+            period(stats.day >= month_start, stats.orders_count),
+            period(stats.day >= month_start, stats.revenue),
+            select(func.count(User.id)).scalar_subquery(),
+            func.coalesce(
+                func.sum(case((stats.status == OrderStatus.NEW.value, stats.orders_count), else_=0)),
+                0
+            )
+        )
+        .select_from(stats)
+    )
+    return DashboardStats(*result.one())
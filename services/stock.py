@@ -0,0 +1,153 @@
+"""Остатки товаров и резервирование при оформлении заказа
+
+Остаток ведется по паре (товар, единица измерения) в таблице
+product_stock; если строки нет, товар не ограничен.
+
+Резерв - условное списание одним пакетным UPDATE на все позиции:
+UPDATE ... SET quantity = quantity - :qty WHERE ... AND quantity >= :qty.
+Если обновилось меньше строк, чем позиций, какого-то товара не хватило,
+и транзакция заказа откатывается целиком. Блокировок строк и чтения
+остатков перед записью нет.
+
+Сколько списано по позиции, запоминается в order_items.stock_reserved.
+Отмена заказа возвращает ровно это, возврат из отмены снова списывает
+то же: позиции, оформленные до появления остатка, склад не трогают.
+
+is_available отслеживаемых товаров следует за остатком: товар
+недоступен, когда ни по одной единице не осталось ничего.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, update, delete, exists, and_, func, bindparam
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Product, ProductStock, OrderItem
+
+
+# (product_id, unit, quantity)
+StockLine = Tuple[int, str, float]
+
+_stock = ProductStock.__table__
+
+_reserve_stmt = (
+    update(_stock)
+    .where(_stock.c.product_id == bindparam("b_product_id"))
+    .where(_stock.c.unit == bindparam("b_unit"))
+    .where(_stock.c.quantity >= bindparam("b_quantity"))
+    .values(quantity=_stock.c.quantity - bindparam("b_quantity"))
+)
+
+_release_stmt = (
+    update(_stock)
+    .where(_stock.c.product_id == bindparam("b_product_id"))
+    .where(_stock.c.unit == bindparam("b_unit"))
+    .values(quantity=_stock.c.quantity + bindparam("b_quantity"))
+)
+
+
+def _params(lines: Iterable[StockLine]) -> List[dict]:
+    return [
+        {"b_product_id": product_id, "b_unit": unit, "b_quantity": quantity}
+        for product_id, unit, quantity in lines
+    ]
+
+
+async def reserve_stock(session: AsyncSession, lines: List[StockLine]) -> bool:
+    """Списать остатки по всем позициям в текущей транзакции
+    
+    Передаются только позиции с отслеживаемым остатком. False - чего-то
+    не хватило; вызывающий должен откатить транзакцию.
+    """
+    if not lines:
+        return True
+    
+    result = await session.execute(_reserve_stmt, _params(lines))
+    if result.rowcount != len(lines):
+        return False
+    
+    await sync_availability(session, {product_id for product_id, _, _ in lines})
+    return True
+
+
+async def release_stock(session: AsyncSession, order_id: int):
+    """Вернуть на склад то, что заказ списал при оформлении (отмена)"""
+    lines = await order_stock_lines(session, order_id)
+    if not lines:
+        return
+    
+    await session.execute(_release_stmt, _params(lines))
+    await sync_availability(session, {product_id for product_id, _, _ in lines})
+
+
+async def order_stock_lines(session: AsyncSession, order_id: int) -> List[StockLine]:
+    """Списанное заказом со склада по (товар, единица), остаток которых ведется сейчас"""
+    result = await session.execute(
+        select(OrderItem.product_id, OrderItem.unit, func.sum(OrderItem.stock_reserved))
+        .join(
+            ProductStock,
+            and_(
+                ProductStock.product_id == OrderItem.product_id,
+                ProductStock.unit == OrderItem.unit
+            )
+        )
+        .where(OrderItem.order_id == order_id)
+        .where(OrderItem.stock_reserved > 0)
+        .group_by(OrderItem.product_id, OrderItem.unit)
+    )
+    return [tuple(row) for row in result.all()]
+
+
+async def sync_availability(session: AsyncSession, product_ids: Iterable[int]):
+    """Выставить is_available отслеживаемых товаров по остаткам одним UPDATE"""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    
+    tracked = exists().where(ProductStock.product_id == Product.id)
+    in_stock = exists().where(ProductStock.product_id == Product.id).where(ProductStock.quantity > 0)
+    
+    await session.execute(
+        update(Product)
+        .where(Product.id.in_(product_ids))
+        .where(tracked)
+        .values(is_available=in_stock)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def get_stock(session: AsyncSession, product_id: int) -> Dict[str, float]:
+    """Остатки товара по единицам"""
+    result = await session.execute(
+        select(ProductStock.unit, ProductStock.quantity)
+        .where(ProductStock.product_id == product_id)
+    )
+    return dict(result.all())
+
+
+async def set_stock(session: AsyncSession, product_id: int, stock: Dict[str, Optional[float]]):
+    """Задать остатки товара; None для единицы - перестать вести остаток"""
+    untracked = [unit for unit, quantity in stock.items() if quantity is None]
+    tracked = {unit: quantity for unit, quantity in stock.items() if quantity is not None}
+    
+    if untracked:
+        await session.execute(
+            delete(ProductStock)
+            .where(ProductStock.product_id == product_id)
+            .where(ProductStock.unit.in_(untracked))
+        )
+    
+    if tracked:
+        insert_stmt = sqlite_insert(ProductStock).values([
+            {"product_id": product_id, "unit": unit, "quantity": quantity}
+            for unit, quantity in tracked.items()
+        ])
+        await session.execute(
+            insert_stmt.on_conflict_do_update(
+                index_elements=["product_id", "unit"],
+                set_={"quantity": insert_stmt.excluded.quantity, "updated_at": datetime.utcnow()}
+            )
+        )
+    
+    await sync_availability(session, [product_id])
@@ -24,6 +24,59 @@ class Settings(BaseSettings):
     # Security
     SECRET_KEY: str = "your-secret-key-change-this"
     
+    # Кеш настроек и промокодов для расчета заказа (секунды)
+    PRICING_CACHE_TTL: int = 60
+    
+    # Обслуживание корзин
+    CART_TTL_DAYS: int = 30  # Через сколько дней корзина считается брошенной
+    CART_ARCHIVE: bool = False  # Переносить брошенные корзины в архив вместо удаления
+    MAINTENANCE_INTERVAL: int = 3600  # Период запуска, секунды
+    MAINTENANCE_BATCH_SIZE: int = 500  # Корзин или заказов в одной транзакции
+    
+    # Архив заказов: выполненные и отмененные заказы старше этого срока
+    # переносятся в archived_orders (0 - не архивировать)
+    ORDER_ARCHIVE_AFTER_DAYS: int = 90
+    
+    # Загрузка каталога из файла: товаров в одной транзакции
+    CATALOG_IMPORT_BATCH_SIZE: int = 500
+    
+    # Выгрузка заказов: строк в одной порции потока
+    ORDER_EXPORT_CHUNK_SIZE: int = 1000
+    
+    # Аналитика продаж
+    ANALYTICS_REFRESH_INTERVAL: int = 60  # Догружать новые заказы не чаще, секунды
+    ANALYTICS_UTC_OFFSET: int = 3  # Часовой пояс магазина для дней и часов, часы от UTC
+    
+    # Рекомендации "часто покупают вместе"
+    RECOMMENDATIONS_POLL_INTERVAL: int = 30  # Дочитывать новые заказы без сигнала, секунды
+    RECOMMENDATIONS_CHECKPOINT_INTERVAL: int = 300  # Сохранять счетчики в БД, секунды
+    RECOMMENDATIONS_MIN_PAIR_ORDERS: int = 2  # Минимум совместных заказов для рекомендации
+    
+    # Популярность товаров (sort=popular)
+    POPULARITY_HALF_LIFE_DAYS: float = 7  # За это время вес события падает вдвое
+    POPULARITY_ORDER_WEIGHT: float = 1.0  # Вес заказа с товаром
+    POPULARITY_CART_WEIGHT: float = 0.2  # Вес добавления в корзину
+    POPULARITY_SAVE_INTERVAL: int = 60  # Сохранять в БД, секунды
+    
+    # Отложенные изменения товаров: проверять новые расписания не реже, секунды
+    SCHEDULED_CHANGES_POLL_INTERVAL: int = 60
+    
+    # Сколько часов хранить ответы по Idempotency-Key
+    IDEMPOTENCY_TTL_HOURS: int = 24
+    
+    # Очередь исходящих событий (уведомления о заказах)
+    OUTBOX_POLL_INTERVAL: int = 5  # Период опроса очереди, секунды
+    OUTBOX_BATCH_SIZE: int = 50  # Событий за один проход
+    OUTBOX_MAX_ATTEMPTS: int = 8  # После стольких неудач событие помечается failed
+    OUTBOX_RETRY_DELAY: int = 10  # Первая пауза перед повтором, секунды (дальше удваивается)
+    OUTBOX_RETENTION_DAYS: int = 7  # Сколько хранить доставленные события
+    
+    # Живые события заказов (SSE)
+    ORDER_STREAM_HEARTBEAT: int = 15  # Пинг простаивающего соединения, секунды
+    ORDER_STREAM_QUEUE_SIZE: int = 100  # Очередь одного подписчика, событий
+    ORDER_STREAM_BACKLOG: int = 1000  # Событий в памяти для переподключения с Last-Event-ID
+    ORDER_STREAM_RETRY_MS: int = 3000  # Пауза браузера перед переподключением
+    
     # Payment
     PAYMENT_PROVIDER_TOKEN: Optional[str] = None
     
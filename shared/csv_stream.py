@@ -0,0 +1,25 @@
+"""Потоковая запись CSV для выгрузок, которые открывают в Excel
+
+Разделитель - точка с запятой: так делит колонки Excel с русской
+локалью. Первая порция начинается с BOM, иначе Excel читает UTF-8
+как cp1251 и портит кириллицу. Значения пишутся как есть -
+форматирование чисел остается за вызывающим.
+"""
+import csv
+import io
+from typing import Iterable
+
+
+BOM = "\ufeff"
+
+
+def csv_rows(rows: Iterable[Iterable]) -> str:
+    """Порция строк CSV"""
+    buffer = io.StringIO()
+    csv.writer(buffer, delimiter=";").writerows(rows)
+    return buffer.getvalue()
+
+
+def csv_header(columns: Iterable) -> str:
+    """Первая порция выгрузки: BOM и строка заголовков"""
+    return BOM + csv_rows([columns])
@@ -64,3 +64,14 @@ def is_time_in_interval(current_time: datetime, start_time: str, end_time: str)
     else:
         # Интервал через полночь
         return current >= start or current <= end
+
+
+def normalize_phone(phone: str) -> str:
+    """Телефон для поиска: только цифры, без кода страны (+7 / 8)
+    
+    "+7 (999) 123-45-67" и "8 999 123 45 67" -> "9991234567"
+    """
+    digits = "".join(char for char in phone if char.isdigit())
+    if len(digits) == 11 and digits[0] in "78":
+        digits = digits[1:]
+    return digits
@@ -0,0 +1,161 @@
+"""Проверка оформления заказов под параллельной нагрузкой
+
+Создает временную базу SQLite и одновременно отправляет N запросов
+POST /api/orders/create от разных покупателей на товар с ограниченным
+остатком и промокод с ограниченным числом использований. После каждого
+прогона проверяет, что промокод не использован сверх лимита и дважды,
+а товар не продан больше остатка.
+
+    python stress_checkout.py [покупателей]
+"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+from collections import Counter
+from pathlib import Path
+
+# Добавляем корневую директорию в PYTHONPATH
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+# Отдельная база, чтобы не трогать рабочую
+DB_DIR = tempfile.mkdtemp(prefix="stress_checkout_")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{DB_DIR}/stress.db"
+os.environ.setdefault("BOT_TOKEN", "stress")
+os.environ.setdefault("ADMIN_ID", "0")
+
+import logging
+
+import httpx
+from sqlalchemy import select, func
+
+from api.main import app
+from database.database import engine, async_session_maker, init_db
+from database.models import (
+    Category, Product, ProductStock, User, CartItem, PromoCode, PromoRedemption, Order, OrderItem
+)
+
+PRICE = 100.0
+QUANTITY = 2.0
+
+# Ожидаемые отказы; любой другой ответ - ошибка
+EXPECTED_REJECTS = {400, 409}
+
+
+async def prepare(customers: int, stock: float, promo_uses: int) -> tuple:
+    """Товар с остатком, промокод и покупатели с товаром в корзине"""
+    async with async_session_maker() as session:
+        category = Category(name="Stress")
+        session.add(category)
+        await session.flush()
+        
+        product = Product(category_id=category.id, name="Товар", price_kg=PRICE)
+        promo = PromoCode(code=f"STRESS{promo_uses}X{stock:g}", discount_fixed=10, max_uses=promo_uses)
+        session.add_all([product, promo])
+        await session.flush()
+        session.add(ProductStock(product_id=product.id, unit="kg", quantity=stock))
+        
+        base_id = await session.scalar(select(func.coalesce(func.max(User.telegram_id), 0)))
+        users = [User(telegram_id=base_id + i + 1, first_name="stress") for i in range(customers)]
+        session.add_all(users)
+        await session.flush()
+        session.add_all(
+            CartItem(user_id=user.id, product_id=product.id, quantity=QUANTITY, unit="kg", price_per_unit=PRICE)
+            for user in users
+        )
+        await session.commit()
+        return product.id, promo, [user.telegram_id for user in users]
+
+
+async def storm(client: httpx.AsyncClient, customers: int, stock: float, promo_uses: int) -> list:
+    """Один прогон; вернуть список нарушений"""
+    product_id, promo, telegram_ids = await prepare(customers, stock, promo_uses)
+    body = {
+        "customer_name": "stress",
+        "customer_phone": "+70000000000",
+        "delivery_type": "pickup",
+        "payment_type": "cash",
+        "promo_code": promo.code,
+    }
+    
+    responses = await asyncio.gather(*(
+        client.post(f"/api/orders/create/{telegram_id}", json=body) for telegram_id in telegram_ids
+    ))
+    codes = Counter(response.status_code for response in responses)
+    print(f"  остаток {stock:g} кг, промокод на {promo_uses}: ответы {dict(sorted(codes.items()))}")
+    
+    problems = []
+    unexpected = [r for r in responses if r.status_code != 200 and r.status_code not in EXPECTED_REJECTS]
+    if unexpected:
+        problems.append(f"неожиданные ответы: {[(r.status_code, r.text) for r in unexpected[:3]]}")
+    
+    async with async_session_maker() as session:
+        current_uses = await session.scalar(select(PromoCode.current_uses).where(PromoCode.id == promo.id))
+        redemptions = await session.scalar(
+            select(func.count()).select_from(PromoRedemption).where(PromoRedemption.promo_code_id == promo.id)
+        )
+        redeemed_orders = await session.scalar(
+            select(func.count(func.distinct(PromoRedemption.order_id)))
+            .where(PromoRedemption.promo_code_id == promo.id)
+        )
+        promo_orders = await session.scalar(
+            select(func.count()).select_from(Order).where(Order.promo_code_id == promo.id)
+        )
+        left = await session.scalar(
+            select(ProductStock.quantity).where(ProductStock.product_id == product_id, ProductStock.unit == "kg")
+        )
+        sold = await session.scalar(
+            select(func.coalesce(func.sum(OrderItem.quantity), 0)).where(OrderItem.product_id == product_id)
+        )
+    
+    if current_uses > promo_uses:
+        problems.append(f"промокод использован {current_uses} раз при лимите {promo_uses}")
+    if not current_uses == redemptions == redeemed_orders == promo_orders:
+        problems.append(
+            f"промокод: счетчик {current_uses}, списаний {redemptions}, "
+            f"заказов в списаниях {redeemed_orders}, заказов с промокодом {promo_orders}"
+        )
+    if left < 0 or sold > stock:
+        problems.append(f"продано {sold:g} кг при остатке {stock:g}, осталось {left:g}")
+    if abs(sold + left - stock) > 1e-9:
+        problems.append(f"продано {sold:g} кг и осталось {left:g} - не сходится с остатком {stock:g}")
+    if codes[200] != promo_orders:
+        problems.append(f"успешных ответов {codes[200]}, заказов с промокодом {promo_orders}")
+    return problems
+
+
+async def main(customers: int):
+    await init_db()
+    
+    # Упирается в промокод, в остаток, в оба сразу
+    runs = (
+        (customers * QUANTITY, customers // 4),
+        (customers * QUANTITY // 3, customers),
+        (customers * QUANTITY // 2, customers // 2),
+    )
+    
+    problems = []
+    # Ошибка приложения - ответ 500, а не исключение: инварианты проверяются и тогда
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://stress") as client:
+        print(f"🧨 {customers} одновременных оформлений заказа")
+        for stock, promo_uses in runs:
+            problems += await storm(client, customers, stock, promo_uses)
+    
+    if problems:
+        print("❌ Нарушения:")
+        for problem in problems:
+            print(f"  - {problem}")
+        raise SystemExit(1)
+    print("✅ Промокоды не списаны сверх лимита, товар не продан сверх остатка")
+
+
+if __name__ == "__main__":
+    engine.echo = False
+    logging.disable(logging.CRITICAL)
+    try:
+        asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 50))
+    finally:
+        shutil.rmtree(DB_DIR, ignore_errors=True)